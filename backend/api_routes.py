@@ -1,15 +1,130 @@
 import os
+import base64
+import binascii
 import json
-from flask import request, jsonify, send_from_directory
+import shutil
+import threading
+import time
+from flask import Response, g, request, jsonify
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
 from app import app
 from file_manager import FileManager
 from peer_discovery import PeerDiscovery
-from config import SHARED_FILES_DIR, ALLOWED_EXTENSIONS, MAX_FILE_SIZE
+from peer_store import PeerStore
+from dht import DHTNode
+from search_index import SearchService
+from transfers import TransferCoordinator
+from jobs import JobQueue, JobReader
+from uploads import UploadSessions
+from events import EventBus
+from file_watcher import FileWatcher
+from hash_store import HashStore
+from file_cache import FileCache
+from stats import StatsCollector, parse_windows
+from control import ControlServer, ControlClient
+from peer_registry import STATUSES
+from metrics import (REGISTRY, HTTP_REQUEST_SECONDS, EVENT_STREAMS, WORKER_METRICS, Gauge,
+                     CounterFunction, watch_scheduler)
+from file_responses import send_shared_file
+from compression import compress_response
+from serializers import MSGPACK_MIMETYPE, dumps_json, dumps_msgpack
+from archives import FORMATS as ARCHIVE_FORMATS, stream_archive
+from transfer_scheduler import normalize_priority
+from config import (SHARED_FILES_DIR, ALLOWED_EXTENSIONS, MAX_FILE_SIZE, MAX_STREAM_UPLOAD_SIZE,
+                    DHT_PORT, SEARCH_MAX_RESULTS, EVENTS_HEARTBEAT, EVENTS_RETRY, SERVER_ROLE,
+                    BATCH_MAX_ITEMS, FILE_CACHE_SIZE)
 
 # Initialize managers
-file_manager = FileManager()
-peer_discovery = PeerDiscovery()
+event_bus = EventBus(dumps=app.json.dumps)
+file_manager = FileManager(hash_store=HashStore())
+upload_sessions = UploadSessions(file_manager)
+file_cache = FileCache() if FILE_CACHE_SIZE else None
+
+if SERVER_ROLE == 'worker':
+    # Stateless HTTP worker: the supervisor process owns the peer table, jobs,
+    # DHT and statistics. Files, hashes and jobs are read from the shared
+    # directory and databases; everything else is a call to the supervisor.
+    control = ControlClient()
+    server_stats = control.proxy('server_stats')
+    peer_discovery = control.proxy('peer_discovery')
+    dht_node = control.proxy('dht_node')
+    search_service = control.proxy('search_service')
+    job_queue = control.proxy('job_queue', local=JobReader())
+    metrics_registry = control.proxy('metrics')
+    control.relay_events(event_bus)
+    control.push_metrics(WORKER_METRICS)
+else:
+    server_stats = StatsCollector()
+    file_watcher = FileWatcher(file_manager, event_bus)
+    peer_discovery = PeerDiscovery(store=PeerStore(), server_stats=server_stats)
+    dht_node = DHTNode()
+    search_service = SearchService(file_manager, peer_discovery.registry)
+    transfer_coordinator = TransferCoordinator(peer_discovery)
+    job_queue = JobQueue(transfer_coordinator, event_bus=event_bus)
+    metrics_registry = REGISTRY
+
+    peer_discovery.registry.peer_listeners.append(
+        lambda peer_id, peer: event_bus.publish('peer', {'peer_id': peer_id, 'peer': peer}))
+    # Announce new and changed files on the DHT; the watcher hashes them right after, from the cache
+    file_watcher.listeners.append(
+        lambda name, old, new: new and dht_node.announce(
+            file_manager.get_file_hash(os.path.join(SHARED_FILES_DIR, name))))
+    if file_cache:
+        # Changed files would miss anyway (entries are checked against size and mtime); this frees the memory
+        file_watcher.listeners.append(
+            lambda name, old, new: file_cache.invalidate(os.path.join(SHARED_FILES_DIR, name)))
+
+    server_stats.register_gauge('total_peers', peer_discovery.get_peer_count)
+    server_stats.register_gauge('active_peers', peer_discovery.get_active_count)
+    server_stats.register_gauge('download_jobs', job_queue.counts)
+    server_stats.register_gauge('downloads_in_flight', peer_discovery.transfer_scheduler.in_flight)
+    if file_cache:
+        server_stats.register_gauge('file_cache', file_cache.stats)
+
+    # Values kept by the components themselves, read when /metrics is scraped
+    CounterFunction('p2p_bytes_received_total', 'File data received over TCP and HTTP',
+                    function=lambda: server_stats.total('bytes_in'))
+    CounterFunction('p2p_bytes_sent_total', 'File data sent over TCP and HTTP',
+                    function=lambda: server_stats.total('bytes_out'))
+    Gauge('p2p_shared_files', 'Files in the shared directory',
+          function=lambda: server_stats.file_count)
+    Gauge('p2p_shared_bytes', 'Total size of the shared directory',
+          function=lambda: server_stats.file_bytes)
+    Gauge('p2p_peers', 'Known peers by status', labels=('status',),
+          function=lambda: {status: peer_discovery.registry.count(status) for status in STATUSES})
+    Gauge('p2p_active_peers', 'Peers seen online recently', function=peer_discovery.get_active_count)
+    Gauge('p2p_download_jobs', 'Download jobs by state', labels=('state',), function=job_queue.counts)
+    watch_scheduler('download', peer_discovery.transfer_scheduler)
+
+    # What HTTP workers may call when this process runs as the supervisor
+    control_server = ControlServer({
+        'server_stats': (server_stats, ('add', 'snapshot')),
+        'peer_discovery': (peer_discovery, (
+            'get_peers', 'get_active_peers', 'get_peer_ids', 'add_peer', 'remove_peer',
+            'set_peer_priority', 'get_peer_priority', 'test_peer_connection', 'refresh_all',
+            'get_peer_catalog', 'likely_holders', 'rank_peers', 'get_scheduler_state')),
+        'dht_node': (dht_node, ('bootstrap', 'locate')),
+        'search_service': (search_service, ('search',)),
+        'job_queue': (job_queue, ('submit', 'cancel', 'pause', 'resume', 'set_priority')),
+        'metrics': (REGISTRY, ('render', 'merge'))
+    }, event_bus, dumps=app.json.dumps)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Request latency per route; requests that match no route aren't recorded"""
+    started = g.pop('request_started', None)
+    if started is not None and request.url_rule is not None:
+        HTTP_REQUEST_SECONDS.labels(request.method, request.url_rule.rule, response.status_code).observe(
+            time.perf_counter() - started)
+    return response
+
+# Registered after the timer so it runs first and compression counts towards latency
+app.after_request(compress_response)
 
 @app.route('/')
 def index():
@@ -27,17 +142,33 @@ def api_info():
         'endpoints': {
             'health': '/api/health',
             'files': '/api/files',
+            'files_compact': '/api/files?format=columnar|msgpack',
             'upload': '/api/files/upload',
+            'upload_stream': '/api/files/upload/<filename>',
+            'uploads': '/api/uploads',
+            'upload_session': '/api/uploads/<upload_id>',
             'download': '/api/files/download/<filename>',
             'delete': '/api/files/delete/<filename>',
+            'batch_delete': '/api/files/batch/delete',
+            'batch_stat': '/api/files/batch/stat',
+            'batch_copy': '/api/files/batch/copy',
+            'archive': '/api/files/archive?name=<filename>&format=zip|tar',
             'peers': '/api/peers',
             'add_peer': '/api/peers/add',
             'remove_peer': '/api/peers/remove/<peer_id>',
             'test_peer': '/api/peers/test/<peer_id>',
+            'peer_priority': '/api/peers/<peer_id>/priority',
             'peer_files': '/api/peers/<peer_id>/files',
             'download_from_peer': '/api/peers/download',
+            'jobs': '/api/jobs',
+            'job': '/api/jobs/<job_id>',
             'refresh_peers': '/api/peers/refresh',
-            'stats': '/api/stats'
+            'rank_peers': '/api/peers/rank',
+            'locate': '/api/locate/<hash>',
+            'search': '/api/search?q=<query>',
+            'stats': '/api/stats',
+            'events': '/api/events',
+            'metrics': '/metrics'
         }
     })
 
@@ -51,8 +182,42 @@ def health_check():
 
 @app.route('/api/files')
 def api_list_files():
-    """Get list of all files"""
+    """Get list of all files.
+    
+    ?format=columnar (or msgpack, also chosen by Accept: application/msgpack)
+    returns {"columns": {"name", "size", "mtime", "hash"}} with one list
+    per field instead of an object per file; size_human, dates, type and
+    extension are left to the client.
+    """
     try:
+        listing_format = request.args.get('format')
+        if listing_format is None and request.accept_mimetypes.best_match(
+                ['application/json', MSGPACK_MIMETYPE]) == MSGPACK_MIMETYPE:
+            listing_format = 'msgpack'
+        
+        if listing_format in ('columnar', 'msgpack'):
+            columns = file_manager.list_columns()
+            payload = {
+                'success': True,
+                'format': 'columnar',
+                'columns': columns,
+                'count': len(columns['name'])
+            }
+            if listing_format == 'msgpack':
+                try:
+                    return Response(dumps_msgpack(payload), mimetype=MSGPACK_MIMETYPE)
+                except LookupError as e:
+                    return jsonify({
+                        'success': False,
+                        'message': str(e)
+                    }), 406
+            return Response(dumps_json(payload), mimetype='application/json')
+        elif listing_format not in (None, 'json'):
+            return jsonify({
+                'success': False,
+                'message': f'Unknown format {listing_format} (expected json, columnar or msgpack)'
+            }), 400
+        
         files = file_manager.list_files()
         return jsonify({
             'success': True,
@@ -96,9 +261,14 @@ def api_upload_file():
                     'message': f'File too large. Maximum size is {MAX_FILE_SIZE // (1024*1024)}MB'
                 }), 400
             
-            # Save file
-            file_path = os.path.join(SHARED_FILES_DIR, filename)
-            file.save(file_path)
+            # Save through a temp file renamed into place, so downloads of the old version aren't cut short
+            success, message, _ = file_manager.save_stream(filename, file.stream, file_size)
+            if not success:
+                return jsonify({
+                    'success': False,
+                    'message': message
+                }), 400
+            server_stats.add('bytes_in', file_size)
             
             return jsonify({
                 'success': True,
@@ -117,11 +287,174 @@ def api_upload_file():
             'message': f'Upload failed: {str(e)}'
         }), 500
 
+@app.route('/api/files/upload/<filename>', methods=['PUT', 'POST'])
+def api_upload_stream(filename):
+    """Upload a file as the raw request body, streamed straight to disk.
+    
+    Send the file bytes as the body with a Content-Length; an optional
+    Content-MD5 header (the base64 digest, as in RFC 1864) is verified
+    against the digest computed while writing.
+    """
+    try:
+        filename = secure_filename(filename)
+        if not filename or not allowed_file(filename):
+            return jsonify({
+                'success': False,
+                'message': 'File type not allowed'
+            }), 400
+        
+        # Reject from the declared length before reading any of the body
+        length = request.content_length
+        if length is not None:
+            if MAX_STREAM_UPLOAD_SIZE and length > MAX_STREAM_UPLOAD_SIZE:
+                return jsonify({
+                    'success': False,
+                    'message': f'File too large. Maximum size is {MAX_STREAM_UPLOAD_SIZE // (1024*1024)}MB'
+                }), 413
+            if length > shutil.disk_usage(SHARED_FILES_DIR).free:
+                return jsonify({
+                    'success': False,
+                    'message': 'Not enough disk space for this file'
+                }), 507
+        
+        expected_hash = None
+        content_md5 = request.headers.get('Content-MD5')
+        if content_md5:
+            try:
+                expected_hash = base64.b64decode(content_md5, validate=True).hex()
+            except binascii.Error:
+                expected_hash = None
+            if expected_hash is None or len(expected_hash) != 32:
+                return jsonify({
+                    'success': False,
+                    'message': 'Content-MD5 must be the base64-encoded MD5 digest'
+                }), 400
+        
+        success, message, file_hash = file_manager.save_stream(
+            filename, request.stream, length, MAX_STREAM_UPLOAD_SIZE, expected_hash)
+        
+        if not success:
+            return jsonify({
+                'success': False,
+                'message': message
+            }), 400
+        
+        server_stats.add('bytes_in', os.path.getsize(os.path.join(SHARED_FILES_DIR, filename)))
+        return jsonify({
+            'success': True,
+            'message': f'File {filename} uploaded successfully',
+            'filename': filename,
+            'hash': file_hash
+        })
+    
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Upload failed: {str(e)}'
+        }), 500
+
+def upload_error(e):
+    """JSON error response for an UploadSessions exception"""
+    if isinstance(e, LookupError):
+        status = 404
+    elif isinstance(e, ValueError):
+        status = 400
+    elif isinstance(e, OSError) and 'disk space' in str(e):
+        status = 507
+    else:
+        status = 500
+    return jsonify({
+        'success': False,
+        'message': str(e)
+    }), status
+
+@app.route('/api/uploads', methods=['POST'])
+def api_create_upload():
+    """Start a resumable upload: {"filename", "size", "chunk_size"}"""
+    try:
+        data = request.get_json() or {}
+        filename = secure_filename(str(data.get('filename', '')))
+        if not filename or data.get('size') is None:
+            return jsonify({
+                'success': False,
+                'message': 'Filename and size required'
+            }), 400
+        
+        upload = upload_sessions.create(filename, data['size'], data.get('chunk_size'))
+        return jsonify({
+            'success': True,
+            'upload': upload
+        }), 201
+    except Exception as e:
+        return upload_error(e)
+
+@app.route('/api/uploads/<upload_id>')
+def api_upload_status(upload_id):
+    """Which chunks of a resumable upload have been received"""
+    try:
+        return jsonify({
+            'success': True,
+            'upload': upload_sessions.status(upload_id)
+        })
+    except Exception as e:
+        return upload_error(e)
+
+@app.route('/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def api_upload_chunk(upload_id, index):
+    """Receive one chunk as the raw body; X-Chunk-SHA256 is verified when sent"""
+    try:
+        upload = upload_sessions.put_chunk(upload_id, index, request.stream, request.content_length,
+                                           request.headers.get('X-Chunk-SHA256'))
+        server_stats.add('bytes_in', request.content_length or 0)
+        return jsonify({
+            'success': True,
+            'bytes_received': upload['bytes_received'],
+            'complete': upload['complete']
+        })
+    except Exception as e:
+        return upload_error(e)
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def api_finalize_upload(upload_id):
+    """Finish an upload: {"checksum": SHA-256 over the concatenated chunk SHA-256 digests}"""
+    try:
+        data = request.get_json() or {}
+        result = upload_sessions.finalize(upload_id, data.get('checksum'))
+        return jsonify({
+            'success': True,
+            'message': f"File {result['filename']} uploaded successfully",
+            **result
+        })
+    except Exception as e:
+        return upload_error(e)
+
+@app.route('/api/uploads/<upload_id>', methods=['DELETE'])
+def api_abort_upload(upload_id):
+    """Abandon a resumable upload and delete its data"""
+    try:
+        upload_sessions.abort(upload_id)
+        return jsonify({
+            'success': True,
+            'message': 'Upload aborted'
+        })
+    except Exception as e:
+        return upload_error(e)
+
 @app.route('/api/files/download/<filename>')
 def api_download_file(filename):
-    """Download a file"""
+    """Download a file, with ETag, conditional GET and Range support"""
     try:
-        return send_from_directory(SHARED_FILES_DIR, filename)
+        file_path = safe_join(SHARED_FILES_DIR, filename)
+        if file_path is None or not os.path.isfile(file_path):
+            raise FileNotFoundError(filename)
+        content_hash = file_manager.cached_hash(file_path, os.stat(file_path))
+        if content_hash is None:
+            # Hashing a large file here would hold up the response; it gets a weak ETag until the hash is cached
+            file_manager.hash_in_background(file_path)
+        response = send_shared_file(file_path, content_hash, file_cache)
+        if request.method == 'GET' and response.status_code in (200, 206):
+            server_stats.add('bytes_out', response.content_length or 0)
+        return response
     except FileNotFoundError:
         return jsonify({
             'success': False,
@@ -143,6 +476,162 @@ def api_delete_file(filename):
             'message': f'Delete failed: {str(e)}'
         }), 500
 
+def batch_items(data, key):
+    """The list under `key` in a batch request body; raises ValueError if missing or too long"""
+    items = data.get(key)
+    if not isinstance(items, list) or not items:
+        raise ValueError(f'{key} must be a non-empty list')
+    if len(items) > BATCH_MAX_ITEMS:
+        raise ValueError(f'At most {BATCH_MAX_ITEMS} items per request')
+    return items
+
+def batch_response(results):
+    """Per-item results with totals; success only if every item succeeded"""
+    failed = sum(1 for result in results if not result['success'])
+    return jsonify({
+        'success': not failed,
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'results': results
+    })
+
+@app.route('/api/files/batch/delete', methods=['POST'])
+def api_batch_delete():
+    """Delete many files: {"filenames": [...]}; reports the outcome per file"""
+    try:
+        filenames = batch_items(request.get_json() or {}, 'filenames')
+        return batch_response(file_manager.remove_files([str(name) for name in filenames]))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Delete failed: {str(e)}'
+        }), 500
+
+@app.route('/api/files/batch/stat', methods=['POST'])
+def api_batch_stat():
+    """File info for many files: {"filenames": [...], "verify": false}.
+    
+    With verify each file is hashed again and `verified` says whether it
+    still matches the indexed hash (null if none was indexed).
+    """
+    try:
+        data = request.get_json() or {}
+        filenames = batch_items(data, 'filenames')
+        return batch_response(file_manager.stat_files([str(name) for name in filenames],
+                                                      verify=bool(data.get('verify'))))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error getting file info: {str(e)}'
+        }), 500
+
+@app.route('/api/files/batch/copy', methods=['POST'])
+def api_batch_copy():
+    """Copy many files from peers: {"peer_id": default, "downloads": [{"peer_id", "filename", ...}]}.
+    
+    Valid items are queued as download jobs in one batch (as POST
+    /api/jobs); invalid ones are reported without stopping the rest.
+    """
+    try:
+        data = request.get_json() or {}
+        downloads = batch_items(data, 'downloads')
+        
+        results = [None] * len(downloads)
+        valid = []  # (index, download)
+        for index, item in enumerate(downloads):
+            item = {'filename': item} if isinstance(item, str) else item
+            try:
+                if not isinstance(item, dict):
+                    raise ValueError('Each download must be a filename or an object')
+                item = {'peer_id': data.get('peer_id'), **item}
+                if not item.get('peer_id') or not item.get('filename'):
+                    raise ValueError('Peer ID and filename required')
+                if item.get('priority'):
+                    normalize_priority(item['priority'])
+                valid.append((index, item))
+            except ValueError as e:
+                filename = item.get('filename') if isinstance(item, dict) else None
+                results[index] = {'filename': filename, 'success': False, 'message': str(e)}
+        
+        jobs = job_queue.submit([item for _, item in valid]) if valid else []
+        for (index, item), job in zip(valid, jobs):
+            results[index] = {'filename': item['filename'], 'success': True, 'job_id': job['job_id']}
+        return batch_response(results), 202
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error queueing downloads: {str(e)}'
+        }), 500
+
+@app.route('/api/files/archive', methods=['GET', 'POST'])
+def api_download_archive():
+    """Download many files as one zip or tar, streamed as it is built.
+    
+    GET ?name=a&name=b&format=zip, or POST {"filenames": [...], "format":
+    "zip" | "tar"} for long lists. Missing files are reported (404)
+    before anything is sent.
+    """
+    try:
+        if request.method == 'POST':
+            data = request.get_json() or {}
+            filenames = batch_items(data, 'filenames')
+        else:
+            data = request.args
+            filenames = batch_items({'filenames': request.args.getlist('name')}, 'filenames')
+        archive_format = data.get('format') or 'zip'
+        if archive_format not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unknown format {archive_format} (expected {', '.join(ARCHIVE_FORMATS)})")
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    entries = []
+    missing = []
+    for filename in dict.fromkeys(str(name) for name in filenames):
+        try:
+            file_path, stat = file_manager.stat_shared(filename)
+            entries.append((filename, file_path, stat.st_size, stat.st_mtime))
+        except OSError:
+            missing.append({'name': filename, 'success': False, 'message': 'File not found'})
+    if missing:
+        return jsonify({
+            'success': False,
+            'message': f'{len(missing)} files not found',
+            'results': missing
+        }), 404
+    
+    def stream():
+        sent = 0
+        try:
+            for chunk in stream_archive(entries, archive_format):
+                sent += len(chunk)
+                yield chunk
+        finally:
+            server_stats.add('bytes_out', sent)
+    
+    mimetype, extension = ARCHIVE_FORMATS[archive_format]
+    name = entries[0][0] + extension if len(entries) == 1 else f'shared-files-{len(entries)}{extension}'
+    return Response(stream(), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{name}"'
+    })
+
 @app.route('/api/peers')
 def api_list_peers():
     """Get list of all peers"""
@@ -177,8 +666,20 @@ def api_add_peer():
                 'message': 'IP address and port are required'
             }), 400
         
+        try:
+            priority = normalize_priority(data['priority']) if data.get('priority') else None
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
+        
         peer_port = int(peer_port)
-        peer_id = peer_discovery.add_peer(peer_ip, peer_port, peer_name)
+        dht_port = int(data.get('dht_port') or DHT_PORT)
+        peer_id = peer_discovery.add_peer(peer_ip, peer_port, peer_name, priority)
+        
+        # Join the DHT through the new peer without blocking the request
+        threading.Thread(target=dht_node.bootstrap, args=([(peer_ip, dht_port)],), daemon=True).start()
         
         return jsonify({
             'success': True,
@@ -197,6 +698,35 @@ def api_add_peer():
             'message': f'Error adding peer: {str(e)}'
         }), 500
 
+@app.route('/api/peers/<peer_id>/priority', methods=['POST'])
+def api_set_peer_priority(peer_id):
+    """Set a peer's default transfer class: {"priority": "interactive" | "normal" | "bulk" | null}"""
+    try:
+        data = request.get_json() or {}
+        priority = normalize_priority(data['priority']) if data.get('priority') else None
+        
+        if not peer_discovery.set_peer_priority(peer_id, priority):
+            return jsonify({
+                'success': False,
+                'message': 'Peer not found'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'message': f'Default priority for {peer_id} set to {peer_discovery.get_peer_priority(peer_id)}',
+            'priority': peer_discovery.get_peer_priority(peer_id)
+        })
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error setting peer priority: {str(e)}'
+        }), 500
+
 @app.route('/api/peers/remove/<peer_id>', methods=['DELETE'])
 def api_remove_peer(peer_id):
     """Remove a peer"""
@@ -237,11 +767,14 @@ def api_test_peer(peer_id):
 def api_get_peer_files(peer_id):
     """Get files from a peer"""
     try:
-        files = peer_discovery.get_peer_files(peer_id)
+        force = request.args.get('refresh', '').lower() in ('1', 'true', 'yes')
+        catalog = peer_discovery.get_peer_catalog(peer_id, force=force)
         return jsonify({
             'success': True,
-            'files': files,
-            'count': len(files)
+            'files': catalog['files'],
+            'count': len(catalog['files']),
+            'catalog_version': catalog['catalog_version'],
+            'stale': catalog['stale']
         })
     except Exception as e:
         return jsonify({
@@ -251,7 +784,7 @@ def api_get_peer_files(peer_id):
 
 @app.route('/api/peers/download', methods=['POST'])
 def api_download_from_peer():
-    """Download file from peer"""
+    """Queue a download from a peer and return its job"""
     try:
         data = request.get_json()
         peer_id = data.get('peer_id')
@@ -263,29 +796,140 @@ def api_download_from_peer():
                 'message': 'Peer ID and filename required'
             }), 400
         
-        # Save to shared directory
-        save_path = os.path.join(SHARED_FILES_DIR, filename)
-        
-        success, message = peer_discovery.download_file_from_peer(peer_id, filename, save_path)
+        job = job_queue.submit([data])[0]
         
         return jsonify({
-            'success': success,
-            'message': message
-        })
+            'success': True,
+            'message': 'Download queued',
+            'job_id': job['job_id'],
+            'job': job
+        }), 202
     
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
     except Exception as e:
         return jsonify({
             'success': False,
             'message': f'Download failed: {str(e)}'
         }), 500
 
+@app.route('/api/jobs')
+def api_list_jobs():
+    """List download jobs, optionally filtered by ?state="""
+    try:
+        limit = request.args.get('limit', type=int)
+        return jsonify({
+            'success': True,
+            'jobs': job_queue.list(request.args.get('state'), limit),
+            'counts': job_queue.counts(),
+            'scheduler': peer_discovery.get_scheduler_state()
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error listing jobs: {str(e)}'
+        }), 500
+
+@app.route('/api/jobs', methods=['POST'])
+def api_submit_jobs():
+    """Queue a batch of downloads: {"downloads": [{"peer_id", "filename", "hash", "priority", "size"}]}"""
+    try:
+        data = request.get_json() or {}
+        downloads = data.get('downloads') or []
+        
+        if not downloads or any(not d.get('peer_id') or not d.get('filename') for d in downloads):
+            return jsonify({
+                'success': False,
+                'message': 'Each download needs a peer ID and filename'
+            }), 400
+        
+        jobs = job_queue.submit(downloads)
+        
+        return jsonify({
+            'success': True,
+            'message': f'{len(jobs)} downloads queued',
+            'job_ids': [job['job_id'] for job in jobs]
+        }), 202
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error queueing downloads: {str(e)}'
+        }), 500
+
+@app.route('/api/jobs/<job_id>')
+def api_get_job(job_id):
+    """Get one download job with its progress"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({
+            'success': False,
+            'message': 'Job not found'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'job': job
+    })
+
+@app.route('/api/jobs/<job_id>/<action>', methods=['POST'])
+def api_control_job(job_id, action):
+    """Cancel, pause, resume or reprioritize a download job"""
+    try:
+        if job_queue.get(job_id) is None:
+            return jsonify({
+                'success': False,
+                'message': 'Job not found'
+            }), 404
+        
+        if action == 'cancel':
+            success, message = job_queue.cancel(job_id)
+        elif action == 'pause':
+            success, message = job_queue.pause(job_id)
+        elif action == 'resume':
+            success, message = job_queue.resume(job_id)
+        elif action == 'priority':
+            data = request.get_json() or {}
+            if data.get('priority') is None:
+                return jsonify({
+                    'success': False,
+                    'message': 'Priority required'
+                }), 400
+            success, message = job_queue.set_priority(job_id, data['priority'])
+        else:
+            return jsonify({
+                'success': False,
+                'message': f'Unknown action: {action}'
+            }), 404
+        
+        return jsonify({
+            'success': success,
+            'message': message,
+            'job': job_queue.get(job_id)
+        }), 200 if success else 409
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error updating job: {str(e)}'
+        }), 500
+
 @app.route('/api/peers/refresh', methods=['POST'])
 def api_refresh_peers():
     """Refresh peer status"""
     try:
-        peers = peer_discovery.get_peers()
-        for peer_id in peers:
-            peer_discovery.test_peer_connection(peer_id)
+        peer_discovery.refresh_all()
         
         return jsonify({
             'success': True,
@@ -297,26 +941,102 @@ def api_refresh_peers():
             'message': f'Error refreshing peers: {str(e)}'
         }), 500
 
+@app.route('/api/peers/rank')
+def api_rank_peers():
+    """Rank candidate source peers for a download"""
+    try:
+        content_hash = request.args.get('hash')
+        filename = request.args.get('filename')
+        size = request.args.get('size', type=int)
+        peer_ids = request.args.getlist('peer_id') or None
+        
+        if content_hash or filename:
+            peer_ids = peer_discovery.likely_holders(content_hash, filename, peer_ids)
+        elif peer_ids is None:
+            peer_ids = peer_discovery.get_peer_ids()
+        
+        ranked = peer_discovery.rank_peers(peer_ids, size)
+        return jsonify({
+            'success': True,
+            'peers': ranked,
+            'count': len(ranked)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error ranking peers: {str(e)}'
+        }), 500
+
+@app.route('/api/locate/<content_hash>')
+def api_locate(content_hash):
+    """Find peers providing a file by its content hash via the DHT"""
+    try:
+        limit = request.args.get('limit', type=int)
+        providers = dht_node.locate(content_hash, max_providers=limit)
+        return jsonify({
+            'success': True,
+            'hash': content_hash,
+            'providers': providers,
+            'count': len(providers),
+            'likely_holders': peer_discovery.likely_holders(content_hash=content_hash)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error locating file: {str(e)}'
+        }), 500
+
+@app.route('/api/search')
+def api_search():
+    """Search the local catalog and all cached peer catalogs"""
+    try:
+        query = request.args.get('q', '').strip()
+        limit = min(request.args.get('limit', SEARCH_MAX_RESULTS, type=int), 1000)
+        
+        if not query:
+            return jsonify({
+                'success': False,
+                'message': 'Query parameter q is required'
+            }), 400
+        
+        start = time.perf_counter()
+        hits = search_service.search(query, limit)
+        
+        return jsonify({
+            'success': True,
+            'query': query,
+            'hits': hits,
+            'count': len(hits),
+            'took_ms': round((time.perf_counter() - start) * 1000, 3)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Search failed: {str(e)}'
+        }), 500
+
 @app.route('/api/stats')
 def api_get_stats():
-    """Get application statistics"""
+    """Get application statistics from running counters.
+    
+    ?window=1m,5m,1h (or all) adds the traffic and file changes seen in
+    each window, with average rates in bytes/second.
+    """
     try:
-        files = file_manager.list_files()
-        peers = peer_discovery.get_peers()
-        active_peers = peer_discovery.get_active_peers()
-        
-        total_size = sum(file.get('size', 0) for file in files)
+        try:
+            windows = parse_windows(request.args.get('window'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'message': str(e)
+            }), 400
         
+        stats = server_stats.snapshot(windows)
+        stats['total_file_size_human'] = file_manager.format_file_size(stats['total_file_size'])
+        stats['server_status'] = 'running'
         return jsonify({
             'success': True,
-            'stats': {
-                'total_files': len(files),
-                'total_file_size': total_size,
-                'total_file_size_human': file_manager.format_file_size(total_size),
-                'total_peers': len(peers),
-                'active_peers': len(active_peers),
-                'server_status': 'running'
-            }
+            'stats': stats
         })
     except Exception as e:
         return jsonify({
@@ -324,6 +1044,43 @@ def api_get_stats():
             'message': f'Error getting stats: {str(e)}'
         }), 500
 
+@app.route('/api/events')
+def api_events():
+    """Server-Sent Events stream of changes, so clients don't have to poll.
+    
+    Events: `file.added` / `file.changed` (file info as in /api/files),
+    `file.removed` ({name}), `peer` ({peer_id, peer}, peer null once
+    removed) and `job` (the job as in /api/jobs). A client reconnecting
+    with Last-Event-ID gets the events it missed; if they are no longer
+    held it is sent `resync` and should reload everything.
+    """
+    cursor = event_bus.cursor(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    
+    def stream(cursor):
+        EVENT_STREAMS.inc()
+        try:
+            yield f"retry: {EVENTS_RETRY}\n\n"
+            while True:
+                frames, cursor, missed = event_bus.wait(cursor, EVENTS_HEARTBEAT)
+                if missed:
+                    yield f"id: {cursor}\nevent: resync\ndata: {{}}\n\n"
+                elif frames:
+                    yield ''.join(frames)
+                else:
+                    yield ": keep-alive\n\n"
+        finally:
+            EVENT_STREAMS.dec()
+    
+    return Response(stream(cursor), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Metrics in the Prometheus text exposition format"""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
 def allowed_file(filename):
     """Check if file has allowed extension"""
     return '.' in filename and \
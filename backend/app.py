@@ -19,15 +19,52 @@ CORS(app, origins=['*'])
 # Import routes after app creation to avoid circular imports
 from api_routes import *
 from tcp_server import TCPFileServer
+from metrics import watch_scheduler
+from config import SERVER_ROLE, DHT_PORT
 
-# Start the TCP server in a separate thread
 def start_tcp_server():
-    tcp_server = TCPFileServer()
+    """Run the TCP file server (blocks)"""
+    tcp_server = TCPFileServer(peer_priority=peer_discovery.registry.priority_for_ip,
+                               server_stats=server_stats, file_cache=file_cache,
+                               file_manager=file_manager)
+    server_stats.register_gauge('tcp_transfers_in_flight', tcp_server.scheduler.in_flight)
+    watch_scheduler('tcp', tcp_server.scheduler)
     tcp_server.start()
 
-# Start TCP server thread when Flask app starts
-tcp_thread = threading.Thread(target=start_tcp_server, daemon=True)
-tcp_thread.start()
+def start_services():
+    """Start everything but the HTTP server; runs in standalone and supervisor processes"""
+    # Start the TCP server in a separate thread
+    tcp_thread = threading.Thread(target=start_tcp_server, daemon=True)
+    tcp_thread.start()
+
+    # Restore persisted peers, then start periodic health checks
+    peer_discovery.load()
+    peer_discovery.start_health_checks()
+
+    # Resume queued and interrupted peer downloads
+    job_queue.start()
+
+    # Publish changes to the shared directory on the event stream and count them
+    file_watcher.start()
+    server_stats.watch_files(file_watcher)
+
+    # Index local and cached peer catalogs for search, and local files as they change
+    search_service.watch_files(file_watcher)
+    search_service.start()
+
+    # Join the DHT through the restored peers (on the default DHT port) and announce our files by content hash
+    dht_node.start(provider_source=lambda: [f['hash'] for f in file_manager.list_files() if f.get('hash')])
+    addresses = [(peer['ip'], DHT_PORT) for peer in peer_discovery.get_peers().values()]
+    if addresses:
+        threading.Thread(target=dht_node.bootstrap, args=(addresses,), daemon=True).start()
+
+    # Let HTTP worker processes reach the components above
+    if SERVER_ROLE == 'supervisor':
+        control_server.start()
+
+# HTTP workers only serve requests; the supervisor runs the services for them
+if SERVER_ROLE != 'worker':
+    start_services()
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
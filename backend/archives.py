@@ -0,0 +1,93 @@
+import io
+import tarfile
+import time
+import zipfile
+from file_responses import read_range
+from config import DOWNLOAD_BLOCK_SIZE
+
+FORMATS = {
+    'zip': ('application/zip', '.zip'),
+    'tar': ('application/x-tar', '.tar')
+}
+
+
+class _Spool(io.RawIOBase):
+    """Write-only stream that keeps what is written until drain() hands it out"""
+
+    def __init__(self):
+        self.chunks = []
+        self.offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+def stream_archive(entries, archive_format, block_size=DOWNLOAD_BLOCK_SIZE):
+    """Yield a zip or tar archive of (arcname, path, size, mtime) entries as it is built.
+
+    Nothing is staged on disk and at most one block of file data is held
+    at a time. Zip members are stored uncompressed (most shared files are
+    already compressed) with ZIP64 sizes. A file that shrinks after it was
+    listed is padded with zeros to the listed size.
+    """
+    chunks = _stream_zip(entries, block_size) if archive_format == 'zip' else _stream_tar(entries, block_size)
+    for chunk in chunks:
+        if chunk:  # An empty chunk would end a chunked response early
+            yield chunk
+
+
+def _read_exactly(path, size, block_size):
+    remaining = size
+    with open(path, 'rb') as f:
+        for block in read_range(f, 0, size, block_size):
+            remaining -= len(block)
+            yield block
+    while remaining > 0:
+        padding = min(block_size, remaining)
+        remaining -= padding
+        yield b'\0' * padding
+
+
+def _stream_zip(entries, block_size):
+    spool = _Spool()
+    with zipfile.ZipFile(spool, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+        for arcname, path, size, mtime in entries:
+            info = zipfile.ZipInfo(arcname, time.localtime(max(mtime, 315532800))[:6])  # Zip dates start in 1980
+            info.file_size = size
+            with archive.open(info, 'w', force_zip64=size >= zipfile.ZIP64_LIMIT) as member:
+                for block in _read_exactly(path, size, block_size):
+                    member.write(block)
+                    yield spool.drain()
+    # Last data descriptor and the central directory
+    yield spool.drain()
+
+
+def _stream_tar(entries, block_size):
+    written = 0
+    for arcname, path, size, mtime in entries:
+        info = tarfile.TarInfo(arcname)
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = 0o644
+        header = info.tobuf(tarfile.PAX_FORMAT)
+        padding = -size % tarfile.BLOCKSIZE
+        yield header
+        yield from _read_exactly(path, size, block_size)
+        yield b'\0' * padding
+        written += len(header) + size + padding
+    # Two empty blocks end the archive, padded to a whole record as tarfile does
+    written += 2 * tarfile.BLOCKSIZE
+    yield b'\0' * (2 * tarfile.BLOCKSIZE + -written % tarfile.RECORDSIZE)
@@ -0,0 +1,131 @@
+import base64
+import hashlib
+import os
+import threading
+from collections import Counter, deque
+from config import SUMMARY_BITS, SUMMARY_HASHES, SUMMARY_CHANGE_LOG
+
+
+def summary_items(files):
+    """Items a node advertises for its files: content hashes and lowercased names"""
+    items = set()
+    for file_info in files:
+        if file_info.get('hash'):
+            items.add('h:' + file_info['hash'])
+        if file_info.get('name'):
+            items.add('n:' + file_info['name'].lower())
+    return items
+
+
+def bit_positions(item, num_bits, num_hashes):
+    """Kirsch-Mitzenmacher double hashing over one SHA-256 digest"""
+    digest = hashlib.sha256(item.encode('utf-8')).digest()
+    h1 = int.from_bytes(digest[:8], 'little')
+    h2 = int.from_bytes(digest[8:16], 'little') | 1
+    return [(h1 + i * h2) % num_bits for i in range(num_hashes)]
+
+
+class BloomFilter:
+    """Plain Bloom filter as received from a peer"""
+
+    def __init__(self, num_bits=SUMMARY_BITS, num_hashes=SUMMARY_HASHES, bits=None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray(bits) if bits is not None else bytearray((num_bits + 7) // 8)
+
+    def __contains__(self, item):
+        return all(self.bits[p >> 3] & (1 << (p & 7))
+                   for p in bit_positions(item, self.num_bits, self.num_hashes))
+
+    def toggle(self, positions):
+        """Apply a delta of flipped bit positions"""
+        for p in positions:
+            self.bits[p >> 3] ^= 1 << (p & 7)
+
+    def might_have(self, content_hash=None, filename=None):
+        if content_hash and 'h:' + content_hash not in self:
+            return False
+        if filename and 'n:' + filename.lower() not in self:
+            return False
+        return True
+
+    @classmethod
+    def from_message(cls, message):
+        return cls(message['num_bits'], message['num_hashes'], base64.b64decode(message['bits']))
+
+
+class ContentSummary:
+    """Counting Bloom filter over this node's content.
+
+    Counters let files be removed as well as added. Whenever a counter
+    moves between zero and non-zero the matching bit of the exported
+    filter flips; those flips are kept in a bounded change log so peers
+    holding an older version can catch up with a small delta instead of
+    the whole filter. `epoch` changes on every restart so stale versions
+    are never patched.
+    """
+
+    def __init__(self, num_bits=SUMMARY_BITS, num_hashes=SUMMARY_HASHES, log_size=SUMMARY_CHANGE_LOG):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.counters = bytearray(num_bits)
+        self.filter = BloomFilter(num_bits, num_hashes)
+        self.items = set()
+        self.epoch = os.urandom(8).hex()
+        self.version = 0
+        self.change_log = deque(maxlen=log_size)  # [(version, [positions])]
+        self.lock = threading.Lock()
+
+    def sync(self, files):
+        """Bring the filter in line with the current file list"""
+        current = summary_items(files)
+        with self.lock:
+            added = current - self.items
+            removed = self.items - current
+            if not added and not removed:
+                return self.version
+
+            flipped = []
+            for item in added:
+                for p in bit_positions(item, self.num_bits, self.num_hashes):
+                    if self.counters[p] == 0:
+                        flipped.append(p)
+                    if self.counters[p] < 255:
+                        self.counters[p] += 1
+            for item in removed:
+                for p in bit_positions(item, self.num_bits, self.num_hashes):
+                    # Saturated counters are never decremented, so they can't underflow
+                    if 0 < self.counters[p] < 255:
+                        self.counters[p] -= 1
+                        if self.counters[p] == 0:
+                            flipped.append(p)
+            self.items = current
+
+            # A position can flip on and off again within one sync
+            toggled = [p for p, count in Counter(flipped).items() if count % 2]
+            if toggled:
+                self.filter.toggle(toggled)
+                self.version += 1
+                self.change_log.append((self.version, toggled))
+            return self.version
+
+    def export(self, epoch=None, since=None):
+        """Message for a peer that holds (epoch, since), or a full copy"""
+        with self.lock:
+            message = {
+                'status': 'success',
+                'epoch': self.epoch,
+                'version': self.version,
+                'num_bits': self.num_bits,
+                'num_hashes': self.num_hashes
+            }
+            if epoch == self.epoch and since is not None:
+                if since == self.version:
+                    return {'status': 'not_modified', 'epoch': self.epoch, 'version': self.version}
+                if self.change_log and self.change_log[0][0] <= since + 1:
+                    message['toggled'] = [p for version, positions in self.change_log
+                                          if version > since for p in positions]
+                    return message
+
+            message['bits'] = base64.b64encode(bytes(self.filter.bits)).decode('ascii')
+            return message
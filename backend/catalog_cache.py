@@ -0,0 +1,80 @@
+import logging
+import threading
+import time
+from config import CATALOG_CACHE_TTL
+
+
+class CatalogCache:
+    """TTL cache in front of peer catalogs.
+
+    Catalogs live in the peer registry together with the version the peer
+    served them as. A fresh entry is returned without touching the network.
+    A stale entry is returned immediately while a background refresh asks
+    the peer for the catalog only if its version changed. Concurrent
+    refreshes of the same peer share one request.
+    """
+
+    def __init__(self, peer_discovery, ttl=CATALOG_CACHE_TTL):
+        self.peer_discovery = peer_discovery
+        self.registry = peer_discovery.registry
+        self.ttl = ttl
+        self.in_flight = {}  # {peer_id: threading.Event}
+        self.lock = threading.Lock()
+
+    def get(self, peer_id, force=False):
+        """Return (files, version, fetched_at, stale) for a peer's catalog"""
+        entry = self.registry.get_catalog_entry(peer_id)
+
+        if entry is None or force:
+            self.refresh(peer_id)
+            entry = self.registry.get_catalog_entry(peer_id)
+            if entry is None:
+                return [], None, None, True
+        elif time.time() - entry[1] >= self.ttl:
+            self.refresh_async(peer_id)
+            version, fetched_at, files = entry
+            return files, version, fetched_at, True
+
+        version, fetched_at, files = entry
+        return files, version, fetched_at, time.time() - fetched_at >= self.ttl
+
+    def refresh_async(self, peer_id):
+        """Start a background revalidation unless one is already running"""
+        with self.lock:
+            if peer_id in self.in_flight:
+                return
+        threading.Thread(target=self.refresh, args=(peer_id,), daemon=True).start()
+
+    def refresh(self, peer_id):
+        """Revalidate a peer's catalog; returns True if the cache is current"""
+        with self.lock:
+            event = self.in_flight.get(peer_id)
+            leader = event is None
+            if leader:
+                event = self.in_flight[peer_id] = threading.Event()
+
+        if not leader:
+            event.wait()
+            return True
+
+        try:
+            entry = self.registry.get_catalog_entry(peer_id)
+            known_version = entry[0] if entry else None
+            status, files, version = self.peer_discovery.fetch_catalog(peer_id, known_version)
+
+            if status == 'not_modified':
+                self.registry.mark_catalog_fresh(peer_id)
+            elif status == 'success':
+                self.registry.set_catalog(peer_id, files, version)
+            else:
+                return False
+
+            self.registry.touch(peer_id)
+            return True
+        except Exception as e:
+            logging.error(f"Error refreshing catalog of peer {peer_id}: {e}")
+            return False
+        finally:
+            with self.lock:
+                self.in_flight.pop(peer_id, None)
+            event.set()
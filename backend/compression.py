@@ -0,0 +1,82 @@
+import gzip
+import os
+from flask import current_app, request
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+from config import COMPRESS_MIN_SIZE, COMPRESS_MIMETYPES, COMPRESS_GZIP_LEVEL, COMPRESS_BROTLI_QUALITY
+
+try:
+    import brotli
+except ImportError:  # Optional; without it responses are gzipped
+    brotli = None
+
+ENCODINGS = ('br', 'gzip') if brotli else ('gzip',)  # In order of preference
+SUFFIXES = {'br': '.br', 'gzip': '.gz'}  # Precompressed siblings written by build_static.py
+
+
+def negotiate(available=ENCODINGS):
+    """The client's preferred encoding among `available`, or None for identity"""
+    return request.accept_encodings.best_match(available)
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=COMPRESS_BROTLI_QUALITY)
+    return gzip.compress(data, COMPRESS_GZIP_LEVEL, mtime=0)
+
+
+def precompressed(path, encoding):
+    """Path of a precompressed copy of `path` at least as new as the file, or None"""
+    candidate = path + SUFFIXES[encoding]
+    try:
+        return candidate if os.stat(candidate).st_mtime_ns >= os.stat(path).st_mtime_ns else None
+    except OSError:
+        return None
+
+
+def compress_response(response):
+    """after_request hook: compress API bodies the client accepts, and serve precompressed static files.
+
+    JSON and text bodies of at least COMPRESS_MIN_SIZE are compressed with
+    the best encoding both sides support. File downloads and event streams
+    are left alone: they are streamed, and mostly already compressed.
+    """
+    if 'Content-Encoding' in response.headers:
+        return response
+    if request.endpoint == 'static':
+        return _static_response(response)
+    if (response.direct_passthrough or response.is_streamed or
+            response.mimetype not in COMPRESS_MIMETYPES or
+            (response.content_length or 0) < COMPRESS_MIN_SIZE):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate()
+    if encoding:
+        response.set_data(compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def _static_response(response):
+    if response.status_code not in (200, 304):
+        return response
+    path = safe_join(current_app.static_folder, request.view_args['filename'])
+    copies = {encoding: precompressed(path, encoding) for encoding in ENCODINGS} if path else {}
+    available = [encoding for encoding, candidate in copies.items() if candidate]
+    if not available:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = negotiate(available)
+    if encoding and response.status_code == 200:
+        candidate = copies[encoding]
+        response.close()
+        response.response = wrap_file(request.environ, open(candidate, 'rb'))
+        response.content_length = os.path.getsize(candidate)
+        response.headers['Content-Encoding'] = encoding
+    # One weak ETag for every encoding of the file, so revalidation works for all of them
+    etag, _ = response.get_etag()
+    if etag:
+        response.set_etag(etag, weak=True)
+    return response
@@ -8,16 +8,119 @@ TCP_PORT = 8000
 
 # File sharing configuration
 SHARED_FILES_DIR = os.path.join(os.path.dirname(__file__), 'shared_files')
-MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
+INCOMING_DIR = os.path.join(SHARED_FILES_DIR, '.incoming')  # Temp files of downloads in progress
+MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB, for multipart form uploads
+MAX_STREAM_UPLOAD_SIZE = 0  # Streaming uploads are written straight to disk; 0 means only free space limits them
+UPLOAD_BLOCK_SIZE = 1024 * 1024  # Bytes read from the request stream at a time
+DOWNLOAD_BLOCK_SIZE = 1024 * 1024  # Bytes per read when a download isn't sent with sendfile
+DOWNLOAD_MAX_RANGES = 16  # Range requests with more ranges get the whole file
+DOWNLOAD_CACHE_CONTROL = 'no-cache'  # Clients may cache downloads but must revalidate (ETag makes that cheap)
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # Default chunk size of resumable upload sessions
+UPLOAD_CHUNK_SIZE_MIN = 256 * 1024  # Bounds for chunk sizes requested by clients
+UPLOAD_CHUNK_SIZE_MAX = 64 * 1024 * 1024
+UPLOAD_SESSION_TTL = 24 * 60 * 60  # Unfinished upload sessions are discarded after a day idle
+BATCH_MAX_ITEMS = 100000  # Files per bulk delete/stat/copy/archive request
+HASH_DB_PATH = os.path.join(os.path.dirname(__file__), 'data', 'hashes.db')  # File hashes, kept across restarts and shared by processes
 ALLOWED_EXTENSIONS = {
     'txt', 'pdf', 'png', 'jpg', 'jpeg', 'gif', 'doc', 'docx', 
     'xls', 'xlsx', 'ppt', 'pptx', 'zip', 'rar', 'mp3', 'mp4',
     'avi', 'mov', 'mkv', 'py', 'js', 'html', 'css'
 }
 
+# File cache configuration
+FILE_CACHE_SIZE = 256 * 1024 * 1024  # Memory for contents of popular files served to peers, per process; 0 disables it
+FILE_CACHE_MAX_FILE_SIZE = 8 * 1024 * 1024  # Larger files are always read from disk
+FILE_CACHE_SKETCH_WIDTH = 1 << 16  # Counters per row of the request frequency sketch (4 rows, a byte each)
+
+# Disk read-ahead configuration
+READ_BLOCK_SIZE = 1024 * 1024  # Aligned read size for files streamed to peers over TCP
+READ_AHEAD_WINDOW = 8 * 1024 * 1024  # Read-ahead requested at most this far ahead of each stream
+READ_DROP_BEHIND_MIN_SIZE = 256 * 1024 * 1024  # Pages already sent of larger files are dropped from the page cache
+
 # Transfer configuration
 CHUNK_SIZE = 8192  # 8KB chunks for file transfer
 TRANSFER_TIMEOUT = 300  # 5 minutes timeout for transfers
 
+# Transfer scheduling configuration
+TRANSFER_SLOTS = 8  # Transfers the TCP server (and, separately, peer downloads) run at once
+TRANSFER_CLASS_WEIGHTS = {'interactive': 8, 'normal': 4, 'bulk': 1}  # Share of slots and bandwidth
+TRANSFER_DEFAULT_PRIORITY = 'normal'  # Class for requests and peers that don't set one
+TCP_BANDWIDTH_LIMIT = 0  # Bytes/second for transfers served over TCP, 0 for unlimited
+DOWNLOAD_BANDWIDTH_LIMIT = 0  # Bytes/second for downloads from peers, 0 for unlimited
+
+# Download job configuration
+JOB_DB_PATH = os.path.join(os.path.dirname(__file__), 'data', 'jobs.db')
+JOB_WORKERS = 4  # Peer downloads running at once
+JOB_PROGRESS_INTERVAL = 1.0  # Minimum seconds between progress writes of one job
+JOB_SPEED_SMOOTHING = 0.3  # Weight of the newest sample in the speed average
+
+# Peer table configuration
+ACTIVE_PEER_WINDOW = 5 * 60  # Peers seen online within this many seconds are active
+PEER_DB_PATH = os.path.join(os.path.dirname(__file__), 'data', 'peers.db')
+PEER_RTT_SAMPLES = 64  # Ring buffer sizes for per-peer measurements
+PEER_THROUGHPUT_SAMPLES = 32
+PEER_OUTCOME_SAMPLES = 32
+PEER_STORE_FLUSH_INTERVAL = 0.5  # Seconds to gather writes into one transaction
+CATALOG_CACHE_TTL = 60  # Seconds a cached peer catalog is served without revalidation
+
+# Content summary configuration
+SUMMARY_BITS = 1 << 19  # Bloom filter size; fixed so deltas stay valid (64KB on the wire)
+SUMMARY_HASHES = 7
+SUMMARY_CHANGE_LOG = 256  # Versions of bit flips kept for delta updates
+SUMMARY_REFRESH_INTERVAL = 5 * 60  # Seconds between summary syncs with one peer
+SUMMARY_REBUILD_INTERVAL = 5  # Minimum seconds between local summary rebuilds
+
+# Search configuration
+SEARCH_MAX_RESULTS = 50
+
+# Circuit breaker configuration
+CIRCUIT_FAILURE_THRESHOLD = 3  # Consecutive failures before a peer's circuit opens
+CIRCUIT_COOLDOWN = 15  # Seconds before a trial request is let through
+CIRCUIT_MAX_COOLDOWN = 5 * 60  # Cooldown doubles after each failed trial up to this
+CONNECT_TIMEOUT_MIN = 0.25  # Connect timeout bounds, in seconds
+CONNECT_TIMEOUT_MAX = 5
+CONNECT_TIMEOUT_RTT_MULTIPLIER = 4  # Connect timeout is this many times the peer's p95 RTT
+
+# Peer health check configuration
+HEALTH_CHECK_INTERVAL = 60  # Seconds between probes of an online peer
+HEALTH_CHECK_CONCURRENCY = 64  # Maximum probes in flight
+HEALTH_CHECK_TIMEOUT = 5  # Seconds per probe
+HEALTH_CHECK_MAX_BACKOFF = 30 * 60  # Longest delay between probes of an offline peer
+HEALTH_CHECK_BATCH_INTERVAL = 0.5  # Seconds between batched peer table writes
+
+# DHT configuration
+DHT_HOST = '0.0.0.0'
+DHT_PORT = 8001
+DHT_K = 20  # Bucket size and replication factor
+DHT_ALPHA = 3  # Parallel lookups per hop
+DHT_RPC_TIMEOUT = 2  # Seconds to wait for a DHT reply
+DHT_PROVIDER_TTL = 24 * 60 * 60  # Provider records expire after 24 hours
+DHT_REPUBLISH_INTERVAL = 60 * 60  # Republish local content every hour
+DHT_ANNOUNCE_CHECK_INTERVAL = 5  # Seconds between checks for a first contact to announce local content to
+
+# Event stream configuration
+EVENTS_HISTORY = 1024  # Recent events kept for clients reconnecting with Last-Event-ID
+EVENTS_HEARTBEAT = 15  # Seconds between keep-alive comments on an idle stream
+EVENTS_RETRY = 3000  # Milliseconds clients wait before reconnecting
+FILE_WATCH_INTERVAL = 1.0  # Seconds between scans of the shared directory for changes
+
+# Statistics configuration
+STATS_WINDOWS = {'1m': 60, '5m': 300, '1h': 3600}  # Windows /api/stats can report traffic for
+STATS_METER_BATCH = 1024 * 1024  # Bytes a transfer accumulates before adding them to the counters
+
+# Response compression configuration
+COMPRESS_MIN_SIZE = 1024  # Smaller API responses are sent as they are
+COMPRESS_MIMETYPES = ('application/json', 'application/msgpack', 'text/plain', 'text/html')  # Compressed when the client accepts it
+COMPRESS_GZIP_LEVEL = 6  # On-the-fly levels; build_static.py precompresses static files at the maximum
+COMPRESS_BROTLI_QUALITY = 5  # Used when the optional brotli package is installed
+
+# Production serving configuration
+SERVER_ROLE = os.environ.get('P2P_ROLE', 'standalone')  # standalone, or supervisor / worker (see start_production.py)
+CONTROL_SOCKET = os.environ.get('P2P_CONTROL_SOCKET', os.path.join(os.path.dirname(__file__), 'data', 'control.sock'))
+CONTROL_TIMEOUT = 60  # Seconds a worker waits for the supervisor to answer a call
+HTTP_WORKERS = int(os.environ.get('P2P_HTTP_WORKERS', os.cpu_count() or 2))  # gunicorn worker processes
+HTTP_WORKER_THREADS = 16  # Threads per worker; each open /api/events stream holds one
+METRICS_PUSH_INTERVAL = 5  # Seconds between workers sending their metrics to the supervisor
+
 # Ensure shared files directory exists
 os.makedirs(SHARED_FILES_DIR, exist_ok=True)
@@ -0,0 +1,202 @@
+import functools
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from config import CONTROL_SOCKET, CONTROL_TIMEOUT, EVENTS_HEARTBEAT, METRICS_PUSH_INTERVAL
+from metrics import REGISTRY
+
+# Exceptions re-raised in the worker with their own type; callers tell bad requests apart by them
+ERRORS = {error.__name__: error for error in (ValueError, LookupError, KeyError, FileNotFoundError, OSError)}
+
+
+class ControlServer:
+    """Serves the supervisor's components to HTTP worker processes over a Unix socket.
+
+    Requests are JSON lines, {"op": "component.method", "args": [...],
+    "kwargs": {...}}, answered in order with {"result": ...} or {"error":
+    message, "type": exception class}. Only the methods listed for each
+    component can be called. The op `events.subscribe` with a `cursor`
+    turns the connection into a stream of {"frames", "last_id", "missed"}
+    batches from the EventBus, starting with an empty one giving the
+    current id.
+    """
+
+    def __init__(self, components, event_bus, path=CONTROL_SOCKET, dumps=json.dumps):
+        """components maps a name to (object, method names)"""
+        self.ops = {f"{name}.{method}": getattr(component, method)
+                    for name, (component, methods) in components.items() for method in methods}
+        self.events = event_bus
+        self.path = path
+        self.dumps = dumps
+        self.socket = None
+
+    def start(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.socket.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self.socket.listen(64)
+        threading.Thread(target=self._accept, name="control-server", daemon=True).start()
+        logging.info(f"Control server listening on {self.path}")
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.socket.accept()
+            except OSError as e:
+                logging.error(f"Control server socket error: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            with conn, conn.makefile('rb') as reader:
+                for line in reader:
+                    request = json.loads(line)
+                    if request.get('op') == 'events.subscribe':
+                        self._stream_events(conn, request.get('cursor'))
+                        return
+                    conn.sendall(self._call(request))
+        except (OSError, ValueError) as e:
+            logging.debug(f"Control connection closed: {e}")
+
+    def _call(self, request):
+        try:
+            method = self.ops.get(request.get('op'))
+            if method is None:
+                raise LookupError(f"Unknown control operation {request.get('op')}")
+            reply = self.dumps({'result': method(*request.get('args', ()), **request.get('kwargs', {}))})
+        except Exception as e:
+            reply = self.dumps({'error': str(e), 'type': type(e).__name__})
+        return (reply + '\n').encode('utf-8')
+
+    def _stream_events(self, conn, cursor):
+        cursor = self.events.cursor(cursor)
+        conn.sendall((json.dumps({'frames': [], 'last_id': cursor, 'missed': False}) + '\n').encode('utf-8'))
+        while True:
+            frames, cursor, missed = self.events.wait(cursor, EVENTS_HEARTBEAT)
+            if frames:
+                batch = {'frames': frames, 'last_id': cursor, 'missed': missed}
+                conn.sendall((json.dumps(batch) + '\n').encode('utf-8'))
+
+
+class ControlClient:
+    """Calls into the supervisor's ControlServer from an HTTP worker.
+
+    Each thread keeps one connection and makes one call at a time on it;
+    a connection found broken before the request went out is reopened
+    once, so a worker survives the supervisor restarting.
+    """
+
+    def __init__(self, path=CONTROL_SOCKET, timeout=CONTROL_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def call(self, op, *args, **kwargs):
+        request = (json.dumps({'op': op, 'args': args, 'kwargs': kwargs}) + '\n').encode('utf-8')
+        connection = getattr(self.local, 'connection', None)
+        try:
+            if connection is None:
+                raise ConnectionError("Not connected")
+            connection[0].sendall(request)
+        except OSError:
+            self._close()
+            connection = self.local.connection = self._connect()
+            connection[0].sendall(request)
+        try:
+            line = connection[1].readline()
+        except OSError:
+            self._close()
+            raise
+        if not line:
+            self._close()
+            raise ConnectionError("Supervisor closed the control connection")
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise ERRORS.get(reply['type'], RuntimeError)(reply['error'])
+        return reply['result']
+
+    def proxy(self, component, local=None):
+        return RemoteComponent(self, component, local)
+
+    def relay_events(self, event_bus):
+        """Mirror the supervisor's events into this process's EventBus from a background thread"""
+        self._start(self._relay, event_bus, name="event-relay")
+
+    def push_metrics(self, names, interval=METRICS_PUSH_INTERVAL):
+        """Send changes to the named metrics to the supervisor every `interval` seconds"""
+        self._start(self._push, names, interval, name="metrics-push")
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock, sock.makefile('rb')
+
+    def _close(self):
+        connection = getattr(self.local, 'connection', None)
+        self.local.connection = None
+        if connection:
+            connection[1].close()
+            connection[0].close()
+
+    def _start(self, target, *args, name):
+        threading.Thread(target=target, args=args, name=name, daemon=True).start()
+
+    def _relay(self, event_bus):
+        while True:
+            try:
+                sock, reader = self._connect()
+                sock.settimeout(None)
+                with sock, reader:
+                    cursor = event_bus.last_id or None
+                    sock.sendall((json.dumps({'op': 'events.subscribe', 'cursor': cursor}) + '\n').encode('utf-8'))
+                    for line in reader:
+                        batch = json.loads(line)
+                        event_bus.relay(batch['frames'], batch['last_id'], batch['missed'])
+            except (OSError, ValueError) as e:
+                logging.warning(f"Event relay from supervisor interrupted: {e}")
+            time.sleep(1)
+
+    def _push(self, names, interval):
+        sent = {}
+        while True:
+            time.sleep(interval)
+            deltas, pending = REGISTRY.deltas(names, sent)
+            if not deltas:
+                continue
+            try:
+                self.call('metrics.merge', deltas)
+                sent = pending
+            except OSError as e:
+                logging.warning(f"Could not push metrics to supervisor: {e}")
+
+
+class RemoteComponent:
+    """Stand-in for a supervisor component: method calls become control calls.
+
+    Methods that `local` has are called on it instead, for reads a worker
+    can answer from the shared stores itself.
+    """
+
+    def __init__(self, client, name, local=None):
+        self.client = client
+        self.name = name
+        self.local = local
+
+    def __getattr__(self, method):
+        if self.local is not None and hasattr(self.local, method):
+            return getattr(self.local, method)
+        return functools.partial(self.client.call, f"{self.name}.{method}")
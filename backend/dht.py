@@ -0,0 +1,456 @@
+import socket
+import json
+import threading
+import time
+import os
+import hashlib
+import logging
+import queue
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from config import (DHT_HOST, DHT_PORT, DHT_K, DHT_ALPHA, DHT_RPC_TIMEOUT,
+                    DHT_PROVIDER_TTL, DHT_REPUBLISH_INTERVAL, DHT_ANNOUNCE_CHECK_INTERVAL, TCP_PORT)
+
+ID_BITS = 160
+MAX_DATAGRAM = 65507
+
+
+def content_key(content_hash):
+    """Map a file content hash onto the 160-bit DHT key space"""
+    return int(hashlib.sha1(content_hash.encode('utf-8')).hexdigest(), 16)
+
+
+class Contact:
+    """A remote DHT node"""
+    __slots__ = ('id', 'host', 'port', 'last_seen')
+
+    def __init__(self, node_id, host, port):
+        self.id = node_id
+        self.host = host
+        self.port = port
+        self.last_seen = time.time()
+
+    @property
+    def address(self):
+        return (self.host, self.port)
+
+    def to_dict(self):
+        return {'id': format(self.id, 'x'), 'host': self.host, 'port': self.port}
+
+
+class RoutingTable:
+    """Kademlia routing table: one LRU-ordered k-bucket per distance bit"""
+
+    def __init__(self, node_id, k=DHT_K):
+        self.node_id = node_id
+        self.k = k
+        self.buckets = [[] for _ in range(ID_BITS)]
+        self.lock = threading.Lock()
+
+    def bucket_index(self, node_id):
+        return (self.node_id ^ node_id).bit_length() - 1
+
+    def update(self, contact):
+        """Record that we heard from a contact.
+
+        Returns the least recently seen contact of a full bucket so the
+        caller can ping it and decide on eviction, otherwise None.
+        """
+        if contact.id == self.node_id:
+            return None
+
+        with self.lock:
+            bucket = self.buckets[self.bucket_index(contact.id)]
+            for i, existing in enumerate(bucket):
+                if existing.id == contact.id:
+                    del bucket[i]
+                    existing.host, existing.port = contact.host, contact.port
+                    existing.last_seen = time.time()
+                    bucket.append(existing)
+                    return None
+
+            if len(bucket) < self.k:
+                bucket.append(contact)
+                return None
+
+            return bucket[0]
+
+    def replace(self, stale, contact):
+        """Evict an unresponsive contact in favour of a new one"""
+        with self.lock:
+            bucket = self.buckets[self.bucket_index(stale.id)]
+            if stale in bucket:
+                bucket.remove(stale)
+                bucket.append(contact)
+
+    def remove(self, node_id):
+        with self.lock:
+            bucket = self.buckets[self.bucket_index(node_id)]
+            bucket[:] = [c for c in bucket if c.id != node_id]
+
+    def find_closest(self, target, count=None, exclude=None):
+        """Return the `count` known contacts closest to target"""
+        with self.lock:
+            contacts = [c for bucket in self.buckets for c in bucket if c.id != exclude]
+        contacts.sort(key=lambda c: c.id ^ target)
+        return contacts[:count or self.k]
+
+    def __len__(self):
+        with self.lock:
+            return sum(len(bucket) for bucket in self.buckets)
+
+
+class DHTNode:
+    """Kademlia-style DHT that maps content hashes to the peers providing them.
+
+    Nodes talk JSON over UDP. Each node keeps a routing table of other DHT
+    nodes and a store of provider records; a lookup walks towards the key
+    in O(log N) hops, asking `alpha` nodes in parallel per round.
+    """
+
+    def __init__(self, host=DHT_HOST, port=DHT_PORT, tcp_port=TCP_PORT, node_name=None,
+                 k=DHT_K, alpha=DHT_ALPHA, rpc_timeout=DHT_RPC_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.tcp_port = tcp_port
+        self.node_name = node_name
+        self.k = k
+        self.alpha = alpha
+        self.rpc_timeout = rpc_timeout
+        self.node_id = int.from_bytes(os.urandom(ID_BITS // 8), 'big')
+        self.routing_table = RoutingTable(self.node_id, k)
+        self.providers = {}  # {key: {peer_id: (record, expires_at)}}
+        self.providers_lock = threading.Lock()
+        self.pending = {}  # {rpc_id: [event, response]}
+        self.pending_lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=alpha * 2, thread_name_prefix='dht')
+        self.provider_source = None
+        self.announcements = queue.Queue()  # Content hashes to publish now
+        self.published_at = 0
+        self.socket = None
+        self.running = False
+
+    # ------------------------------------------------------------------
+    # Lifecycle
+    # ------------------------------------------------------------------
+
+    def start(self, provider_source=None):
+        """Bind the UDP socket and start the receive and announce threads.
+
+        provider_source is an optional callable returning the content hashes
+        this node should announce. They are published on joining the network,
+        as soon as the routing table has a contact, and every republish
+        interval after that.
+        """
+        self.provider_source = provider_source
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((self.host, self.port))
+        self.port = self.socket.getsockname()[1]
+        self.running = True
+
+        threading.Thread(target=self._receive_loop, daemon=True).start()
+        if provider_source:
+            threading.Thread(target=self._announce_loop, daemon=True).start()
+
+        logging.info(f"DHT node {format(self.node_id, 'x')[:8]} listening on {self.host}:{self.port}")
+
+    def stop(self):
+        """Stop the DHT node"""
+        self.running = False
+        if self.socket:
+            self.socket.close()
+        self.executor.shutdown(wait=False)
+
+    def bootstrap(self, addresses):
+        """Join the network through known (host, port) DHT addresses"""
+        joined = False
+        for address in addresses:
+            if self.ping(tuple(address)):
+                joined = True
+
+        if joined:
+            # Looking up our own ID fills the buckets near us
+            self.lookup(self.node_id)
+            if self.provider_source:
+                self.publish_all()
+        return joined
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def own_record(self):
+        """Provider record describing this node's TCP file server"""
+        return {'port': self.tcp_port, 'name': self.node_name}
+
+    def publish(self, content_hash):
+        """Announce this node as a provider of content_hash"""
+        key = content_key(content_hash)
+        record = self.own_record()
+        self._store_provider(key, record, self._local_address())
+
+        closest = self.lookup(key)
+        for contact in closest:
+            self.executor.submit(self._rpc, contact.address, 'dht_add_provider',
+                                 key=format(key, 'x'), record=record)
+        return len(closest)
+
+    def publish_all(self):
+        """Announce every content hash from the provider source"""
+        self.published_at = time.time()
+        for content_hash in self.provider_source():
+            if not self.running:
+                return
+            self.publish(content_hash)
+
+    def announce(self, content_hash):
+        """Publish content_hash in the background, e.g. for a file just added"""
+        if content_hash:
+            self.announcements.put(content_hash)
+
+    def locate(self, content_hash, max_providers=None):
+        """Find peers providing content_hash without any broadcast"""
+        key = content_key(content_hash)
+        providers = self._get_providers(key)
+        if max_providers and len(providers) >= max_providers:
+            return providers[:max_providers]
+
+        _, found = self._iterative_find(key, find_providers=True, max_providers=max_providers)
+        seen = {p['peer_id'] for p in providers}
+        for record in found:
+            if record['peer_id'] not in seen:
+                seen.add(record['peer_id'])
+                providers.append(record)
+
+        return providers[:max_providers] if max_providers else providers
+
+    def lookup(self, target):
+        """Return the k closest live contacts to target"""
+        closest, _ = self._iterative_find(target)
+        return closest
+
+    def ping(self, address):
+        """Ping a DHT address; adds it to the routing table on success"""
+        return self._rpc(address, 'dht_ping') is not None
+
+    def get_info(self):
+        """Summary of the node's state"""
+        with self.providers_lock:
+            keys = len(self.providers)
+        return {
+            'node_id': format(self.node_id, 'x'),
+            'port': self.port,
+            'contacts': len(self.routing_table),
+            'provider_keys': keys
+        }
+
+    # ------------------------------------------------------------------
+    # Iterative lookup
+    # ------------------------------------------------------------------
+
+    def _iterative_find(self, target, find_providers=False, max_providers=None):
+        shortlist = {c.id: c for c in self.routing_table.find_closest(target, self.k)}
+        queried = set()
+        providers = []
+        provider_ids = set()
+        command = 'dht_find_providers' if find_providers else 'dht_find_node'
+
+        while True:
+            candidates = sorted(
+                (c for c in shortlist.values() if c.id not in queried),
+                key=lambda c: c.id ^ target
+            )
+            closest_known = sorted(shortlist.values(), key=lambda c: c.id ^ target)[:self.k]
+            candidates = [c for c in candidates if c in closest_known][:self.alpha]
+            if not candidates:
+                break
+
+            futures = {}
+            for contact in candidates:
+                queried.add(contact.id)
+                future = self.executor.submit(self._rpc, contact.address, command,
+                                              key=format(target, 'x'))
+                futures[future] = contact
+
+            progressed = False
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    contact = futures[future]
+                    response = future.result()
+                    if response is None:
+                        shortlist.pop(contact.id, None)
+                        continue
+
+                    for record in response.get('providers', []):
+                        if record['peer_id'] not in provider_ids:
+                            provider_ids.add(record['peer_id'])
+                            providers.append(record)
+
+                    for node in response.get('nodes', []):
+                        node_id = int(node['id'], 16)
+                        if node_id == self.node_id or node_id in shortlist:
+                            continue
+                        shortlist[node_id] = Contact(node_id, node['host'], node['port'])
+                        progressed = True
+
+            if find_providers and providers and (not max_providers or len(providers) >= max_providers):
+                break
+            if not progressed and all(c.id in queried for c in
+                                      sorted(shortlist.values(), key=lambda c: c.id ^ target)[:self.k]):
+                break
+
+        closest = sorted(shortlist.values(), key=lambda c: c.id ^ target)[:self.k]
+        return closest, providers
+
+    # ------------------------------------------------------------------
+    # Provider store
+    # ------------------------------------------------------------------
+
+    def _store_provider(self, key, record, address):
+        ip = address[0]
+        port = int(record.get('port', TCP_PORT))
+        peer_id = f"{ip}:{port}"
+        stored = {
+            'peer_id': peer_id,
+            'ip': ip,
+            'port': port,
+            'name': record.get('name') or peer_id
+        }
+        with self.providers_lock:
+            self.providers.setdefault(key, {})[peer_id] = (stored, time.time() + DHT_PROVIDER_TTL)
+
+    def _get_providers(self, key):
+        now = time.time()
+        with self.providers_lock:
+            entries = self.providers.get(key)
+            if not entries:
+                return []
+            expired = [peer_id for peer_id, (_, expires) in entries.items() if expires <= now]
+            for peer_id in expired:
+                del entries[peer_id]
+            if not entries:
+                del self.providers[key]
+                return []
+            return [record for record, _ in entries.values()]
+
+    def _local_address(self):
+        host = self.host
+        if host in ('0.0.0.0', ''):
+            try:
+                host = socket.gethostbyname(socket.gethostname())
+            except OSError:
+                host = '127.0.0.1'
+        return (host, self.port)
+
+    # ------------------------------------------------------------------
+    # Networking
+    # ------------------------------------------------------------------
+
+    def _rpc(self, address, msg_type, **payload):
+        """Send a request and wait for its reply; returns None on timeout"""
+        rpc_id = os.urandom(8).hex()
+        entry = [threading.Event(), None]
+        with self.pending_lock:
+            self.pending[rpc_id] = entry
+
+        message = {
+            'type': msg_type,
+            'rpc_id': rpc_id,
+            'sender': format(self.node_id, 'x'),
+            **payload
+        }
+        try:
+            self.socket.sendto(json.dumps(message).encode('utf-8'), address)
+            if not entry[0].wait(self.rpc_timeout):
+                return None
+            return entry[1]
+        except OSError as e:
+            logging.debug(f"DHT rpc {msg_type} to {address} failed: {e}")
+            return None
+        finally:
+            with self.pending_lock:
+                self.pending.pop(rpc_id, None)
+
+    def _receive_loop(self):
+        while self.running:
+            try:
+                data, address = self.socket.recvfrom(MAX_DATAGRAM)
+            except OSError:
+                if self.running:
+                    logging.error("DHT socket error", exc_info=True)
+                break
+
+            try:
+                message = json.loads(data.decode('utf-8'))
+                self._handle_message(message, address)
+            except Exception as e:
+                logging.debug(f"Ignoring bad DHT datagram from {address}: {e}")
+
+    def _handle_message(self, message, address):
+        sender = Contact(int(message['sender'], 16), address[0], address[1])
+        stale = self.routing_table.update(sender)
+        if stale is not None:
+            self.executor.submit(self._check_stale, stale, sender)
+
+        rpc_id = message.get('rpc_id')
+        if message.get('status'):
+            with self.pending_lock:
+                entry = self.pending.get(rpc_id)
+            if entry:
+                entry[1] = message
+                entry[0].set()
+            return
+
+        response = self._process_request(message, address, sender)
+        if response is not None:
+            response['rpc_id'] = rpc_id
+            response['sender'] = format(self.node_id, 'x')
+            self.socket.sendto(json.dumps(response).encode('utf-8'), address)
+
+    def _process_request(self, message, address, sender):
+        msg_type = message.get('type')
+
+        if msg_type == 'dht_ping':
+            return {'status': 'success'}
+
+        if msg_type == 'dht_find_node':
+            target = int(message['key'], 16)
+            nodes = self.routing_table.find_closest(target, self.k, exclude=sender.id)
+            return {'status': 'success', 'nodes': [c.to_dict() for c in nodes]}
+
+        if msg_type == 'dht_find_providers':
+            key = int(message['key'], 16)
+            nodes = self.routing_table.find_closest(key, self.k, exclude=sender.id)
+            return {
+                'status': 'success',
+                'providers': self._get_providers(key)[:self.k],
+                'nodes': [c.to_dict() for c in nodes]
+            }
+
+        if msg_type == 'dht_add_provider':
+            self._store_provider(int(message['key'], 16), message.get('record', {}), address)
+            return {'status': 'success'}
+
+        return {'status': 'error', 'message': 'Unknown command'}
+
+    def _check_stale(self, stale, contact):
+        """Kademlia eviction: keep the old contact if it still answers"""
+        if self._rpc(stale.address, 'dht_ping') is None:
+            self.routing_table.replace(stale, contact)
+
+    def _announce_loop(self):
+        while self.running:
+            try:
+                content_hash = self.announcements.get(timeout=DHT_ANNOUNCE_CHECK_INTERVAL)
+            except queue.Empty:
+                content_hash = None
+            try:
+                if content_hash:
+                    self.publish(content_hash)
+                elif len(self.routing_table) and time.time() - self.published_at >= DHT_REPUBLISH_INTERVAL:
+                    # First contact (publishing into an empty table reaches no one) or time to refresh
+                    self.publish_all()
+            except Exception as e:
+                logging.error(f"Error publishing DHT provider records: {e}")
@@ -0,0 +1,78 @@
+import json
+import threading
+from collections import deque
+from config import EVENTS_HISTORY
+
+
+class EventBus:
+    """In-process publish/subscribe for change notifications.
+
+    Every event is serialized once, on publish, into a Server-Sent Events
+    frame and appended to a ring of the last `history` events with a
+    sequential id. Subscribers don't get queues of their own: each keeps
+    the id of the last event it saw and wait() hands back everything newer
+    from the shared ring, so a publish costs the same however many streams
+    are open and an idle stream costs one blocked thread.
+    """
+
+    def __init__(self, history=EVENTS_HISTORY, dumps=json.dumps):
+        self.dumps = dumps
+        self.events = deque(maxlen=history)  # [(event_id, frame)]
+        self.last_id = 0
+        self.cond = threading.Condition()
+
+    def publish(self, event_type, data):
+        payload = self.dumps(data)
+        with self.cond:
+            self.last_id += 1
+            frame = f"id: {self.last_id}\nevent: {event_type}\ndata: {payload}\n\n"
+            self.events.append((self.last_id, frame))
+            self.cond.notify_all()
+
+    def relay(self, frames, last_id, missed=False):
+        """Append frames published on another process's bus, keeping its ids.
+
+        `frames` are the events up to `last_id`, as returned by that bus's
+        wait(). If they don't follow on from the last relayed event the
+        history is dropped, so subscribers behind the gap are told to resync.
+        """
+        with self.cond:
+            first_id = last_id - len(frames) + 1
+            if missed or first_id != self.last_id + 1:
+                self.events.clear()
+            self.events.extend(zip(range(first_id, last_id + 1), frames))
+            self.last_id = last_id
+            self.cond.notify_all()
+
+    def cursor(self, last_event_id=None):
+        """Starting position for a subscriber; a Last-Event-ID resumes after that event"""
+        with self.cond:
+            try:
+                last_event_id = int(last_event_id)
+            except (TypeError, ValueError):
+                return self.last_id
+            # An id from before a restart can't be replayed; start fresh
+            return last_event_id if last_event_id <= self.last_id else self.last_id
+
+    def wait(self, cursor, timeout=None):
+        """Frames published after `cursor`, waiting up to `timeout` for the first one.
+
+        Returns (frames, cursor, missed): the new cursor to pass next time and
+        whether events after the old cursor already fell out of the history,
+        in which case the subscriber has to reload its state.
+        """
+        with self.cond:
+            if cursor > self.last_id:
+                # Only on a relayed bus, when the bus it follows restarted
+                return [], self.last_id, True
+            if self.last_id <= cursor:
+                self.cond.wait_for(lambda: self.last_id > cursor, timeout)
+            if self.last_id <= cursor:
+                return [], cursor, False
+            if not self.events:
+                return [], self.last_id, True
+            first_id = self.events[0][0]
+            missed = cursor < first_id - 1
+            start = max(cursor + 1 - first_id, 0)
+            frames = [self.events[i][1] for i in range(start, len(self.events))]
+            return frames, self.last_id, missed
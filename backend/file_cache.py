@@ -0,0 +1,155 @@
+import logging
+import threading
+from collections import OrderedDict
+from config import FILE_CACHE_SIZE, FILE_CACHE_MAX_FILE_SIZE, FILE_CACHE_SKETCH_WIDTH
+from metrics import FILE_CACHE_REQUESTS, FILE_CACHE_BYTES, FILE_CACHE_FILES
+
+SKETCH_DEPTH = 4
+SKETCH_MAX_COUNT = 15  # Counts saturate here; only the order of popularity matters
+
+
+class FrequencySketch:
+    """Count-min sketch of recent request counts, halved periodically so old popularity fades"""
+
+    def __init__(self, width=FILE_CACHE_SKETCH_WIDTH):
+        self.mask = (1 << max(width - 1, 1).bit_length()) - 1  # Width rounded up to a power of two
+        self.rows = [bytearray(self.mask + 1) for _ in range(SKETCH_DEPTH)]
+        self.sample_size = 10 * (self.mask + 1)
+        self.additions = 0
+
+    def _indexes(self, key):
+        return [hash((row, key)) & self.mask for row in range(SKETCH_DEPTH)]
+
+    def increment(self, key):
+        for row, i in zip(self.rows, self._indexes(key)):
+            if row[i] < SKETCH_MAX_COUNT:
+                row[i] += 1
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.rows = [bytearray(count >> 1 for count in row) for row in self.rows]
+            self.additions //= 2
+
+    def estimate(self, key):
+        return min(row[i] for row, i in zip(self.rows, self._indexes(key)))
+
+
+class FileCache:
+    """Contents of popular small shared files, kept in memory for downloads.
+
+    Entries are keyed by path and valid for the (size, mtime_ns) the file
+    was read at, so a changed file is never served from memory even in
+    processes that don't watch the directory. Admission follows TinyLFU:
+    every lookup is counted in a FrequencySketch, and once the byte budget
+    is full a file only gets in if it has been requested more often than
+    each least recently used entry it would displace. A file seen once
+    therefore can't flush out files many peers keep pulling.
+    """
+
+    def __init__(self, max_bytes=FILE_CACHE_SIZE, max_file_size=FILE_CACHE_MAX_FILE_SIZE,
+                 sketch_width=FILE_CACHE_SKETCH_WIDTH):
+        self.max_bytes = max_bytes
+        self.max_file_size = min(max_file_size, max_bytes)
+        self.sketch = FrequencySketch(sketch_width)
+        self.entries = OrderedDict()  # {path: ((size, mtime_ns), data)}, least recently used first
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def read(self, path, stat):
+        """Contents of the file at `path` with os.stat() result `stat`, from memory if possible.
+
+        Returns None when the file is too large to cache or isn't admitted;
+        the caller then reads it from disk as usual.
+        """
+        if stat.st_size > self.max_file_size:
+            return None
+        version = (stat.st_size, stat.st_mtime_ns)
+        with self.lock:
+            self.sketch.increment(path)
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(path)
+                self.hits += 1
+                FILE_CACHE_REQUESTS.labels('hit').inc()
+                return entry[1]
+            self.misses += 1
+            FILE_CACHE_REQUESTS.labels('miss').inc()
+            if entry is not None:
+                self._remove(path)
+            if not self._victims(path, stat.st_size):
+                return None
+
+        try:
+            with open(path, 'rb') as f:
+                data = f.read(stat.st_size + 1)
+        except OSError as e:
+            logging.debug(f"Not caching {path}: {e}")
+            return None
+        if len(data) != stat.st_size:  # Changed while we read it
+            return None
+
+        with self.lock:
+            victims = self._victims(path, len(data))
+            if victims:
+                for victim in victims:
+                    if victim != path:
+                        self._remove(victim)
+                self._remove(path)
+                self.entries[path] = (version, data)
+                self.bytes += len(data)
+                FILE_CACHE_BYTES.inc(len(data))
+                FILE_CACHE_FILES.inc()
+        return data
+
+    def _victims(self, path, size):
+        """Entries to evict to admit `size` bytes for `path`: [] if it isn't admitted.
+
+        The result always holds at least `path` itself, so an empty list
+        unambiguously means no. Caller holds self.lock.
+        """
+        current = self.entries.get(path)
+        needed = self.bytes - (len(current[1]) if current else 0) + size - self.max_bytes
+        victims = [path]
+        if needed <= 0:
+            return victims
+        frequency = self.sketch.estimate(path)
+        for victim, (_, data) in self.entries.items():
+            if victim == path:
+                continue
+            if self.sketch.estimate(victim) >= frequency:
+                return []
+            victims.append(victim)
+            needed -= len(data)
+            if needed <= 0:
+                return victims
+        return []
+
+    def invalidate(self, path):
+        with self.lock:
+            self._remove(path)
+
+    def clear(self):
+        with self.lock:
+            for path in list(self.entries):
+                self._remove(path)
+
+    def _remove(self, path):
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.bytes -= len(entry[1])
+            FILE_CACHE_BYTES.dec(len(entry[1]))
+            FILE_CACHE_FILES.dec()
+
+    def stats(self):
+        """Hit counts and memory use of this process's cache"""
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                'files': len(self.entries),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / requests, 4) if requests else None
+            }
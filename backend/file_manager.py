@@ -1,12 +1,70 @@
 import os
 import hashlib
+import threading
 import mimetypes
+import time
+import uuid
 from datetime import datetime
-from config import SHARED_FILES_DIR, ALLOWED_EXTENSIONS
+from stat import S_ISREG
+from config import SHARED_FILES_DIR, INCOMING_DIR, ALLOWED_EXTENSIONS, UPLOAD_BLOCK_SIZE
+from read_ahead import hash_file
+from metrics import observe_hash
+
+LISTING_COLUMNS = ('name', 'size', 'mtime', 'hash')  # Fields of a compact (columnar) listing
+
+def catalog_version(files):
+    """Digest identifying the contents of a file listing"""
+    return _listing_digest((f.get('name'), f.get('size'), f.get('hash')) for f in files)
+
+def columns_version(columns):
+    """catalog_version() of a columnar listing; both forms of one listing get the same version"""
+    return _listing_digest(zip(columns['name'], columns['size'], columns['hash']))
+
+def _listing_digest(entries):
+    digest = hashlib.sha1()
+    for name, size, file_hash in sorted(entries):
+        digest.update(f"{name}\0{size}\0{file_hash}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def format_file_size(size_bytes):
+    """Convert bytes to human readable format"""
+    if size_bytes == 0:
+        return "0 B"
+    
+    size_names = ["B", "KB", "MB", "GB", "TB"]
+    i = 0
+    while size_bytes >= 1024 and i < len(size_names) - 1:
+        size_bytes /= 1024.0
+        i += 1
+    
+    return f"{size_bytes:.1f} {size_names[i]}"
+
+def describe_file(name, size, mtime, file_hash):
+    """File info as returned by /api/files, from the fields a compact listing carries"""
+    modified = datetime.fromtimestamp(mtime)
+    return {
+        'name': name,
+        'size': size,
+        'size_human': format_file_size(size),
+        'modified': modified.isoformat(),
+        'modified_human': modified.strftime('%Y-%m-%d %H:%M:%S'),
+        'type': mimetypes.guess_type(name)[0] or 'application/octet-stream',
+        'extension': os.path.splitext(name)[1].lower(),
+        'hash': file_hash
+    }
+
+def expand_columns(columns):
+    """File info dicts from a columnar listing"""
+    return [describe_file(*entry) for entry in zip(*(columns[column] for column in LISTING_COLUMNS))]
 
 class FileManager:
-    def __init__(self):
+    def __init__(self, hash_store=None):
+        """hash_store (a HashStore) keeps hashes across restarts and shares them between processes"""
         self.shared_dir = SHARED_FILES_DIR
+        self.hash_cache = {}  # {file_path: (size, mtime_ns, hash)}
+        self.hash_lock = threading.Lock()
+        self.hashing = set()  # Paths being hashed by hash_in_background()
+        self.hash_store = hash_store
         
     def list_files(self):
         """Get list of all files in shared directory with metadata"""
@@ -35,44 +93,83 @@ class FileManager:
                 return None
                 
             stat = os.stat(file_path)
-            
-            return {
-                'name': filename,
-                'size': stat.st_size,
-                'size_human': self.format_file_size(stat.st_size),
-                'modified': datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                'modified_human': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
-                'type': mimetypes.guess_type(filename)[0] or 'application/octet-stream',
-                'extension': os.path.splitext(filename)[1].lower(),
-                'hash': self.get_file_hash(file_path)
-            }
+            return describe_file(filename, stat.st_size, stat.st_mtime, self.get_file_hash(file_path, stat))
         except Exception as e:
             print(f"Error getting file info for {filename}: {e}")
             return None
     
-    def get_file_hash(self, file_path):
-        """Calculate MD5 hash of file"""
+    def list_columns(self):
+        """Compact listing: one list per LISTING_COLUMNS field, mtime in seconds.
+        
+        Carries only what a client can't derive; the human-readable size,
+        dates, type and extension of get_file_info are left to it (see
+        expand_columns). One scandir pass, no per-file dicts.
+        """
+        names, sizes, mtimes, hashes = [], [], [], []
+        with os.scandir(self.shared_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    names.append(entry.name)
+                    sizes.append(stat.st_size)
+                    mtimes.append(stat.st_mtime)
+                    hashes.append(self.get_file_hash(entry.path, stat))
+        return {'name': names, 'size': sizes, 'mtime': mtimes, 'hash': hashes}
+    
+    def get_file_hash(self, file_path, stat=None):
+        """Calculate MD5 hash of file, reusing the last result while size and mtime match"""
         try:
-            hash_md5 = hashlib.md5()
-            with open(file_path, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_md5.update(chunk)
-            return hash_md5.hexdigest()
+            stat = stat or os.stat(file_path)
+            file_hash = self.cached_hash(file_path, stat)
+            if file_hash:
+                return file_hash
+            
+            file_hash = self._hash_file(file_path, stat.st_size)
+            self._cache_hash(file_path, stat, file_hash)
+            return file_hash
         except Exception:
             return None
     
-    def format_file_size(self, size_bytes):
-        """Convert bytes to human readable format"""
-        if size_bytes == 0:
-            return "0 B"
+    def cached_hash(self, file_path, stat):
+        """The file's MD5 if already known for its current size and mtime, else None; never reads the file"""
+        with self.hash_lock:
+            cached = self.hash_cache.get(file_path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        if self.hash_store:
+            file_hash = self.hash_store.get(file_path, stat.st_size, stat.st_mtime_ns)
+            if file_hash:
+                with self.hash_lock:
+                    self.hash_cache[file_path] = (stat.st_size, stat.st_mtime_ns, file_hash)
+                return file_hash
+        return None
+    
+    def hash_in_background(self, file_path):
+        """Hash a file on its own thread so the result is cached, unless that is already under way"""
+        with self.hash_lock:
+            if file_path in self.hashing:
+                return
+            self.hashing.add(file_path)
         
-        size_names = ["B", "KB", "MB", "GB", "TB"]
-        i = 0
-        while size_bytes >= 1024 and i < len(size_names) - 1:
-            size_bytes /= 1024.0
-            i += 1
+        def run():
+            try:
+                self.get_file_hash(file_path)
+            finally:
+                with self.hash_lock:
+                    self.hashing.discard(file_path)
         
-        return f"{size_bytes:.1f} {size_names[i]}"
+        threading.Thread(target=run, daemon=True).start()
+    
+    def _hash_file(self, file_path, size):
+        started = time.perf_counter()
+        hash_md5 = hashlib.md5()
+        hash_file(file_path, hash_md5)
+        observe_hash(size, time.perf_counter() - started)
+        return hash_md5.hexdigest()
+    
+    def format_file_size(self, size_bytes):
+        """Convert bytes to human readable format"""
+        return format_file_size(size_bytes)
     
     def is_allowed_file(self, filename):
         """Check if file extension is allowed"""
@@ -86,15 +183,79 @@ class FileManager:
                 return False, "File type not allowed"
                 
             file_path = os.path.join(self.shared_dir, filename)
+            os.makedirs(INCOMING_DIR, exist_ok=True)
+            temp_path = os.path.join(INCOMING_DIR, f"{uuid.uuid4().hex}.upload")
             
-            with open(file_path, 'wb') as f:
-                f.write(file_data)
+            # Replace rather than rewrite, so downloads of the old version aren't cut short
+            try:
+                with open(temp_path, 'wb') as f:
+                    f.write(file_data)
+                os.replace(temp_path, file_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
                 
             return True, "File added successfully"
             
         except Exception as e:
             return False, f"Error adding file: {e}"
     
+    def save_stream(self, filename, stream, length=None, max_size=None, expected_hash=None):
+        """Write a file from a byte stream, hashing it on the way through.
+        
+        Data is read in UPLOAD_BLOCK_SIZE blocks into a temp file under
+        INCOMING_DIR and renamed into place once complete, so memory use is
+        one block whatever the file size. `length` is the declared size (the
+        stream must supply exactly that many bytes); `max_size` is enforced
+        while reading when no length was declared. The MD5 computed here is
+        stored in the hash cache so the file is not read again for listing;
+        `expected_hash` is the MD5 to check it against, in hex.
+        Returns (success, message, file_hash).
+        """
+        if not self.is_allowed_file(filename):
+            return False, "File type not allowed", None
+        
+        file_path = os.path.join(self.shared_dir, filename)
+        os.makedirs(INCOMING_DIR, exist_ok=True)
+        temp_path = os.path.join(INCOMING_DIR, f"{uuid.uuid4().hex}.upload")
+        hash_md5 = hashlib.md5()
+        received = 0
+        try:
+            with open(temp_path, 'wb') as f:
+                while True:
+                    block = stream.read(UPLOAD_BLOCK_SIZE)
+                    if not block:
+                        break
+                    received += len(block)
+                    if (length is not None and received > length) or (max_size and received > max_size):
+                        return False, "Upload larger than declared or allowed", None
+                    hash_md5.update(block)
+                    f.write(block)
+            
+            if length is not None and received != length:
+                return False, f"Incomplete upload: received {received} of {length} bytes", None
+            
+            file_hash = hash_md5.hexdigest()
+            if expected_hash and expected_hash.lower() != file_hash:
+                return False, "Checksum mismatch", None
+            
+            os.replace(temp_path, file_path)
+            self.remember_hash(file_path, file_hash)
+            return True, "File uploaded successfully", file_hash
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    
+    def remember_hash(self, file_path, file_hash):
+        """Seed the hash cache for a file whose digest is already known"""
+        self._cache_hash(file_path, os.stat(file_path), file_hash)
+    
+    def _cache_hash(self, file_path, stat, file_hash):
+        with self.hash_lock:
+            self.hash_cache[file_path] = (stat.st_size, stat.st_mtime_ns, file_hash)
+        if self.hash_store:
+            self.hash_store.put(file_path, stat.st_size, stat.st_mtime_ns, file_hash)
+    
     def remove_file(self, filename):
         """Remove a file from shared directory"""
         try:
@@ -108,3 +269,92 @@ class FileManager:
                 
         except Exception as e:
             return False, f"Error removing file: {e}"
+    
+    def shared_path(self, filename):
+        """Path of `filename` in the shared directory, or None if it isn't a plain file name"""
+        if not filename or filename in ('.', '..') or '/' in filename or '\\' in filename or '\0' in filename:
+            return None
+        return os.path.join(self.shared_dir, filename)
+    
+    def stat_shared(self, filename):
+        """(path, os.stat result) of a regular file in the shared directory; raises FileNotFoundError otherwise.
+        
+        Directories such as INCOMING_DIR are not shared files.
+        """
+        file_path = self.shared_path(filename)
+        if file_path is None:
+            raise FileNotFoundError(filename)
+        stat = os.stat(file_path)
+        if not S_ISREG(stat.st_mode):
+            raise FileNotFoundError(filename)
+        return file_path, stat
+    
+    def remove_files(self, filenames):
+        """Remove many files; returns one {name, success, message} per name, in order.
+        
+        Their hashes leave the cache and the hash store in one transaction.
+        """
+        results = []
+        removed = []
+        for filename in filenames:
+            file_path = self.shared_path(filename)
+            try:
+                if file_path is None:
+                    raise FileNotFoundError
+                os.remove(file_path)
+                removed.append(file_path)
+                results.append({'name': filename, 'success': True, 'message': "File removed successfully"})
+            except FileNotFoundError:
+                results.append({'name': filename, 'success': False, 'message': "File not found"})
+            except OSError as e:
+                results.append({'name': filename, 'success': False, 'message': f"Error removing file: {e}"})
+        with self.hash_lock:
+            for file_path in removed:
+                self.hash_cache.pop(file_path, None)
+        if self.hash_store and removed:
+            self.hash_store.forget(removed)
+        return results
+    
+    def stat_files(self, filenames, verify=False):
+        """File info for many files; returns one {name, success, file | message} per name, in order.
+        
+        With verify, each file is read and hashed again and the result is
+        compared with the indexed hash (`verified`); new hashes are stored
+        in one transaction.
+        """
+        results = []
+        rehashed = []
+        for filename in filenames:
+            try:
+                file_path, stat = self.stat_shared(filename)
+            except OSError:
+                results.append({'name': filename, 'success': False, 'message': "File not found"})
+                continue
+            if not verify:
+                info = describe_file(filename, stat.st_size, stat.st_mtime, self.get_file_hash(file_path, stat))
+                results.append({'name': filename, 'success': True, 'file': info})
+                continue
+            
+            with self.hash_lock:
+                cached = self.hash_cache.get(file_path)
+            indexed = self.hash_store.get(file_path, stat.st_size, stat.st_mtime_ns) if self.hash_store else None
+            if not indexed and cached and cached[:2] == (stat.st_size, stat.st_mtime_ns):
+                indexed = cached[2]
+            try:
+                file_hash = self._hash_file(file_path, stat.st_size)
+            except OSError as e:
+                results.append({'name': filename, 'success': False, 'message': f"Error reading file: {e}"})
+                continue
+            with self.hash_lock:
+                self.hash_cache[file_path] = (stat.st_size, stat.st_mtime_ns, file_hash)
+            rehashed.append((file_path, stat.st_size, stat.st_mtime_ns, file_hash))
+            results.append({
+                'name': filename,
+                'success': True,
+                'file': describe_file(filename, stat.st_size, stat.st_mtime, file_hash),
+                'verified': indexed == file_hash if indexed else None
+            })
+        if self.hash_store and rehashed:
+            self.hash_store.put_many(rehashed)
+        return results
+
@@ -0,0 +1,175 @@
+import mimetypes
+import os
+import uuid
+from flask import Response, request
+from werkzeug.http import http_date, parse_date, parse_range_header, quote_etag
+from werkzeug.wsgi import wrap_file
+from read_ahead import fadvise
+from config import DOWNLOAD_BLOCK_SIZE, DOWNLOAD_CACHE_CONTROL, DOWNLOAD_MAX_RANGES
+
+
+def read_range(f, start, length, block_size=DOWNLOAD_BLOCK_SIZE):
+    """Yield `length` bytes of an open file starting at `start`"""
+    f.seek(start)
+    remaining = length
+    while remaining > 0:
+        block = f.read(min(block_size, remaining))
+        if not block:
+            break
+        remaining -= len(block)
+        yield block
+
+
+def resolve_ranges(header, size):
+    """Satisfiable (start, length) pairs for a Range header, [] if none, None to ignore it"""
+    parsed = parse_range_header(header)
+    if parsed is None or parsed.units != 'bytes' or len(parsed.ranges) > DOWNLOAD_MAX_RANGES:
+        return None
+
+    ranges = []
+    for start, stop in parsed.ranges:
+        if start < 0:  # Suffix range: the last -start bytes
+            start, stop = max(size + start, 0), size
+        else:
+            stop = size if stop is None else min(stop, size)
+        if start < stop:
+            ranges.append((start, stop - start))
+    return ranges
+
+
+def etag_matches(header, etag):
+    """Weak comparison of an If-None-Match header against our ETag"""
+    if header.strip() == '*':
+        return True
+    tags = [tag.strip() for tag in header.split(',')]
+    return any(tag.removeprefix('W/') == etag.removeprefix('W/') for tag in tags)
+
+
+class _RangeReader:
+    """Ranges of one file for a response: sliced from cached contents, or read from the file.
+
+    Each range is announced to the kernel (WILLNEED) before it is read, so
+    the disk reads it ahead of the response as one run.
+    """
+
+    def __init__(self, file_path, content=None):
+        self.content = content
+        self.f = open(file_path, 'rb') if content is None else None
+
+    def read(self, start, length, block_size=DOWNLOAD_BLOCK_SIZE):
+        if self.f is not None:
+            fadvise(self.f.fileno(), start, length, 'POSIX_FADV_WILLNEED')
+            yield from read_range(self.f, start, length, block_size)
+            return
+        for offset in range(start, start + length, block_size):
+            yield self.content[offset:min(offset + block_size, start + length)]
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+
+
+class _ClosingIterator:
+    """Iterate a generator and close the file (or _RangeReader) behind it when the server is done"""
+
+    def __init__(self, iterator, f):
+        self.iterator = iterator
+        self.f = f
+
+    def __iter__(self):
+        return self.iterator
+
+    def close(self):
+        self.f.close()
+
+
+def send_shared_file(file_path, content_hash=None, cache=None):
+    """Response for a file in the shared directory, honouring conditional and Range requests.
+
+    The ETag is the file's content hash when one is known; otherwise it
+    is a weak validator made of the size and mtime, which If-Range
+    requests never match (RFC 9110 requires a strong one). Matching
+    If-None-Match / If-Modified-Since requests get 304 with no body. A
+    whole file or single range is served through the server's file
+    wrapper where possible, which uses sendfile() under gunicorn; several
+    ranges are served as multipart/byteranges. Unsatisfiable ranges get
+    416. Popular small files are served from memory when a FileCache is
+    given. Raises FileNotFoundError if the file does not exist.
+    """
+    stat = os.stat(file_path)
+    size = stat.st_size
+    mimetype = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Last-Modified': http_date(stat.st_mtime),
+        'Cache-Control': DOWNLOAD_CACHE_CONTROL
+    }
+    weak_etag = quote_etag(f'{size:x}-{stat.st_mtime_ns:x}', weak=True)
+    etag = quote_etag(content_hash) if content_hash else weak_etag
+    headers['ETag'] = etag
+
+    # Conditional GET; If-None-Match takes precedence over If-Modified-Since
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        # The weak ETag still validates copies fetched before the hash was known
+        if etag_matches(if_none_match, etag) or etag_matches(if_none_match, weak_etag):
+            return Response(status=304, headers=headers)
+    else:
+        since = parse_date(request.headers.get('If-Modified-Since'))
+        if since is not None and int(stat.st_mtime) <= since.timestamp():
+            return Response(status=304, headers=headers)
+
+    ranges = None
+    range_header = request.headers.get('Range')
+    if range_header:
+        # If-Range: only honour the range if the client's copy is still current
+        if_range = request.headers.get('If-Range')
+        if not if_range or if_range == headers['Last-Modified'] or (content_hash and if_range == etag):
+            ranges = resolve_ranges(range_header, size)
+
+    if ranges == []:
+        headers['Content-Range'] = f'bytes */{size}'
+        return Response(status=416, headers=headers)
+
+    content = cache.read(file_path, stat) if cache and request.method == 'GET' else None
+    if not ranges or len(ranges) == 1:
+        start, length = ranges[0] if ranges else (0, size)
+        if ranges:
+            headers['Content-Range'] = f'bytes {start}-{start + length - 1}/{size}'
+        headers['Content-Length'] = str(length)
+        if content is not None:
+            body = [content[start:start + length]]  # The whole file is the cached bytes object itself
+        elif 'wsgi.file_wrapper' in request.environ and (
+                start + length == size or
+                request.environ.get('SERVER_SOFTWARE', '').startswith('gunicorn')):
+            # File wrappers send to EOF; gunicorn's stops at Content-Length
+            f = open(file_path, 'rb')
+            f.seek(start)
+            body = wrap_file(request.environ, f, DOWNLOAD_BLOCK_SIZE)
+        else:
+            reader = _RangeReader(file_path, content)
+            body = _ClosingIterator(reader.read(start, length), reader)
+        return Response(body, status=206 if ranges else 200, headers=headers,
+                        mimetype=mimetype, direct_passthrough=True)
+
+    boundary = uuid.uuid4().hex
+    parts = []
+    for start, length in ranges:
+        part_header = (f'\r\n--{boundary}\r\nContent-Type: {mimetype}\r\n'
+                       f'Content-Range: bytes {start}-{start + length - 1}/{size}\r\n\r\n').encode('ascii')
+        parts.append((part_header, start, length))
+    closing = f'\r\n--{boundary}--\r\n'.encode('ascii')
+    headers['Content-Length'] = str(sum(len(h) + length for h, _, length in parts) + len(closing))
+
+    reader = _RangeReader(file_path, content)
+
+    def multipart():
+        for part_header, start, length in parts:
+            yield part_header
+            yield from reader.read(start, length)
+        yield closing
+
+    return Response(_ClosingIterator(multipart(), reader), status=206, headers=headers,
+                    content_type=f'multipart/byteranges; boundary={boundary}',
+                    direct_passthrough=True)
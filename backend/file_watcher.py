@@ -0,0 +1,84 @@
+import logging
+import os
+import threading
+import time
+from config import FILE_WATCH_INTERVAL
+
+
+class FileWatcher:
+    """Publishes changes to the shared directory on an EventBus.
+
+    The directory is scanned with scandir() every `interval` seconds and
+    compared by (size, mtime) with the previous scan. A new or modified
+    file is reported once it has been unchanged for a whole interval, so a
+    file still being copied in is hashed once rather than on every scan.
+    Events are `file.added` / `file.changed` with the file's info (as in
+    /api/files) and `file.removed` with its name; changes made by the API
+    and by anything else writing to the directory look the same.
+    Listeners are called with (name, old, new), each a (size, mtime_ns)
+    pair or None, for the same changes.
+    """
+
+    def __init__(self, file_manager, event_bus, interval=FILE_WATCH_INTERVAL):
+        self.file_manager = file_manager
+        self.events = event_bus
+        self.interval = interval
+        self.previous = {}  # {name: (size, mtime_ns)} from the last scan
+        self.reported = {}  # {name: (size, mtime_ns)} as last published
+        self.listeners = []
+        self.thread = None
+
+    def start(self):
+        if self.thread:
+            return
+        self.previous = self._scan()
+        self.reported = dict(self.previous)
+        self.thread = threading.Thread(target=self._run, name="file-watcher", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                logging.error(f"Error watching shared files: {e}")
+
+    def check(self):
+        """Compare one scan with the last and publish what settled"""
+        current = self._scan()
+        for name, stat in current.items():
+            if self.reported.get(name) == stat or self.previous.get(name) != stat:
+                continue
+            old = self.reported.get(name)
+            self.reported[name] = stat
+            self._notify(name, old, stat)
+            info = self.file_manager.get_file_info(name)
+            if info:
+                self.events.publish('file.changed' if old else 'file.added', info)
+
+        for name in [name for name in self.reported if name not in current]:
+            old = self.reported.pop(name)
+            self._notify(name, old, None)
+            self.events.publish('file.removed', {'name': name})
+        self.previous = current
+
+    def snapshot(self):
+        """{name: (size, mtime_ns)} for every file as last reported"""
+        return dict(self.reported)
+
+    def _notify(self, name, old, new):
+        for listener in self.listeners:
+            try:
+                listener(name, old, new)
+            except Exception as e:
+                logging.error(f"File watcher listener failed for {name}: {e}")
+
+    def _scan(self):
+        files = {}
+        with os.scandir(self.file_manager.shared_dir) as entries:
+            for entry in entries:
+                if entry.is_file():
+                    stat = entry.stat()
+                    files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+        return files
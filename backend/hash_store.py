@@ -0,0 +1,60 @@
+import logging
+import os
+import sqlite3
+import threading
+from config import HASH_DB_PATH
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_hashes (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    hash TEXT NOT NULL
+);
+"""
+
+
+class HashStore:
+    """File hashes in SQLite, valid while a file's size and mtime are unchanged.
+
+    Backs FileManager's in-memory hash cache, so a file is hashed once
+    rather than once per process and again after every restart. WAL mode
+    lets any number of processes read while one writes.
+    """
+
+    def __init__(self, db_path=HASH_DB_PATH):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def get(self, path, size, mtime_ns):
+        """Stored hash of `path` if it was taken at this size and mtime, else None"""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT hash FROM file_hashes WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (path, size, mtime_ns)).fetchone()
+        return row[0] if row else None
+
+    def put(self, path, size, mtime_ns, file_hash):
+        self.put_many([(path, size, mtime_ns, file_hash)])
+
+    def put_many(self, rows):
+        """Store (path, size, mtime_ns, hash) rows in one transaction"""
+        try:
+            with self.lock, self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, hash) VALUES (?, ?, ?, ?)",
+                    rows)
+        except sqlite3.Error as e:
+            logging.error(f"Error saving {len(rows)} file hashes: {e}")
+
+    def forget(self, paths):
+        """Drop the hashes of deleted files in one transaction"""
+        try:
+            with self.lock, self.conn:
+                self.conn.executemany("DELETE FROM file_hashes WHERE path = ?", [(path,) for path in paths])
+        except sqlite3.Error as e:
+            logging.error(f"Error removing {len(paths)} file hashes: {e}")
@@ -0,0 +1,203 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+from config import (HEALTH_CHECK_INTERVAL, HEALTH_CHECK_CONCURRENCY, HEALTH_CHECK_TIMEOUT,
+                    HEALTH_CHECK_MAX_BACKOFF, HEALTH_CHECK_BATCH_INTERVAL)
+
+
+class HealthScheduler:
+    """Runs peer health probes on a single event loop.
+
+    Every peer has a next-due time kept in a heap. Online peers are probed
+    every `interval` seconds with jitter so probes spread out over time;
+    offline peers back off exponentially up to `max_backoff`. At most
+    `concurrency` probes are in flight, and results are written back to the
+    peer table in batches.
+    """
+
+    JITTER = 0.2
+
+    def __init__(self, peer_discovery, interval=HEALTH_CHECK_INTERVAL,
+                 concurrency=HEALTH_CHECK_CONCURRENCY, timeout=HEALTH_CHECK_TIMEOUT,
+                 max_backoff=HEALTH_CHECK_MAX_BACKOFF, batch_interval=HEALTH_CHECK_BATCH_INTERVAL):
+        self.peer_discovery = peer_discovery
+        self.interval = interval
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.batch_interval = batch_interval
+
+        self.states = {}  # {peer_id: [next_due, consecutive_failures]}
+        self.heap = []  # [(due, seq, peer_id)], stale entries skipped lazily
+        self.counter = itertools.count()
+        self.in_flight = set()
+        self.results = []
+
+        self.loop = None
+        self.thread = None
+        self.running = False
+        self.ready = threading.Event()
+        self.start_lock = threading.Lock()
+
+    def start(self):
+        """Start the scheduler thread (idempotent)"""
+        with self.start_lock:
+            if self.thread:
+                return
+            self.running = True
+            self.loop = asyncio.new_event_loop()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        self.ready.wait()
+
+    def stop(self):
+        """Stop the scheduler"""
+        self.running = False
+        if self.loop:
+            self.loop.call_soon_threadsafe(self.wakeup.set)
+
+    def probe_now(self, peer_id):
+        """Probe a peer as soon as a concurrency slot is free"""
+        self.start()
+        self.loop.call_soon_threadsafe(self._schedule, peer_id, 0)
+
+    def probe_all(self, peer_ids):
+        """Probe the given peers as soon as possible, bounded by the concurrency limit"""
+        self.start()
+        self.loop.call_soon_threadsafe(self._schedule_many, list(peer_ids), 0)
+
+    def watch(self, peer_ids):
+        """Add peers to periodic probing, spread over one interval"""
+        self.start()
+        self.loop.call_soon_threadsafe(self._schedule_many, list(peer_ids), self.interval)
+
+    def get_backoff(self, peer_id):
+        """Consecutive failures and seconds until the next probe of a peer"""
+        state = self.states.get(peer_id)
+        if not state:
+            return None
+        return {
+            'failures': state[1],
+            'next_probe_in': max(0.0, state[0] - time.monotonic())
+        }
+
+    # ------------------------------------------------------------------
+    # Event loop side
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._main())
+        except Exception as e:
+            logging.error(f"Health scheduler stopped: {e}")
+
+    async def _main(self):
+        self.wakeup = asyncio.Event()
+        self.semaphore = asyncio.Semaphore(self.concurrency)
+        self.ready.set()
+        flusher = asyncio.ensure_future(self._flush_loop())
+
+        while self.running:
+            now = time.monotonic()
+            while self.heap and self.heap[0][0] <= now:
+                due, _, peer_id = heapq.heappop(self.heap)
+                state = self.states.get(peer_id)
+                if state is None or state[0] != due or peer_id in self.in_flight:
+                    continue
+
+                await self.semaphore.acquire()
+                self.in_flight.add(peer_id)
+                asyncio.ensure_future(self._probe(peer_id))
+                now = time.monotonic()
+
+            self.wakeup.clear()
+            timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        flusher.cancel()
+        self._flush()
+
+    def _schedule(self, peer_id, spread):
+        state = self.states.get(peer_id)
+        failures = state[1] if state else 0
+        due = time.monotonic() + (random.uniform(0, spread) if spread else 0)
+        if state and spread and state[0] <= due:
+            return  # Already due sooner
+        self.states[peer_id] = [due, failures]
+        heapq.heappush(self.heap, (due, next(self.counter), peer_id))
+        self.wakeup.set()
+
+    def _schedule_many(self, peer_ids, spread):
+        for peer_id in peer_ids:
+            self._schedule(peer_id, spread)
+
+    def _reschedule(self, peer_id, success):
+        state = self.states.get(peer_id)
+        if state is None:
+            return
+
+        if success:
+            state[1] = 0
+            delay = self.interval
+        else:
+            state[1] += 1
+            delay = min(self.interval * (2 ** state[1]), self.max_backoff)
+
+        state[0] = time.monotonic() + delay * random.uniform(1 - self.JITTER, 1 + self.JITTER)
+        heapq.heappush(self.heap, (state[0], next(self.counter), peer_id))
+
+    async def _probe(self, peer_id):
+        try:
+            address = self.peer_discovery.get_peer_address(peer_id)
+            if address is None:
+                self.states.pop(peer_id, None)
+                return
+
+            status, rtt = await self._ping(address)
+            self.results.append((peer_id, status, time.time(), rtt))
+            self._reschedule(peer_id, status == 'online')
+        finally:
+            self.in_flight.discard(peer_id)
+            self.semaphore.release()
+
+    async def _ping(self, address):
+        writer = None
+        started = time.monotonic()
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(address[0], address[1]), self.timeout)
+            writer.write(json.dumps({"type": "ping"}).encode('utf-8'))
+            await writer.drain()
+
+            response = await asyncio.wait_for(reader.read(1024), self.timeout)
+            rtt = time.monotonic() - started
+            response_data = json.loads(response.decode('utf-8'))
+            return ('online', rtt) if response_data.get('status') == 'success' else ('error', None)
+        except Exception:
+            return 'offline', None
+        finally:
+            if writer:
+                writer.close()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.batch_interval)
+            self._flush()
+
+    def _flush(self):
+        if not self.results:
+            return
+        batch, self.results = self.results, []
+        try:
+            self.peer_discovery.apply_health_results(batch)
+        except Exception as e:
+            logging.error(f"Error applying peer health results: {e}")
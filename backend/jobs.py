@@ -0,0 +1,423 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from config import JOB_DB_PATH, JOB_WORKERS, JOB_PROGRESS_INTERVAL, JOB_SPEED_SMOOTHING
+from transfer_scheduler import PRIORITY_CLASSES, ClassQueue, normalize_priority
+
+QUEUED = 'queued'
+RUNNING = 'running'
+PAUSED = 'paused'
+COMPLETED = 'completed'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    peer_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    content_hash TEXT,
+    priority TEXT NOT NULL DEFAULT 'normal',
+    state TEXT NOT NULL,
+    bytes_done INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    message TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    speed REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state);
+"""
+
+COLUMNS = ('job_id', 'peer_id', 'filename', 'content_hash', 'priority', 'state',
+           'bytes_done', 'total', 'message', 'created_at', 'started_at', 'finished_at', 'speed')
+
+
+def connect(db_path):
+    """Open the job database in WAL mode, creating or upgrading its table"""
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.executescript(SCHEMA)
+    columns = {row[1] for row in conn.execute('PRAGMA table_info(jobs)')}
+    if 'speed' not in columns:
+        conn.execute('ALTER TABLE jobs ADD COLUMN speed REAL')
+        conn.commit()
+    return conn
+
+
+class Job:
+    """One peer download and its progress"""
+    __slots__ = COLUMNS + ('seq', 'sampled_at', 'sampled_bytes', 'saved_at', 'abort',
+                           'running_as')
+
+    def __init__(self, job_id, peer_id, filename, content_hash=None, priority='normal', state=QUEUED,
+                 bytes_done=0, total=None, message=None, created_at=None, started_at=None,
+                 finished_at=None, speed=None):
+        self.job_id = job_id
+        self.peer_id = peer_id
+        self.filename = filename
+        self.content_hash = content_hash
+        self.priority = priority
+        self.state = state
+        self.bytes_done = bytes_done
+        self.total = total
+        self.message = message
+        self.created_at = created_at or time.time()
+        self.started_at = started_at
+        self.finished_at = finished_at
+        self.speed = speed  # bytes/second, smoothed
+        self.seq = 0
+        self.sampled_at = 0.0
+        self.sampled_bytes = 0
+        self.saved_at = 0.0
+        self.abort = None  # PAUSED or CANCELLED while a running job is being stopped
+        self.running_as = None  # Class whose worker slot a running job holds
+
+    def row(self):
+        return tuple(getattr(self, column) for column in COLUMNS)
+
+    def to_dict(self):
+        eta = None
+        if self.state == RUNNING and self.speed and self.total is not None:
+            eta = round(max(self.total - self.bytes_done, 0) / self.speed, 1)
+        return {
+            'job_id': self.job_id,
+            'peer_id': self.peer_id,
+            'filename': self.filename,
+            'hash': self.content_hash,
+            'priority': self.priority,
+            'state': self.state,
+            'bytes_done': self.bytes_done,
+            'total': self.total,
+            'progress': round(self.bytes_done / self.total, 4) if self.total else None,
+            'speed': round(self.speed) if self.speed is not None and self.state == RUNNING else None,
+            'eta': eta,
+            'message': self.message,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+
+class JobQueue:
+    """Background peer downloads run by a bounded pool of worker threads.
+
+    Jobs are kept in SQLite so a queued batch survives a restart; jobs that
+    were running when the process stopped are queued again and resume from
+    their partial file. Queued jobs are picked by priority class through a
+    ClassQueue (weighted fair share between classes, smallest file first
+    within a class). Progress is written at most once per
+    `progress_interval` per job. With an EventBus every write is also
+    published as a `job` event.
+    """
+
+    def __init__(self, transfer_coordinator, db_path=JOB_DB_PATH, workers=JOB_WORKERS,
+                 progress_interval=JOB_PROGRESS_INTERVAL, event_bus=None):
+        self.transfers = transfer_coordinator
+        self.events = event_bus
+        self.db_path = db_path
+        self.num_workers = workers
+        self.progress_interval = progress_interval
+
+        self.jobs = {}  # {job_id: Job}
+        self.queue = ClassQueue()  # Entries are (job_id, seq); stale ones skipped lazily
+        self.running = {priority: 0 for priority in PRIORITY_CLASSES}
+        self.state_counts = {}  # {state: jobs}, kept current by _set_state
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.available = threading.Condition(self.lock)
+        self.db_lock = threading.Lock()
+        self.workers = []
+
+        self.conn = connect(db_path)
+
+    def start(self):
+        """Load stored jobs and start the workers (idempotent)"""
+        with self.lock:
+            if self.workers:
+                return
+            self._load()
+            for i in range(self.num_workers):
+                worker = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                self.workers.append(worker)
+                worker.start()
+
+    def _load(self):
+        with self.db_lock:
+            rows = self.conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM jobs ORDER BY created_at").fetchall()
+        requeued = []
+        for row in rows:
+            job = Job(*row)
+            if job.priority not in PRIORITY_CLASSES:
+                job.priority = normalize_priority(None)
+            if job.state == RUNNING:
+                job.state = QUEUED
+                requeued.append(job)
+            self.jobs[job.job_id] = job
+            self.state_counts[job.state] = self.state_counts.get(job.state, 0) + 1
+            if job.state == QUEUED:
+                self._push(job)
+        if requeued:
+            self._save(requeued)
+        logging.info(f"Loaded {len(rows)} download jobs ({len(self.queue)} queued)")
+
+    # ------------------------------------------------------------------
+    # Public API
+    # ------------------------------------------------------------------
+
+    def submit(self, downloads):
+        """Queue downloads given as dicts with peer_id, filename and optional hash/priority/size.
+
+        Without a priority the peer's default class is used; without a size
+        the peer's cached catalog is consulted. Raises ValueError for an
+        unknown priority class, before anything is queued. Returns the
+        queued jobs as dicts.
+        """
+        peer_discovery = self.transfers.peer_discovery
+        sizes = {}  # {peer_id: {filename: size}} from cached catalogs
+        jobs = []
+        for d in downloads:
+            peer_id = d['peer_id']
+            priority = normalize_priority(d.get('priority'), peer_discovery.registry.get_priority(peer_id))
+            size = d.get('size')
+            if size is None:
+                if peer_id not in sizes:
+                    sizes[peer_id] = {f.get('name'): f.get('size')
+                                      for f in peer_discovery.registry.get_catalog(peer_id)}
+                size = sizes[peer_id].get(d['filename'])
+            jobs.append(Job(uuid.uuid4().hex, peer_id, d['filename'], d.get('hash'), priority,
+                            total=size))
+        self._save(jobs)
+        with self.lock:
+            for job in jobs:
+                self.jobs[job.job_id] = job
+                self.state_counts[QUEUED] = self.state_counts.get(QUEUED, 0) + 1
+                self._push(job)
+            self.available.notify_all()
+        return [job.to_dict() for job in jobs]
+
+    def get(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return job.to_dict() if job else None
+
+    def list(self, state=None, limit=None):
+        """Jobs, newest first, optionally filtered by state"""
+        with self.lock:
+            jobs = [job for job in self.jobs.values() if state is None or job.state == state]
+            jobs.sort(key=lambda job: job.created_at, reverse=True)
+            if limit:
+                jobs = jobs[:limit]
+            return [job.to_dict() for job in jobs]
+
+    def counts(self):
+        with self.lock:
+            return {state: count for state, count in self.state_counts.items() if count}
+
+    def cancel(self, job_id):
+        return self._stop(job_id, CANCELLED)
+
+    def pause(self, job_id):
+        return self._stop(job_id, PAUSED)
+
+    def resume(self, job_id):
+        """Queue a paused or failed job again; it continues from its partial file"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return False, "Job not found"
+            if job.state not in (PAUSED, FAILED):
+                return False, f"Job is {job.state}"
+            self._set_state(job, QUEUED)
+            job.message = None
+            job.finished_at = None
+            self._push(job)
+            self.available.notify()
+        self._save([job])
+        return True, "Job queued"
+
+    def set_priority(self, job_id, priority):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return False, "Job not found"
+            job.priority = normalize_priority(priority)
+            if job.state == QUEUED:
+                self._push(job)
+                self.available.notify_all()
+        self._save([job])
+        return True, "Priority updated"
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _push(self, job):
+        # Caller holds self.lock; a new seq invalidates older queue entries
+        self.seq += 1
+        job.seq = self.seq
+        size = job.total - job.bytes_done if job.total is not None else None
+        self.queue.push(job.priority, size, (job.job_id, job.seq))
+
+    def _set_state(self, job, state):
+        # Caller holds self.lock
+        self.state_counts[job.state] -= 1
+        self.state_counts[state] = self.state_counts.get(state, 0) + 1
+        job.state = state
+
+    def _stop(self, job_id, state):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return False, "Job not found"
+            if job.state in FINISHED_STATES or job.state == state:
+                return False, f"Job is {job.state}"
+            if job.state == RUNNING:
+                # The worker stops at the next chunk and records the state
+                job.abort = state
+                return True, "Job stopping"
+            self._set_state(job, state)
+            if state == CANCELLED:
+                job.finished_at = time.time()
+        if state == CANCELLED:
+            self._discard_partial(job)
+        self._save([job])
+        return True, f"Job {state}"
+
+    def _next_job(self):
+        with self.lock:
+            while True:
+                while True:
+                    free = self.num_workers - sum(self.running.values())
+                    priority = self.queue.pick_class(self.running, free)
+                    if priority is None:
+                        break
+                    job_id, seq = self.queue.pop(priority)
+                    job = self.jobs.get(job_id)
+                    if job is not None and job.seq == seq and job.state == QUEUED:
+                        self.running[job.priority] += 1
+                        job.running_as = job.priority
+                        self._set_state(job, RUNNING)
+                        job.started_at = time.time()
+                        job.abort = None
+                        job.sampled_at = time.monotonic()
+                        job.sampled_bytes = job.bytes_done
+                        return job
+                self.available.wait()
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            self._save([job])
+            try:
+                success, message = self.transfers.download(
+                    job.peer_id, job.filename, job.content_hash,
+                    progress=lambda done, total, job=job: self._progress(job, done, total),
+                    temp_name=job.job_id, priority=job.priority, size=job.total)
+            except Exception as e:
+                logging.error(f"Download job {job.job_id} failed: {e}")
+                success, message = False, str(e)
+            self._finish(job, success, message)
+
+    def _progress(self, job, done, total):
+        """Transfer progress callback; returning False stops the transfer"""
+        job.bytes_done = done
+        job.total = total
+
+        now = time.monotonic()
+        elapsed = now - job.sampled_at
+        if elapsed >= 0.5:
+            rate = (done - job.sampled_bytes) / elapsed
+            job.speed = rate if job.speed is None else (
+                JOB_SPEED_SMOOTHING * rate + (1 - JOB_SPEED_SMOOTHING) * job.speed)
+            job.sampled_at = now
+            job.sampled_bytes = done
+
+        if now - job.saved_at >= self.progress_interval:
+            job.saved_at = now
+            self._save([job])
+        return job.abort is None
+
+    def _finish(self, job, success, message):
+        with self.lock:
+            self.running[job.running_as] -= 1
+            self.available.notify_all()
+            if success:
+                self._set_state(job, COMPLETED)
+                if job.total is not None:
+                    job.bytes_done = job.total
+            elif job.abort:
+                self._set_state(job, job.abort)
+            else:
+                self._set_state(job, FAILED)
+            job.abort = None
+            job.message = message
+            if job.state != PAUSED:
+                job.finished_at = time.time()
+        if job.state == CANCELLED:
+            self._discard_partial(job)
+        self._save([job])
+        logging.info(f"Download job {job.job_id} ({job.filename} from {job.peer_id}) {job.state}")
+
+    def _discard_partial(self, job):
+        try:
+            os.remove(self.transfers.temp_path(job.job_id))
+        except FileNotFoundError:
+            pass
+        job.bytes_done = 0
+
+    def _save(self, jobs):
+        placeholders = ', '.join('?' * len(COLUMNS))
+        try:
+            with self.db_lock, self.conn:
+                self.conn.executemany(
+                    f"INSERT OR REPLACE INTO jobs ({', '.join(COLUMNS)}) VALUES ({placeholders})",
+                    [job.row() for job in jobs])
+        except sqlite3.Error as e:
+            logging.error(f"Error saving download jobs: {e}")
+        if self.events:
+            for job in jobs:
+                self.events.publish('job', job.to_dict())
+
+
+class JobReader:
+    """Read-only view of the jobs a JobQueue in another process keeps in SQLite.
+
+    HTTP workers answer job queries from the database instead of asking
+    the supervisor. Progress is as current as the queue's last write, at
+    most `progress_interval` behind.
+    """
+
+    def __init__(self, db_path=JOB_DB_PATH):
+        self.conn = connect(db_path)
+        self.lock = threading.Lock()
+
+    def get(self, job_id):
+        rows = self._select("WHERE job_id = ?", (job_id,))
+        return Job(*rows[0]).to_dict() if rows else None
+
+    def list(self, state=None, limit=None):
+        """Jobs, newest first, optionally filtered by state"""
+        where, params = ("WHERE state = ?", [state]) if state is not None else ("", [])
+        where += " ORDER BY created_at DESC"
+        if limit:
+            where += " LIMIT ?"
+            params.append(limit)
+        return [Job(*row).to_dict() for row in self._select(where, params)]
+
+    def counts(self):
+        with self.lock:
+            return dict(self.conn.execute("SELECT state, COUNT(*) FROM jobs GROUP BY state").fetchall())
+
+    def _select(self, where, params):
+        with self.lock:
+            return self.conn.execute(f"SELECT {', '.join(COLUMNS)} FROM jobs {where}", params).fetchall()
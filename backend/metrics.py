@@ -0,0 +1,329 @@
+import bisect
+import math
+import threading
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+THROUGHPUT_BUCKETS = tuple(2 ** n * 1024 for n in range(0, 21, 2))  # 1KB/s to 1GB/s
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base for metrics with optional labels; children are created per label value tuple"""
+    kind = None
+
+    def __init__(self, name, help, labels=(), registry=None):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.children = {}
+        self.lock = threading.Lock()
+        if not self.label_names:
+            self.labels()  # Unlabelled metrics are exported as 0 before their first update
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(values, self._new_child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._samples(), key=lambda sample: sample[0]):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+    def _samples(self):
+        return list(self.children.items())
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.label_names, values)} {_format_value(child.value)}"]
+
+
+class _Value:
+    __slots__ = ('value', 'lock')
+
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self.lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    """Monotonic count; without labels inc() is called on the metric itself"""
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, or is read from `function` when scraped"""
+    kind = 'gauge'
+
+    def __init__(self, name, help, labels=(), function=None, registry=None):
+        self.function = function
+        super().__init__(name, help, labels, registry)
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def _samples(self):
+        if self.function is None:
+            return super()._samples()
+        # A function returns a number, or {label value (tuple): number} for labelled gauges
+        result = self.function()
+        if not isinstance(result, dict):
+            result = {(): result}
+        samples = []
+        for values, value in result.items():
+            child = _Value()
+            child.value = value
+            samples.append((values if isinstance(values, tuple) else (values,), child))
+        return samples
+
+
+class CounterFunction(Gauge):
+    """Counter whose value is read from a function when scraped (a total kept elsewhere)"""
+    kind = 'counter'
+
+
+class _HistogramChild:
+    __slots__ = ('bounds', 'counts', 'sum', 'lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.bounds, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def merge(self, counts, total):
+        with self.lock:
+            for i, count in enumerate(counts):
+                self.counts[i] += count
+            self.sum += total
+
+
+class Histogram(_Metric):
+    """Distribution over fixed buckets; observe() is one bisect and two additions"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS, registry=None):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, help, labels, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_child(self, values, child):
+        with child.lock:
+            counts = list(child.counts)
+            total = child.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), counts):
+            cumulative += count
+            le = f'le="{_format_value(float(bound))}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, values, le)} {cumulative}")
+        labels = _format_labels(self.label_names, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Metrics rendered together in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, metric):
+        with self.lock:
+            if metric.name in self.metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self.metrics[metric.name] = metric
+
+    def unregister(self, name):
+        with self.lock:
+            self.metrics.pop(name, None)
+
+    def render(self):
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def deltas(self, names, sent):
+        """Changes to the named metrics since the values in `sent`, for merge() in another process.
+
+        Returns (deltas, sent): the JSON-serializable changes and the values
+        to pass as `sent` next time, once the deltas have been delivered.
+        Counters, gauges kept with inc()/dec() and histograms all add up, so
+        several processes can feed one registry this way.
+        """
+        deltas = {}
+        sent = dict(sent)
+        for name in names:
+            samples = []
+            for values, child in self.metrics[name]._samples():
+                if isinstance(child, _HistogramChild):
+                    with child.lock:
+                        current = (list(child.counts), child.sum)
+                    last_counts, last_sum = sent.get((name, values), ((0,) * len(current[0]), 0.0))
+                    delta = [[now - last for now, last in zip(current[0], last_counts)], current[1] - last_sum]
+                    changed = any(delta[0])
+                else:
+                    current = child.value
+                    delta = current - sent.get((name, values), 0)
+                    changed = delta != 0
+                if changed:
+                    sent[(name, values)] = current
+                    samples.append([list(values), delta])
+            if samples:
+                deltas[name] = samples
+        return deltas, sent
+
+    def merge(self, deltas):
+        """Add changes produced by deltas() in another process"""
+        for name, samples in deltas.items():
+            metric = self.metrics.get(name)
+            if metric is None:
+                continue
+            for values, delta in samples:
+                child = metric.labels(*values)
+                if isinstance(child, _HistogramChild):
+                    child.merge(*delta)
+                else:
+                    child.inc(delta)
+
+
+REGISTRY = MetricsRegistry()
+
+
+# ----------------------------------------------------------------------
+# Metrics recorded by the server. Instruments are updated once per
+# request, command or transfer, never per chunk; totals kept elsewhere
+# (bytes moved, queue depths) are registered as functions read on scrape.
+# ----------------------------------------------------------------------
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'p2p_http_request_duration_seconds', 'Time to produce an API response, by route',
+    labels=('method', 'route', 'status'))
+TCP_COMMAND_SECONDS = Histogram(
+    'p2p_tcp_command_duration_seconds', 'Time to handle a TCP server command, including any transfer',
+    labels=('command',))
+TCP_CONNECTIONS = Gauge('p2p_tcp_connections', 'Open connections to the TCP file server')
+TCP_CONNECTIONS_TOTAL = Counter('p2p_tcp_connections_total', 'Connections accepted by the TCP file server')
+TRANSFER_FIRST_BYTE_SECONDS = Histogram(
+    'p2p_transfer_first_byte_seconds', 'Time from request to the first byte of file data, including queueing',
+    labels=('direction',))
+TRANSFER_THROUGHPUT = Histogram(
+    'p2p_transfer_throughput_bytes_per_second', 'Average rate of each completed transfer',
+    labels=('direction',), buckets=THROUGHPUT_BUCKETS)
+TRANSFERS_TOTAL = Counter(
+    'p2p_transfers_total', 'Transfers by direction and outcome', labels=('direction', 'outcome'))
+HASH_BYTES_TOTAL = Counter('p2p_hash_bytes_total', 'Bytes read to compute file hashes')
+HASH_THROUGHPUT = Histogram(
+    'p2p_hash_throughput_bytes_per_second', 'Hashing rate of each file hashed', buckets=THROUGHPUT_BUCKETS)
+EVENT_STREAMS = Gauge('p2p_event_streams', 'Open /api/events streams')
+FILE_CACHE_REQUESTS = Counter(
+    'p2p_file_cache_requests_total', 'Downloads of files small enough to cache, by whether memory had them',
+    labels=('result',))
+FILE_CACHE_BYTES = Gauge('p2p_file_cache_bytes', 'File contents held in memory by the file cache')
+FILE_CACHE_FILES = Gauge('p2p_file_cache_files', 'Files held in memory by the file cache')
+
+# Recorded by HTTP worker processes and pushed to the supervisor, which serves /metrics
+WORKER_METRICS = (HTTP_REQUEST_SECONDS.name, EVENT_STREAMS.name, HASH_BYTES_TOTAL.name, HASH_THROUGHPUT.name,
+                  FILE_CACHE_REQUESTS.name, FILE_CACHE_BYTES.name, FILE_CACHE_FILES.name)
+
+_schedulers = {}  # {name: TransferScheduler} reported by the two gauges below
+
+
+def _scheduler_samples(key):
+    samples = {}
+    for name, scheduler in list(_schedulers.items()):
+        for priority, count in scheduler.get_state()[key].items():
+            samples[(name, priority)] = count
+    return samples
+
+
+TRANSFER_SLOTS_IN_USE = Gauge(
+    'p2p_transfer_slots_in_use', 'Transfers running, by scheduler and priority class',
+    labels=('scheduler', 'class'), function=lambda: _scheduler_samples('active'))
+TRANSFERS_WAITING = Gauge(
+    'p2p_transfers_waiting', 'Transfers queued for a slot, by scheduler and priority class',
+    labels=('scheduler', 'class'), function=lambda: _scheduler_samples('waiting'))
+
+
+def watch_scheduler(name, scheduler):
+    """Report a TransferScheduler's slots and queue under scheduler=name"""
+    _schedulers[name] = scheduler
+
+
+def observe_hash(nbytes, seconds):
+    """Record hashing `nbytes` of one file in `seconds`"""
+    HASH_BYTES_TOTAL.inc(nbytes)
+    if seconds > 0 and nbytes:
+        HASH_THROUGHPUT.observe(nbytes / seconds)
+
+
+def observe_transfer(direction, nbytes, started, first_byte_at, finished, success):
+    """Record one transfer; timestamps are time.monotonic() values, first_byte_at None if no data came"""
+    TRANSFERS_TOTAL.labels(direction, 'success' if success else 'failure').inc()
+    if first_byte_at is not None:
+        TRANSFER_FIRST_BYTE_SECONDS.labels(direction).observe(first_byte_at - started)
+        if success and finished > first_byte_at:
+            TRANSFER_THROUGHPUT.labels(direction).observe(nbytes / (finished - first_byte_at))
@@ -1,28 +1,71 @@
+import os
 import socket
 import json
 import threading
 import time
 import logging
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from bloom import BloomFilter
+from catalog_cache import CatalogCache
+from circuit_breaker import CircuitOpenError
+from config import SUMMARY_REFRESH_INTERVAL, TRANSFER_TIMEOUT, DOWNLOAD_BANDWIDTH_LIMIT
+from file_manager import catalog_version, expand_columns
+from health_scheduler import HealthScheduler
+from peer_registry import PeerRegistry
+from transfer_scheduler import TransferScheduler, normalize_priority
+from metrics import observe_transfer
+
+
+def request_json(sock, command, bufsize=65536):
+    """Send one JSON command and read the JSON response, however many packets it spans.
+
+    Shutting down our side of the connection makes the peer's server close
+    it once it has answered, so the response is collected in one buffer and
+    decoded once at the end.
+    """
+    sock.sendall(json.dumps(command).encode('utf-8'))
+    sock.shutdown(socket.SHUT_WR)
+    data = bytearray()
+    while True:
+        chunk = sock.recv(bufsize)
+        if not chunk:
+            break
+        data += chunk
+    if not data:
+        raise ConnectionError("Connection closed without a response")
+    return json.loads(data)
 
 class PeerDiscovery:
-    def __init__(self):
-        self.peers = {}  # {peer_id: {ip, port, last_seen, status}}
-        self.lock = threading.Lock()
+    def __init__(self, store=None, server_stats=None):
+        self.registry = PeerRegistry(store=store)
+        self.server_stats = server_stats  # StatsCollector counting bytes downloaded, if any
+        self.health_scheduler = HealthScheduler(self)
+        self.catalog_cache = CatalogCache(self)
+        self.summaries = {}  # {peer_id: (epoch, version, BloomFilter, synced_at)}
+        self.summary_lock = threading.Lock()
+        self.summary_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='summary')
+        self.transfer_scheduler = TransferScheduler(bandwidth=DOWNLOAD_BANDWIDTH_LIMIT)
         
-    def add_peer(self, peer_ip, peer_port, peer_name=None):
-        """Manually add a peer"""
+    def load(self):
+        """Restore persisted peers and revalidate them in the background"""
+        count = self.registry.load()
+        if count:
+            logging.info(f"Restored {count} peers from the peer store")
+            self.health_scheduler.probe_all(self.registry.peer_ids())
+            threading.Thread(target=self.revalidate_catalogs, daemon=True).start()
+        return count
+    
+    def revalidate_catalogs(self):
+        """Revalidate every cached peer catalog, keeping the cached copy on failure"""
+        for peer_id in self.registry.catalog_ids():
+            self.catalog_cache.refresh(peer_id)
+    
+
+    def add_peer(self, peer_ip, peer_port, peer_name=None, priority=None):
+        """Manually add a peer, optionally with a default transfer class"""
         peer_id = f"{peer_ip}:{peer_port}"
         
-        with self.lock:
-            self.peers[peer_id] = {
-                'ip': peer_ip,
-                'port': peer_port,
-                'name': peer_name or peer_id,
-                'last_seen': datetime.now(),
-                'status': 'unknown',
-                'files': []
-            }
+        self.registry.add(peer_id, peer_ip, peer_port, peer_name, priority=priority)
         
         # Test connection to peer
         self.test_peer_connection(peer_id)
@@ -31,169 +74,374 @@ class PeerDiscovery:
     
     def remove_peer(self, peer_id):
         """Remove a peer"""
-        with self.lock:
-            if peer_id in self.peers:
-                del self.peers[peer_id]
-                return True
-        return False
+        with self.summary_lock:
+            self.summaries.pop(peer_id, None)
+        return self.registry.remove(peer_id)
     
     def get_peers(self):
         """Get list of all peers"""
-        with self.lock:
-            return dict(self.peers)
+        return self.registry.to_dicts()
     
     def get_active_peers(self):
         """Get list of active peers (responded to ping within last 5 minutes)"""
-        cutoff_time = datetime.now() - timedelta(minutes=5)
-        
-        with self.lock:
-            active_peers = {
-                peer_id: peer_info 
-                for peer_id, peer_info in self.peers.items()
-                if peer_info['last_seen'] > cutoff_time and peer_info['status'] == 'online'
-            }
-        
-        return active_peers
+        return self.registry.active_dicts()
+    
+    def get_peer_ids(self):
+        """Ids of all known peers"""
+        return self.registry.peer_ids()
+    
+    def get_peer_count(self):
+        """Number of known peers"""
+        return self.registry.count()
+    
+    def get_active_count(self):
+        """Number of active peers"""
+        return self.registry.active_count()
+    
+    def set_peer_priority(self, peer_id, priority):
+        """Set the default transfer class for a peer; None restores the global default"""
+        return self.registry.set_priority(peer_id, priority)
+    
+    def get_peer_priority(self, peer_id):
+        """Transfer class used for a peer when a request doesn't name one"""
+        return normalize_priority(None, self.registry.get_priority(peer_id))
+    
+    def get_scheduler_state(self):
+        """Slots, running and queued downloads of the download scheduler"""
+        return self.transfer_scheduler.get_state()
+    
+    def get_peer_address(self, peer_id):
+        """Get (ip, port) for a peer, or None if it is unknown"""
+        return self.registry.get_address(peer_id)
     
     def test_peer_connection(self, peer_id):
-        """Test connection to a peer"""
-        def test_connection():
-            try:
-                peer_info = self.peers.get(peer_id)
-                if not peer_info:
-                    return
-                
-                # Create socket and connect
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(5)  # 5 second timeout
-                
-                sock.connect((peer_info['ip'], peer_info['port']))
-                
-                # Send ping command
-                ping_command = json.dumps({"type": "ping"})
-                sock.send(ping_command.encode('utf-8'))
-                
-                # Wait for response
-                response = sock.recv(1024).decode('utf-8')
-                response_data = json.loads(response)
-                
-                sock.close()
-                
-                if response_data.get('status') == 'success':
-                    with self.lock:
-                        if peer_id in self.peers:
-                            self.peers[peer_id]['status'] = 'online'
-                            self.peers[peer_id]['last_seen'] = datetime.now()
-                    logging.info(f"Peer {peer_id} is online")
+        """Queue a connection test for a peer on the health scheduler"""
+        self.health_scheduler.probe_now(peer_id)
+    
+    def refresh_all(self):
+        """Queue connection tests for every known peer"""
+        self.health_scheduler.probe_all(self.registry.peer_ids())
+    
+    def start_health_checks(self):
+        """Start periodic health checks for all known peers"""
+        self.health_scheduler.watch(self.registry.peer_ids())
+    
+    def apply_health_results(self, results):
+        """Write a batch of (peer_id, status, timestamp, rtt) probe results"""
+        changes = []
+        with self.registry.lock:
+            for peer_id, status, timestamp, rtt in results:
+                last_seen = timestamp if status == 'online' else None
+                previous = self.registry.set_status(peer_id, status, last_seen)
+                if previous is None:
+                    continue
+                if previous != status:
+                    changes.append((peer_id, status))
+                stats = self.registry.get_stats(peer_id)
+                breaker = self.registry.get_breaker(peer_id)
+                if rtt is not None:
+                    stats.record_rtt(rtt)
+                    breaker.record_success()
                 else:
-                    with self.lock:
-                        if peer_id in self.peers:
-                            self.peers[peer_id]['status'] = 'error'
-                    logging.warning(f"Peer {peer_id} responded with error")
-                    
-            except Exception as e:
-                with self.lock:
-                    if peer_id in self.peers:
-                        self.peers[peer_id]['status'] = 'offline'
-                logging.warning(f"Peer {peer_id} is offline: {e}")
-        
-        # Run connection test in separate thread
-        thread = threading.Thread(target=test_connection, daemon=True)
-        thread.start()
+                    stats.record_failure()
+                    breaker.record_failure()
+        
+        # Keep content summaries of reachable peers current
+        now = time.time()
+        with self.summary_lock:
+            due = [
+                peer_id for peer_id, status, _, _ in results
+                if status == 'online' and now - self.summaries.get(peer_id, (0, 0, 0, 0))[3] >= SUMMARY_REFRESH_INTERVAL
+            ]
+        for peer_id in due:
+            self.summary_executor.submit(self.sync_summary, peer_id)
+        
+        for peer_id, status in changes:
+            if status == 'online':
+                logging.info(f"Peer {peer_id} is online")
+            else:
+                logging.warning(f"Peer {peer_id} is {status}")
     
     def get_peer_files(self, peer_id):
-        """Get list of files from a peer"""
+        """Get list of files from a peer, served from the catalog cache"""
+        files, _, _, _ = self.catalog_cache.get(peer_id)
+        return files
+    
+    def get_peer_catalog(self, peer_id, force=False):
+        """Get a peer's catalog with its version and cache age"""
+        files, version, fetched_at, stale = self.catalog_cache.get(peer_id, force)
+        return {
+            'files': files,
+            'catalog_version': version,
+            'fetched_at': fetched_at,
+            'stale': stale
+        }
+    
+    def fetch_catalog(self, peer_id, known_version=None):
+        """Ask a peer for its file list.
+        
+        Returns (status, files, version) where status is 'success',
+        'not_modified' (the peer still serves known_version) or 'error'.
+        """
         try:
-            peer_info = self.peers.get(peer_id)
-            if not peer_info:
-                return []
+            if not self.registry.get_address(peer_id):
+                return 'error', [], None
             
-            # Create socket and connect
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(10)  # 10 second timeout
+            # Connect through the peer's circuit breaker
+            sock = self._connect(peer_id, 10)  # 10 second read timeout
             
-            sock.connect((peer_info['ip'], peer_info['port']))
+            # Send list_files command; peers that know the compact format send it
+            command = {"type": "list_files", "format": "columnar"}
+            if known_version:
+                command["if_none_match"] = known_version
+            response_data = request_json(sock, command)
             
-            # Send list_files command
-            command = json.dumps({"type": "list_files"})
-            sock.send(command.encode('utf-8'))
+            sock.close()
             
-            # Wait for response
-            response = sock.recv(4096).decode('utf-8')
-            response_data = json.loads(response)
+            self._record_success(peer_id)
             
-            sock.close()
+            status = response_data.get('status')
+            if status == 'not_modified':
+                return status, [], known_version
+            if status == 'success':
+                if 'columns' in response_data:
+                    files = expand_columns(response_data['columns'])
+                else:
+                    files = response_data.get('files', [])
+                version = response_data.get('catalog_version') or catalog_version(files)
+                return status, files, version
             
-            if response_data.get('status') == 'success':
-                files = response_data.get('files', [])
-                
-                # Update peer's file list
-                with self.lock:
-                    if peer_id in self.peers:
-                        self.peers[peer_id]['files'] = files
-                        self.peers[peer_id]['last_seen'] = datetime.now()
-                
-                return files
-            else:
-                logging.error(f"Error getting files from peer {peer_id}: {response_data.get('message')}")
-                return []
+            logging.error(f"Error getting files from peer {peer_id}: {response_data.get('message')}")
+            return 'error', [], None
                 
         except Exception as e:
-            logging.error(f"Error connecting to peer {peer_id}: {e}")
-            return []
+            self._record_failure(peer_id, e)
+            return 'error', [], None
     
-    def download_file_from_peer(self, peer_id, filename, save_path):
-        """Download a file from a peer"""
+    def sync_summary(self, peer_id):
+        """Fetch a peer's content summary, applying a delta when the peer can send one"""
         try:
-            peer_info = self.peers.get(peer_id)
-            if not peer_info:
-                return False, "Peer not found"
+            if not self.registry.get_address(peer_id):
+                return False
             
-            # Create socket and connect
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(30)  # 30 second timeout
+            with self.summary_lock:
+                current = self.summaries.get(peer_id)
             
-            sock.connect((peer_info['ip'], peer_info['port']))
+            command = {"type": "get_summary"}
+            if current:
+                command["epoch"], command["since"] = current[0], current[1]
+            
+            sock = self._connect(peer_id, 10)
+            response = request_json(sock, command)
+            sock.close()
+            self._record_success(peer_id)
             
-            # Send download command
+            status = response.get('status')
+            if status == 'not_modified':
+                bloom = current[2]
+            elif status == 'success' and 'bits' in response:
+                bloom = BloomFilter.from_message(response)
+            elif status == 'success' and current:
+                bloom = BloomFilter(current[2].num_bits, current[2].num_hashes, current[2].bits)
+                bloom.toggle(response.get('toggled', []))
+            else:
+                logging.error(f"Error getting summary from peer {peer_id}: {response.get('message')}")
+                return False
+            
+            with self.summary_lock:
+                if peer_id in self.registry.records:
+                    self.summaries[peer_id] = (response['epoch'], response['version'], bloom, time.time())
+            return True
+        
+        except Exception as e:
+            self._record_failure(peer_id, e)
+            return False
+    
+    def likely_holders(self, content_hash=None, filename=None, peer_ids=None):
+        """Peers that may hold a file; only peers whose summary rules it out are dropped"""
+        if peer_ids is None:
+            peer_ids = self.registry.peer_ids()
+        
+        with self.summary_lock:
+            summaries = {peer_id: self.summaries.get(peer_id) for peer_id in peer_ids}
+        
+        return [
+            peer_id for peer_id, summary in summaries.items()
+            if summary is None or summary[2].might_have(content_hash, filename)
+        ]
+    
+    def _connect(self, peer_id, timeout):
+        """Open a socket to a peer through its circuit breaker.
+        
+        Raises CircuitOpenError without touching the network while the
+        circuit is open. The connect timeout adapts to the peer's RTT
+        history; `timeout` applies to reads once connected.
+        """
+        address = self.registry.get_address(peer_id)
+        if not address:
+            raise LookupError("Peer not found")
+        
+        breaker = self.registry.get_breaker(peer_id)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Peer {peer_id} is unreachable (circuit open)")
+        
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.settimeout(self.registry.get_stats(peer_id).connect_timeout())
+        try:
+            sock.connect(address)
+        except OSError:
+            sock.close()
+            raise
+        sock.settimeout(timeout)
+        return sock
+    
+    def _record_success(self, peer_id):
+        breaker = self.registry.get_breaker(peer_id)
+        if breaker:
+            breaker.record_success()
+    
+    def _record_failure(self, peer_id, error=None, count_transfer=True):
+        """Count a failed request against a peer; fast-failed calls are not counted"""
+        if isinstance(error, CircuitOpenError):
+            logging.debug(str(error))
+            return
+        
+        logging.error(f"Error connecting to peer {peer_id}: {error}")
+        breaker = self.registry.get_breaker(peer_id)
+        if breaker:
+            breaker.record_failure()
+        stats = self.registry.get_stats(peer_id)
+        if stats and count_transfer:
+            stats.record_failure()
+    
+    def rank_peers(self, peer_ids, size=None):
+        """Order candidate peers by expected time to fetch `size` bytes, fastest first"""
+        ranked = []
+        for peer_id in peer_ids:
+            # Either lookup is None if the peer was removed meanwhile
+            record = self.registry.get(peer_id)
+            stats = self.registry.get_stats(peer_id) if record else None
+            if stats is None:
+                continue
+            ranked.append({
+                'peer_id': peer_id,
+                'expected_seconds': stats.expected_seconds(size),
+                'status': record.status,
+                'metrics': stats.summary()
+            })
+        
+        # Peers known to be down go last whatever their history says
+        ranked.sort(key=lambda r: (r['status'] != 'online', r['expected_seconds']))
+        return ranked
+    
+    def _request_download(self, peer_id, filename, offset, priority):
+        """Ask a peer for a file from `offset`; returns (socket, metadata reply)"""
+        # Connect through the peer's circuit breaker; the peer may queue us before sending
+        sock = self._connect(peer_id, TRANSFER_TIMEOUT)
+        try:
             command = json.dumps({
                 "type": "download_file",
-                "filename": filename
+                "filename": filename,
+                "offset": offset,
+                "priority": priority
             })
             sock.send(command.encode('utf-8'))
+            return sock, json.loads(sock.recv(1024).decode('utf-8'))
+        except Exception:
+            sock.close()
+            raise
+    
+    def download_file_from_peer(self, peer_id, filename, save_path, progress=None, resume=False,
+                                priority=None, size=None, content_hash=None):
+        """Download a file from a peer.
+        
+        progress(bytes_done, total) is called as data arrives; returning
+        False aborts the transfer and leaves the partial file in place.
+        With resume=True an existing partial file at save_path is continued
+        from its current size if the peer supports offsets, unless the
+        peer's file no longer matches the expected `size` or `content_hash`
+        (it changed since the partial file was written), in which case the
+        download starts over. The transfer runs in `priority` (the peer's
+        default class if None), both in our download scheduler and on the
+        serving peer; `size` is also a hint for shortest-job-first ordering.
+        """
+        stats = self.registry.get_stats(peer_id)
+        if stats is None:
+            return False, "Peer not found"
+        
+        priority = normalize_priority(priority, self.registry.get_priority(peer_id))
+        requested_at = time.monotonic()
+        ticket = self.transfer_scheduler.acquire(priority, size)
+        started = stats.begin_transfer()
+        bytes_received = 0
+        first_byte_at = None
+        success = False
+        meter = self.server_stats.meter('bytes_in') if self.server_stats else None
+        try:
+            offset = os.path.getsize(save_path) if resume and os.path.exists(save_path) else 0
+            sock, metadata = self._request_download(peer_id, filename, offset, priority)
             
-            # Receive file metadata
-            metadata_response = sock.recv(1024).decode('utf-8')
-            metadata = json.loads(metadata_response)
+            # Appending to a partial copy of a different version would splice two files
+            if offset and ((size is not None and metadata.get('size') != size) or
+                           (content_hash and metadata.get('hash') and metadata['hash'] != content_hash)):
+                logging.info(f"{filename} changed on {peer_id} since the partial download; starting over")
+                sock.close()
+                sock, metadata = self._request_download(peer_id, filename, 0, priority)
             
             if metadata.get('status') != 'success':
                 sock.close()
                 return False, metadata.get('message', 'Unknown error')
             
             file_size = metadata.get('size', 0)
+            # Peers that predate offsets send the whole file
+            offset = metadata.get('offset', 0)
             
             # Send ready signal
             sock.send("ready".encode('utf-8'))
             
             # Receive file data
-            with open(save_path, 'wb') as f:
-                bytes_received = 0
-                while bytes_received < file_size:
-                    chunk = sock.recv(min(8192, file_size - bytes_received))
+            aborted = False
+            with open(save_path, 'r+b' if offset else 'wb') as f:
+                f.truncate(offset)
+                f.seek(offset)
+                while offset + bytes_received < file_size:
+                    chunk = sock.recv(min(65536, file_size - offset - bytes_received))
                     if not chunk:
                         break
+                    if first_byte_at is None:
+                        first_byte_at = time.monotonic()
                     f.write(chunk)
                     bytes_received += len(chunk)
+                    ticket.throttle(len(chunk))
+                    if meter:
+                        meter.add(len(chunk))
+                    if progress and progress(offset + bytes_received, file_size) is False:
+                        aborted = True
+                        break
             
             sock.close()
             
-            if bytes_received == file_size:
+            self._record_success(peer_id)
+            
+            if aborted:
+                return False, "Transfer aborted"
+            if offset + bytes_received == file_size:
+                success = True
                 logging.info(f"Successfully downloaded {filename} from {peer_id}")
                 return True, "File downloaded successfully"
             else:
-                os.remove(save_path)  # Remove incomplete file
+                if not resume:
+                    os.remove(save_path)  # Remove incomplete file
                 return False, "Incomplete file transfer"
                 
         except Exception as e:
-            logging.error(f"Error downloading file from peer {peer_id}: {e}")
+            # end_transfer below already counts the failure in the peer's stats
+            self._record_failure(peer_id, e, count_transfer=False)
             return False, str(e)
+        finally:
+            stats.end_transfer(started, bytes_received, success)
+            ticket.release()
+            observe_transfer('peer_download', bytes_received, requested_at, first_byte_at, time.monotonic(),
+                             success)
+            if meter:
+                meter.flush()
@@ -0,0 +1,373 @@
+import heapq
+import logging
+import sys
+import threading
+import time
+from datetime import datetime
+from config import ACTIVE_PEER_WINDOW, TRANSFER_DEFAULT_PRIORITY
+from circuit_breaker import CircuitBreaker
+from peer_stats import PeerStats
+
+STATUSES = ('unknown', 'online', 'offline', 'error')
+
+
+class PeerRecord:
+    """Compact entry in the peer table"""
+    __slots__ = ('peer_id', 'ip', 'port', 'name', 'status', 'last_seen', 'file_count',
+                 'priority', 'stats', 'breaker')
+
+    def __init__(self, peer_id, ip, port, name, status='unknown', last_seen=None, file_count=0,
+                 priority=None):
+        self.peer_id = peer_id
+        self.ip = ip
+        self.port = port
+        self.name = name
+        self.status = status
+        self.last_seen = last_seen if last_seen is not None else time.time()
+        self.file_count = file_count
+        self.priority = priority  # Default transfer class for this peer, None for the global default
+        self.stats = None  # PeerStats, created on the first measurement
+        self.breaker = None  # CircuitBreaker, created on the first request
+
+    def to_dict(self):
+        return {
+            'ip': self.ip,
+            'port': self.port,
+            'name': self.name,
+            'last_seen': datetime.fromtimestamp(self.last_seen),
+            'status': self.status,
+            'file_count': self.file_count,
+            'priority': self.priority or TRANSFER_DEFAULT_PRIORITY,
+            'metrics': self.stats.summary() if self.stats else None,
+            'circuit': self.breaker.get_state() if self.breaker else 'closed'
+        }
+
+
+class PeerRegistry:
+    """Indexed peer table.
+
+    Records are slotted objects; catalogs live in a separate dict so the
+    table itself stays small. Peers are bucketed by status, and the active
+    set (online and seen within `active_window`) is kept up to date by an
+    expiry heap ordered by last_seen, so counts and active lists never scan
+    the whole table.
+
+    With a PeerStore attached every change is also written through to
+    disk; catalogs restored by load() are read back lazily on first use.
+    """
+
+    def __init__(self, active_window=ACTIVE_PEER_WINDOW, store=None):
+        self.active_window = active_window
+        self.store = store
+        self.records = {}  # {peer_id: PeerRecord}
+        self.catalogs = {}  # {peer_id: (version, fetched_at, files)}
+        self.stored_catalogs = set()  # Catalogs on disk but not yet loaded
+        self.by_status = {status: set() for status in STATUSES}
+        self.active = set()
+        self.expiry_heap = []  # [(last_seen, peer_id)], at most one entry per peer
+        self.expiry_queued = set()  # Peers with an entry in expiry_heap
+        self.catalog_listeners = []  # Called with (peer_id, entry or None) on catalog changes
+        self.peer_listeners = []  # Called with (peer_id, peer dict or None) when a peer changes
+        self.priority_by_ip = {}  # {ip: {peer_id: priority}} for peers with a default class
+        self.lock = threading.RLock()
+
+    # ------------------------------------------------------------------
+    # Mutations
+    # ------------------------------------------------------------------
+
+    def add(self, peer_id, ip, port, name=None, status='unknown', last_seen=None,
+            file_count=0, priority=None, persist=True):
+        """Insert or replace a peer record; an existing default priority is kept unless given"""
+        with self.lock:
+            previous = self.records.get(peer_id)
+            if previous is not None:
+                self._unindex(previous)
+                if priority is None:
+                    priority = previous.priority
+
+            record = PeerRecord(sys.intern(peer_id), ip, port, name or peer_id,
+                                sys.intern(status), last_seen, file_count, priority)
+            self.records[record.peer_id] = record
+            self.by_status.setdefault(record.status, set()).add(record.peer_id)
+            self._refresh_active(record)
+            self._index_priority(record)
+            if persist and self.store:
+                self.store.save_peer(record)
+            if persist:
+                self._notify_peer(record)
+            return record
+
+    def load(self):
+        """Restore peers from the attached store; catalogs load on demand"""
+        if not self.store:
+            return 0
+
+        rows = self.store.load_peers()
+        catalog_ids = set(self.store.catalog_peer_ids())
+        with self.lock:
+            for peer_id, ip, port, name, status, last_seen, file_count, priority in rows:
+                self.add(peer_id, ip, port, name, status, last_seen, file_count, priority,
+                         persist=False)
+            self.stored_catalogs = catalog_ids & set(self.records)
+        return len(rows)
+
+    def remove(self, peer_id):
+        """Remove a peer and its catalog"""
+        with self.lock:
+            record = self.records.pop(peer_id, None)
+            if record is None:
+                return False
+            self._unindex(record)
+            self.catalogs.pop(peer_id, None)
+            self.stored_catalogs.discard(peer_id)
+            if self.store:
+                self.store.delete_peer(peer_id)
+            self._notify_peer_removed(peer_id)
+        self._notify_catalog(peer_id, None)
+        return True
+
+    def set_status(self, peer_id, status, last_seen=None):
+        """Update a peer's status; returns the previous status or None if unknown"""
+        with self.lock:
+            record = self.records.get(peer_id)
+            if record is None:
+                return None
+
+            previous = record.status
+            was_active = peer_id in self.active
+            if previous != status:
+                self.by_status[previous].discard(peer_id)
+                record.status = sys.intern(status)
+                self.by_status.setdefault(record.status, set()).add(peer_id)
+            if last_seen is not None:
+                record.last_seen = last_seen
+            self._refresh_active(record)
+            if self.store and (previous != status or last_seen is not None):
+                self.store.save_status(peer_id, record.status, record.last_seen)
+            if previous != status or was_active != (peer_id in self.active):
+                self._notify_peer(record)
+            return previous
+
+    def set_priority(self, peer_id, priority):
+        """Set a peer's default transfer class (None restores the global default)"""
+        with self.lock:
+            record = self.records.get(peer_id)
+            if record is None:
+                return False
+            record.priority = priority
+            self._index_priority(record)
+            if self.store:
+                self.store.save_peer(record)
+            self._notify_peer(record)
+            return True
+
+    def touch(self, peer_id, last_seen=None):
+        """Mark a peer as seen now"""
+        with self.lock:
+            record = self.records.get(peer_id)
+            if record is not None:
+                record.last_seen = last_seen or time.time()
+                self._refresh_active(record)
+                if self.store:
+                    self.store.save_status(peer_id, record.status, record.last_seen)
+
+    def set_catalog(self, peer_id, files, version=None):
+        """Cache a peer's catalog along with the version it was served as"""
+        fetched_at = time.time()
+        with self.lock:
+            record = self.records.get(peer_id)
+            if record is None:
+                return
+            entry = self.catalogs[peer_id] = (version, fetched_at, files)
+            self.stored_catalogs.discard(peer_id)
+            record.file_count = len(files)
+            if self.store:
+                self.store.save_catalog(peer_id, version, fetched_at, files)
+                self.store.save_peer(record)
+            self._notify_peer(record)
+        self._notify_catalog(peer_id, entry)
+
+    def mark_catalog_fresh(self, peer_id):
+        """Record that a cached catalog was revalidated unchanged"""
+        fetched_at = time.time()
+        with self.lock:
+            entry = self.catalogs.get(peer_id)
+            if entry is None:
+                return
+            self.catalogs[peer_id] = (entry[0], fetched_at, entry[2])
+            if self.store:
+                self.store.touch_catalog(peer_id, fetched_at)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def get(self, peer_id):
+        with self.lock:
+            return self.records.get(peer_id)
+
+    def get_stats(self, peer_id):
+        """PeerStats for a peer, created on first use; None if the peer is unknown"""
+        with self.lock:
+            record = self.records.get(peer_id)
+            if record is None:
+                return None
+            if record.stats is None:
+                record.stats = PeerStats()
+            return record.stats
+
+    def get_breaker(self, peer_id):
+        """CircuitBreaker for a peer, created on first use; None if the peer is unknown"""
+        with self.lock:
+            record = self.records.get(peer_id)
+            if record is None:
+                return None
+            if record.breaker is None:
+                record.breaker = CircuitBreaker()
+            return record.breaker
+
+    def get_address(self, peer_id):
+        with self.lock:
+            record = self.records.get(peer_id)
+            return (record.ip, record.port) if record else None
+
+    def get_priority(self, peer_id):
+        """Default transfer class for a peer, or None"""
+        with self.lock:
+            record = self.records.get(peer_id)
+            return record.priority if record else None
+
+    def priority_for_ip(self, ip):
+        """Default class for connections from ip, if every peer at that address agrees"""
+        with self.lock:
+            priorities = set(self.priority_by_ip.get(ip, {}).values())
+            return priorities.pop() if len(priorities) == 1 else None
+
+    def get_catalog(self, peer_id):
+        entry = self.get_catalog_entry(peer_id)
+        return entry[2] if entry else []
+
+    def get_catalog_entry(self, peer_id):
+        """Return (version, fetched_at, files) for a cached catalog, or None"""
+        with self.lock:
+            entry = self.catalogs.get(peer_id)
+            if entry is not None or peer_id not in self.stored_catalogs:
+                return entry
+
+        entry = self.store.load_catalog(peer_id)
+        with self.lock:
+            self.stored_catalogs.discard(peer_id)
+            if entry is not None and peer_id in self.records and peer_id not in self.catalogs:
+                self.catalogs[peer_id] = entry
+            return self.catalogs.get(peer_id)
+
+    def catalog_ids(self):
+        """Peers with a cached catalog in memory or on disk"""
+        with self.lock:
+            return list(self.catalogs.keys() | self.stored_catalogs)
+
+    def peer_ids(self):
+        with self.lock:
+            return list(self.records)
+
+    def count(self, status=None):
+        with self.lock:
+            if status is None:
+                return len(self.records)
+            return len(self.by_status.get(status, ()))
+
+    def active_count(self):
+        with self.lock:
+            self._expire()
+            return len(self.active)
+
+    def active_ids(self):
+        with self.lock:
+            self._expire()
+            return list(self.active)
+
+    def to_dicts(self, peer_ids=None):
+        """Serializable view of the given peers (all peers by default)"""
+        with self.lock:
+            if peer_ids is None:
+                peer_ids = self.records.keys()
+            return {
+                peer_id: self.records[peer_id].to_dict()
+                for peer_id in peer_ids if peer_id in self.records
+            }
+
+    def active_dicts(self):
+        with self.lock:
+            self._expire()
+            return self.to_dicts(self.active)
+
+    # ------------------------------------------------------------------
+    # Index maintenance
+    # ------------------------------------------------------------------
+
+    def _notify_catalog(self, peer_id, entry):
+        for listener in self.catalog_listeners:
+            try:
+                listener(peer_id, entry)
+            except Exception as e:
+                logging.error(f"Catalog listener failed for {peer_id}: {e}")
+
+    def _notify_peer(self, record):
+        # Caller holds self.lock, so listeners see changes to one peer in order
+        if not self.peer_listeners:
+            return
+        peer = record.to_dict()
+        peer['active'] = record.peer_id in self.active
+        for listener in self.peer_listeners:
+            try:
+                listener(record.peer_id, peer)
+            except Exception as e:
+                logging.error(f"Peer listener failed for {record.peer_id}: {e}")
+
+    def _notify_peer_removed(self, peer_id):
+        for listener in self.peer_listeners:
+            try:
+                listener(peer_id, None)
+            except Exception as e:
+                logging.error(f"Peer listener failed for {peer_id}: {e}")
+
+    def _unindex(self, record):
+        self.by_status.get(record.status, set()).discard(record.peer_id)
+        self.active.discard(record.peer_id)
+        self._unindex_priority(record)
+
+    def _index_priority(self, record):
+        if record.priority:
+            self.priority_by_ip.setdefault(record.ip, {})[record.peer_id] = record.priority
+        else:
+            self._unindex_priority(record)
+
+    def _unindex_priority(self, record):
+        by_peer = self.priority_by_ip.get(record.ip)
+        if by_peer is not None:
+            by_peer.pop(record.peer_id, None)
+            if not by_peer:
+                del self.priority_by_ip[record.ip]
+
+    def _refresh_active(self, record):
+        if record.status == 'online' and record.last_seen > time.time() - self.active_window:
+            self.active.add(record.peer_id)
+            # A queued entry is moved on to the newer last_seen by _expire when it comes due
+            if record.peer_id not in self.expiry_queued:
+                self.expiry_queued.add(record.peer_id)
+                heapq.heappush(self.expiry_heap, (record.last_seen, record.peer_id))
+        else:
+            self.active.discard(record.peer_id)
+
+    def _expire(self):
+        """Drop peers whose last_seen has fallen out of the active window"""
+        cutoff = time.time() - self.active_window
+        heap = self.expiry_heap
+        while heap and heap[0][0] <= cutoff:
+            _, peer_id = heapq.heappop(heap)
+            record = self.records.get(peer_id)
+            if record is not None and peer_id in self.active and record.last_seen > cutoff:
+                heapq.heappush(heap, (record.last_seen, peer_id))  # Seen since it was queued
+            else:
+                self.active.discard(peer_id)
+                self.expiry_queued.discard(peer_id)
@@ -0,0 +1,130 @@
+import threading
+import time
+from array import array
+from config import (PEER_RTT_SAMPLES, PEER_THROUGHPUT_SAMPLES, PEER_OUTCOME_SAMPLES,
+                    CONNECT_TIMEOUT_MIN, CONNECT_TIMEOUT_MAX, CONNECT_TIMEOUT_RTT_MULTIPLIER)
+
+# Assumed for peers we have never transferred from, so they still get tried
+DEFAULT_THROUGHPUT = 1024 * 1024  # 1 MB/s
+DEFAULT_RTT = 0.1
+
+
+class RingBuffer:
+    """Fixed-size buffer of float samples, oldest overwritten first"""
+    __slots__ = ('samples', 'index', 'count')
+
+    def __init__(self, size):
+        self.samples = array('f', bytes(4 * size))
+        self.index = 0
+        self.count = 0
+
+    def add(self, value):
+        self.samples[self.index] = value
+        self.index = (self.index + 1) % len(self.samples)
+        if self.count < len(self.samples):
+            self.count += 1
+
+    def values(self):
+        if self.count < len(self.samples):
+            return self.samples[:self.count].tolist()
+        return self.samples.tolist()
+
+    def percentile(self, pct):
+        if not self.count:
+            return None
+        ordered = sorted(self.values())
+        return ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+
+    def mean(self):
+        if not self.count:
+            return None
+        return sum(self.values()) / self.count
+
+
+class PeerStats:
+    """Latency, throughput, failure and load measurements for one peer"""
+    __slots__ = ('rtt', 'throughput', 'outcomes', 'lifetime_bytes', 'lifetime_seconds',
+                 'successes', 'failures', 'active_transfers', 'lock')
+
+    def __init__(self):
+        self.rtt = RingBuffer(PEER_RTT_SAMPLES)  # seconds
+        self.throughput = RingBuffer(PEER_THROUGHPUT_SAMPLES)  # bytes/second per transfer
+        self.outcomes = RingBuffer(PEER_OUTCOME_SAMPLES)  # 1.0 failure, 0.0 success
+        self.lifetime_bytes = 0
+        self.lifetime_seconds = 0.0
+        self.successes = 0
+        self.failures = 0
+        self.active_transfers = 0
+        self.lock = threading.Lock()
+
+    def record_rtt(self, seconds):
+        with self.lock:
+            self.rtt.add(seconds)
+            self.outcomes.add(0.0)
+            self.successes += 1
+
+    def record_failure(self):
+        with self.lock:
+            self.outcomes.add(1.0)
+            self.failures += 1
+
+    def begin_transfer(self):
+        with self.lock:
+            self.active_transfers += 1
+            return time.monotonic()
+
+    def end_transfer(self, started, nbytes, success):
+        """Close a transfer opened with begin_transfer"""
+        elapsed = max(time.monotonic() - started, 1e-6)
+        with self.lock:
+            self.active_transfers = max(0, self.active_transfers - 1)
+            self.outcomes.add(0.0 if success else 1.0)
+            if success:
+                self.successes += 1
+                if nbytes:
+                    self.throughput.add(nbytes / elapsed)
+                    self.lifetime_bytes += nbytes
+                    self.lifetime_seconds += elapsed
+            else:
+                self.failures += 1
+
+    def connect_timeout(self):
+        """Connect timeout derived from RTT history, clamped to the configured range"""
+        with self.lock:
+            rtt_p95 = self.rtt.percentile(95)
+        if rtt_p95 is None:
+            return CONNECT_TIMEOUT_MAX
+        return min(max(rtt_p95 * CONNECT_TIMEOUT_RTT_MULTIPLIER, CONNECT_TIMEOUT_MIN), CONNECT_TIMEOUT_MAX)
+
+    def failure_rate(self):
+        with self.lock:
+            return self.outcomes.mean() or 0.0
+
+    def expected_seconds(self, size=None):
+        """Estimated time to fetch `size` bytes from this peer right now"""
+        with self.lock:
+            rtt = self.rtt.percentile(50) or DEFAULT_RTT
+            throughput = self.throughput.percentile(50) or DEFAULT_THROUGHPUT
+            failure_rate = min(self.outcomes.mean() or 0.0, 0.95)
+            load = self.active_transfers
+
+        seconds = rtt + (size or 0) / throughput
+        # Concurrent transfers share the peer's uplink; failures mean retries
+        return seconds * (1 + load) / (1 - failure_rate)
+
+    def summary(self):
+        with self.lock:
+            rtt_p50 = self.rtt.percentile(50)
+            rtt_p95 = self.rtt.percentile(95)
+            return {
+                'rtt_p50_ms': round(rtt_p50 * 1000, 2) if rtt_p50 is not None else None,
+                'rtt_p95_ms': round(rtt_p95 * 1000, 2) if rtt_p95 is not None else None,
+                'throughput_p50': self.throughput.percentile(50),
+                'throughput_p95': self.throughput.percentile(95),
+                'throughput_lifetime': (self.lifetime_bytes / self.lifetime_seconds
+                                        if self.lifetime_seconds else None),
+                'failure_rate': round(self.outcomes.mean() or 0.0, 3),
+                'successes': self.successes,
+                'failures': self.failures,
+                'active_transfers': self.active_transfers
+            }
@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from config import PEER_DB_PATH, PEER_STORE_FLUSH_INTERVAL
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS peers (
+    peer_id TEXT PRIMARY KEY,
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    name TEXT,
+    status TEXT NOT NULL,
+    last_seen REAL NOT NULL,
+    file_count INTEGER NOT NULL DEFAULT 0,
+    priority TEXT
+);
+CREATE TABLE IF NOT EXISTS catalogs (
+    peer_id TEXT PRIMARY KEY,
+    version TEXT,
+    fetched_at REAL NOT NULL,
+    files TEXT NOT NULL
+);
+"""
+
+
+class PeerStore:
+    """SQLite persistence for the peer table and cached peer catalogs.
+
+    Writes are queued and applied by a single writer thread, one
+    transaction per batch, so callers never wait on disk I/O.
+    """
+
+    def __init__(self, db_path=PEER_DB_PATH, flush_interval=PEER_STORE_FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.writes = queue.Queue()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        self.conn = self._connect()
+        self.conn.executescript(SCHEMA)
+        self._migrate()
+        self.read_lock = threading.Lock()
+
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _migrate(self):
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(peers)')}
+        if 'priority' not in columns:
+            self.conn.execute('ALTER TABLE peers ADD COLUMN priority TEXT')
+            self.conn.commit()
+
+    # ------------------------------------------------------------------
+    # Writes (queued)
+    # ------------------------------------------------------------------
+
+    def save_peer(self, record):
+        self.writes.put((
+            'INSERT OR REPLACE INTO peers (peer_id, ip, port, name, status, last_seen, file_count, priority) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (record.peer_id, record.ip, record.port, record.name, record.status,
+             record.last_seen, record.file_count, record.priority)
+        ))
+
+    def save_status(self, peer_id, status, last_seen):
+        self.writes.put((
+            'UPDATE peers SET status = ?, last_seen = ? WHERE peer_id = ?',
+            (status, last_seen, peer_id)
+        ))
+
+    def delete_peer(self, peer_id):
+        self.writes.put(('DELETE FROM peers WHERE peer_id = ?', (peer_id,)))
+        self.writes.put(('DELETE FROM catalogs WHERE peer_id = ?', (peer_id,)))
+
+    def save_catalog(self, peer_id, version, fetched_at, files):
+        self.writes.put((
+            'INSERT OR REPLACE INTO catalogs (peer_id, version, fetched_at, files) VALUES (?, ?, ?, ?)',
+            (peer_id, version, fetched_at, json.dumps(files))
+        ))
+
+    def touch_catalog(self, peer_id, fetched_at):
+        self.writes.put(('UPDATE catalogs SET fetched_at = ? WHERE peer_id = ?', (fetched_at, peer_id)))
+
+    def flush(self):
+        """Block until all queued writes are committed"""
+        self.writes.join()
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+
+    def load_peers(self):
+        """Return all stored peers as (peer_id, ip, port, name, status, last_seen, file_count, priority) rows"""
+        with self.read_lock:
+            return self.conn.execute(
+                'SELECT peer_id, ip, port, name, status, last_seen, file_count, priority FROM peers').fetchall()
+
+    def load_catalog(self, peer_id):
+        """Return (version, fetched_at, files) for a peer, or None"""
+        with self.read_lock:
+            row = self.conn.execute(
+                'SELECT version, fetched_at, files FROM catalogs WHERE peer_id = ?',
+                (peer_id,)).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], json.loads(row[2])
+
+    def catalog_peer_ids(self):
+        with self.read_lock:
+            return [row[0] for row in self.conn.execute('SELECT peer_id FROM catalogs')]
+
+    # ------------------------------------------------------------------
+    # Writer thread
+    # ------------------------------------------------------------------
+
+    def _write_loop(self):
+        while True:
+            batch = [self.writes.get()]
+            try:
+                while True:
+                    batch.append(self.writes.get(timeout=self.flush_interval))
+                    if len(batch) >= 1000:
+                        break
+            except queue.Empty:
+                pass
+
+            try:
+                with self.read_lock, self.conn:
+                    for sql, params in batch:
+                        self.conn.execute(sql, params)
+            except sqlite3.Error as e:
+                logging.error(f"Error writing peer store: {e}")
+            finally:
+                for _ in batch:
+                    self.writes.task_done()
@@ -0,0 +1,91 @@
+import os
+from config import READ_BLOCK_SIZE, READ_AHEAD_WINDOW, READ_DROP_BEHIND_MIN_SIZE
+
+_fadvise = getattr(os, 'posix_fadvise', None)  # Unix only; elsewhere files are read without hints
+
+
+def fadvise(fd, offset, length, advice):
+    """posix_fadvise() with an os.POSIX_FADV_* name; a no-op where unsupported"""
+    if _fadvise is None or length <= 0:
+        return
+    try:
+        _fadvise(fd, offset, length, getattr(os, advice))
+    except OSError:
+        pass
+
+
+class SequentialReader:
+    """Reads a file front to back for one streaming transfer, steering the page cache around it.
+
+    Reads are `block_size` long and aligned to it within the file, so many
+    concurrent streams reach the disk as large runs rather than small
+    interleaved reads. The kernel is told the access is sequential, and
+    WILLNEED hints keep at most `window` bytes requested ahead of the
+    reader: enough to keep the disk busy without dozens of streams
+    prefetching so far that they evict each other's data. In files of at
+    least `drop_behind_size` bytes, pages already sent are dropped
+    (DONTNEED) so one multi-GB stream doesn't push everything else out of
+    the page cache; smaller files stay cached for the next peer.
+
+    Iterating yields memoryviews of one reused buffer, each valid until
+    the next block is read.
+    """
+
+    def __init__(self, path, offset=0, length=None, block_size=READ_BLOCK_SIZE, window=READ_AHEAD_WINDOW,
+                 drop_behind_size=READ_DROP_BEHIND_MIN_SIZE):
+        self.f = open(path, 'rb', buffering=0)
+        self.fd = self.f.fileno()
+        size = os.fstat(self.fd).st_size
+        self.start = min(max(offset, 0), size)
+        self.end = size if length is None else min(size, self.start + length)
+        self.block_size = block_size
+        self.window = max(window, block_size)
+        self.drop_behind = size >= drop_behind_size
+        self.buffer = bytearray(block_size)
+        fadvise(self.fd, self.start, self.end - self.start, 'POSIX_FADV_SEQUENTIAL')
+
+    def __iter__(self):
+        view = memoryview(self.buffer)
+        position = dropped = advised = self.start
+        self.f.seek(position)
+        while position < self.end:
+            # Top up read-ahead once less than half the window is left in flight
+            if advised < self.end and advised - position < self.window // 2:
+                ahead = min(position + self.window, self.end)
+                fadvise(self.fd, advised, ahead - advised, 'POSIX_FADV_WILLNEED')
+                advised = ahead
+
+            # Up to the next block boundary, so every later read is aligned
+            count = min(self.block_size - position % self.block_size, self.end - position)
+            received = self.f.readinto(view[:count])
+            if not received:  # The file shrank
+                break
+            position += received
+            yield view[:received]
+
+            if self.drop_behind and position - dropped >= self.block_size:
+                fadvise(self.fd, dropped, position - dropped, 'POSIX_FADV_DONTNEED')
+                dropped = position
+
+    def close(self):
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def hash_file(path, digest):
+    """Feed the file at `path` to a hashlib `digest` in one sequential pass; returns the bytes hashed.
+
+    Blocks are read into one reused buffer and handed to the digest as
+    memoryviews, with the same page cache hints as a stream to a peer.
+    """
+    hashed = 0
+    with SequentialReader(path) as reader:
+        for block in reader:
+            digest.update(block)
+            hashed += len(block)
+    return hashed
@@ -0,0 +1,326 @@
+import heapq
+import logging
+import re
+import threading
+from array import array
+from config import SEARCH_MAX_RESULTS
+from file_manager import catalog_version
+
+LOCAL_SOURCE = 'local'
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+FILTER_RE = re.compile(r'^(ext|hash|peer):(.+)$|^size([<>])(\d+(?:\.\d+)?)([kmgt]?b?)$')
+SIZE_UNITS = {'': 1, 'b': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SearchIndex:
+    """Inverted index over the local catalog and all cached peer catalogs.
+
+    Entries are stored column-wise and referenced by integer IDs. Postings
+    map filename tokens, filename trigrams, extensions and content hashes
+    to arrays of entry IDs. Each source (the local node or a peer) is
+    re-indexed only when its catalog version changes; replaced entries are
+    tombstoned and compacted once they make up half of the index.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.names = []
+        self.lower_names = []
+        self.sizes = array('q')
+        self.hashes = []
+        self.extensions = []
+        self.sources = []
+        self.modified = []
+        self.deleted = set()
+        self.source_entries = {}  # {source: [entry_id, ...]}
+        self.source_versions = {}  # {source: catalog_version}
+        self.tokens = {}  # {token: array of entry_ids}
+        self.grams = {}  # {trigram: array of entry_ids}
+        self.by_extension = {}  # {extension: array of entry_ids}
+        self.by_hash = {}  # {hash: array of entry_ids}
+
+    # ------------------------------------------------------------------
+    # Indexing
+    # ------------------------------------------------------------------
+
+    def update_source(self, source, files, version=None):
+        """Replace the indexed catalog of a source; no-op if the version is unchanged"""
+        with self.lock:
+            if version is not None and self.source_versions.get(source) == version:
+                return False
+
+            self._drop_source(source)
+            entry_ids = []
+            for file_info in files:
+                entry_ids.append(self._add_entry(source, file_info))
+            self.source_entries[source] = entry_ids
+            self.source_versions[source] = version
+
+            if len(self.deleted) > len(self.names) // 2 and len(self.deleted) > 1024:
+                self._compact()
+            return True
+
+    def remove_source(self, source):
+        with self.lock:
+            self._drop_source(source)
+            self.source_versions.pop(source, None)
+
+    def _drop_source(self, source):
+        for entry_id in self.source_entries.pop(source, ()):
+            self.deleted.add(entry_id)
+
+    def _add_entry(self, source, file_info):
+        entry_id = len(self.names)
+        name = file_info.get('name', '')
+        lower = name.lower()
+        extension = (file_info.get('extension') or '').lstrip('.').lower()
+        file_hash = file_info.get('hash')
+
+        self.names.append(name)
+        self.lower_names.append(lower)
+        self.sizes.append(int(file_info.get('size') or 0))
+        self.hashes.append(file_hash)
+        self.extensions.append(extension)
+        self.sources.append(source)
+        self.modified.append(file_info.get('modified'))
+
+        for token in set(tokenize(name)):
+            self.tokens.setdefault(token, array('I')).append(entry_id)
+        for gram in trigrams(lower):
+            self.grams.setdefault(gram, array('I')).append(entry_id)
+        if extension:
+            self.by_extension.setdefault(extension, array('I')).append(entry_id)
+        if file_hash:
+            self.by_hash.setdefault(file_hash, array('I')).append(entry_id)
+        return entry_id
+
+    def _compact(self):
+        """Rebuild the index without tombstoned entries"""
+        live = [
+            (source, [self._entry_dict(i) for i in entry_ids])
+            for source, entry_ids in self.source_entries.items()
+        ]
+        versions = self.source_versions
+        self._reset()
+        for source, files in live:
+            self.source_entries[source] = [self._add_entry(source, f) for f in files]
+        self.source_versions = versions
+
+    def _entry_dict(self, entry_id):
+        return {
+            'name': self.names[entry_id],
+            'size': self.sizes[entry_id],
+            'hash': self.hashes[entry_id],
+            'extension': '.' + self.extensions[entry_id] if self.extensions[entry_id] else '',
+            'modified': self.modified[entry_id]
+        }
+
+    # ------------------------------------------------------------------
+    # Querying
+    # ------------------------------------------------------------------
+
+    def search(self, query, limit=SEARCH_MAX_RESULTS):
+        """Return ranked hits, each grouping the sources that hold the same file"""
+        terms, filters = self._parse(query)
+        with self.lock:
+            # Copies of one file on several sources collapse into one hit,
+            # so rank a generous slice of candidates before grouping
+            wanted = limit * 8
+            scores = self._score_terms(terms, wanted) if terms else None
+            candidates = self._apply_filters(filters, scores)
+            if candidates is None:
+                return []
+
+            names = self.names
+            if scores:
+                key = lambda i: (-scores[i], len(names[i]), names[i])
+            else:
+                key = lambda i: (len(names[i]), names[i])
+            ranked = heapq.nsmallest(wanted, candidates, key=key)
+
+            hits = []
+            groups = {}
+            for entry_id in ranked:
+                key = self.hashes[entry_id] or (self.names[entry_id], self.sizes[entry_id])
+                hit = groups.get(key)
+                if hit is None:
+                    if len(hits) >= limit:
+                        continue
+                    hit = self._entry_dict(entry_id)
+                    hit['score'] = scores[entry_id] if scores else 0
+                    hit['locations'] = []
+                    groups[key] = hit
+                    hits.append(hit)
+                if self.sources[entry_id] not in hit['locations']:
+                    hit['locations'].append(self.sources[entry_id])
+
+            # Every source holding the same content is a location, whatever its filename
+            for hit in hits:
+                for entry_id in self.by_hash.get(hit['hash'], ()) if hit['hash'] else ():
+                    source = self.sources[entry_id]
+                    if entry_id not in self.deleted and source not in hit['locations']:
+                        hit['locations'].append(source)
+            return hits
+
+    def _parse(self, query):
+        terms, filters = [], []
+        for word in query.lower().split():
+            match = FILTER_RE.match(word)
+            if not match:
+                terms.extend(tokenize(word))
+            elif match.group(1):
+                filters.append((match.group(1), match.group(2).lstrip('.')))
+            else:
+                size = float(match.group(4)) * SIZE_UNITS[match.group(5)[:1]]
+                filters.append(('size' + match.group(3), size))
+        return terms, filters
+
+    def _score_terms(self, terms, wanted):
+        """Score entries: exact token match 3, substring match via trigrams 1.
+
+        Exact token postings are tried first; substring matching only runs
+        when they do not produce enough candidates.
+        """
+        exact = None
+        for term in terms:
+            postings = self.tokens.get(term)
+            if not postings:
+                exact = set()
+                break
+            exact = set(postings) if exact is None else exact.intersection(postings)
+            if not exact:
+                break
+        exact -= self.deleted
+        if len(exact) >= wanted:
+            return dict.fromkeys(exact, 3 * len(terms))
+
+        scores = None
+        for term in terms:
+            term_scores = {}
+            for entry_id in self.tokens.get(term, ()):
+                if entry_id not in self.deleted:
+                    term_scores[entry_id] = 3
+
+            for entry_id in self._substring_matches(term):
+                term_scores.setdefault(entry_id, 1)
+
+            if scores is None:
+                scores = term_scores
+            else:
+                scores = {i: s + term_scores[i] for i, s in scores.items() if i in term_scores}
+            if not scores:
+                return {}
+        return scores
+
+    def _substring_matches(self, term):
+        if len(term) < 3:
+            return [i for i in self.tokens.get(term, ()) if i not in self.deleted]
+
+        postings = [self.grams.get(gram) for gram in trigrams(term)]
+        if not all(postings):
+            return []
+        postings.sort(key=len)
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                return []
+        return [i for i in candidates if i not in self.deleted and term in self.lower_names[i]]
+
+    def _apply_filters(self, filters, scores):
+        candidates = set(scores) if scores is not None else None
+        for field, value in filters:
+            if field == 'ext':
+                matches = set(self.by_extension.get(value, ()))
+            elif field == 'hash':
+                matches = set(self.by_hash.get(value, ()))
+            elif field == 'peer':
+                matches = set(self.source_entries.get(value, ()))
+            else:
+                pool = candidates if candidates is not None else range(len(self.names))
+                if field == 'size>':
+                    matches = {i for i in pool if self.sizes[i] > value}
+                else:
+                    matches = {i for i in pool if self.sizes[i] < value}
+            candidates = matches if candidates is None else candidates & matches
+
+        if candidates is None:
+            return None
+        return candidates - self.deleted
+
+    def get_info(self):
+        with self.lock:
+            return {
+                'entries': len(self.names) - len(self.deleted),
+                'sources': len(self.source_entries),
+                'tokens': len(self.tokens),
+                'trigrams': len(self.grams)
+            }
+
+
+class SearchService:
+    """Keeps a SearchIndex in sync with the local catalog and the peer catalog cache.
+
+    The local catalog is re-indexed on a background thread whenever the
+    FileWatcher reports a change, so searches only ever read the index.
+    """
+
+    def __init__(self, file_manager, registry):
+        self.index = SearchIndex()
+        self.file_manager = file_manager
+        self.registry = registry
+        self.local_changed = threading.Event()
+        registry.catalog_listeners.append(self.on_catalog_change)
+
+    def start(self):
+        """Index catalogs already in the cache without blocking startup"""
+        threading.Thread(target=self.index_cached_catalogs, daemon=True).start()
+        threading.Thread(target=self._index_local, name="search-local", daemon=True).start()
+
+    def watch_files(self, file_watcher):
+        """Re-index the local catalog when the watcher reports a change"""
+        file_watcher.listeners.append(self.on_file_change)
+
+    def index_cached_catalogs(self):
+        self.refresh_local()
+        for peer_id in self.registry.catalog_ids():
+            entry = self.registry.get_catalog_entry(peer_id)
+            if entry:
+                self.index.update_source(peer_id, entry[2], entry[0])
+
+    def on_catalog_change(self, peer_id, entry):
+        if entry is None:
+            self.index.remove_source(peer_id)
+        else:
+            self.index.update_source(peer_id, entry[2], entry[0])
+
+    def on_file_change(self, name, old, new):
+        """FileWatcher listener; a burst of changes is indexed in one pass"""
+        self.local_changed.set()
+
+    def _index_local(self):
+        while True:
+            self.local_changed.wait()
+            self.local_changed.clear()
+            try:
+                self.refresh_local()
+            except Exception as e:
+                logging.error(f"Error indexing local files: {e}")
+
+    def refresh_local(self):
+        files = self.file_manager.list_files()
+        self.index.update_source(LOCAL_SOURCE, files, catalog_version(files))
+
+    def search(self, query, limit=SEARCH_MAX_RESULTS):
+        return self.index.search(query, limit)
@@ -0,0 +1,27 @@
+import json
+
+try:
+    import orjson
+except ImportError:  # Optional; several times faster than json for large listings
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # Optional; the msgpack listing format is unavailable without it
+    msgpack = None
+
+MSGPACK_MIMETYPE = 'application/msgpack'
+
+
+def dumps_json(payload):
+    """Compact JSON bytes with the fastest encoder installed"""
+    if orjson:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+
+def dumps_msgpack(payload):
+    """MessagePack bytes; raises LookupError if msgpack isn't installed"""
+    if msgpack is None:
+        raise LookupError("MessagePack is not available on this server (install msgpack)")
+    return msgpack.packb(payload, use_bin_type=True)
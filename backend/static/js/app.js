@@ -8,9 +8,17 @@ let appData = {
     files: [],
     peers: [],
     activePeers: [],
+    jobs: {},
     stats: {}
 };
 
+// While the event stream is connected, data already loaded is kept current
+// by its events and isn't fetched again
+let liveUpdates = false;
+const loaded = { files: false, peers: false };
+const jobWatchers = new Set();
+let renderTimer = null;
+
 // Utility functions
 function formatFileSize(bytes) {
     if (bytes === 0) return '0 B';
@@ -193,6 +201,11 @@ function showPage(pageName, clickedElement = null) {
 
 // Update statistics
 async function updateStats() {
+    if (liveUpdates && loaded.files && loaded.peers) {
+        renderStats();
+        return;
+    }
+    
     try {
         const response = await api.getStats();
         if (response.success) {
@@ -214,11 +227,11 @@ async function refreshAll() {
     
     try {
         await Promise.all([
-            updateStats(),
-            loadFiles(),
-            loadPeers(),
+            loadFiles(true),
+            loadPeers(true),
             api.refreshPeers()
         ]);
+        await updateStats();
         
         // Reload current page
         showPage(currentPage);
@@ -230,11 +243,15 @@ async function refreshAll() {
 }
 
 // Data loading functions
-async function loadFiles() {
+async function loadFiles(force = false) {
+    if (loaded.files && !force) return;
+    
     try {
+        const live = liveUpdates;
         const response = await api.getFiles();
         if (response.success) {
             appData.files = response.files;
+            loaded.files = live;
         }
     } catch (error) {
         console.error('Failed to load files:', error);
@@ -242,12 +259,16 @@ async function loadFiles() {
     }
 }
 
-async function loadPeers() {
+async function loadPeers(force = false) {
+    if (loaded.peers && !force) return;
+    
     try {
+        const live = liveUpdates;
         const response = await api.getPeers();
         if (response.success) {
             appData.peers = response.peers;
             appData.activePeers = response.active_peers;
+            loaded.peers = live;
         }
     } catch (error) {
         console.error('Failed to load peers:', error);
@@ -265,6 +286,7 @@ async function deleteFile(filename) {
         const response = await api.deleteFile(filename);
         if (response.success) {
             showToast('Success', response.message, 'success');
+            appData.files = appData.files.filter(file => file.name !== filename);
             loadFilesPage(); // Reload files page
             updateStats(); // Update stats
         } else {
@@ -324,28 +346,31 @@ async function testPeerConnection(peerId) {
 
 async function downloadFromPeer(peerId, filename) {
     try {
-        showToast('Download', `Starting download of "${filename}" from peer...`, 'info');
+        const response = await api.downloadFromPeer(peerId, filename);
+        if (!response.success) {
+            showToast('Error', response.message, 'error');
+            addToTransferHistory(filename, 'download', peerId, 'Unknown', 'failed');
+            return;
+        }
         
-        // Add to transfer history
-        addToTransferHistory(filename, 'download', peerId, 'Unknown', 'in_progress');
+        showToast('Download', `Queued download of "${filename}" from peer`, 'info');
+        if (currentPage === 'transfers') {
+            refreshJobs();
+        }
         
-        const response = await api.downloadFromPeer(peerId, filename);
-        if (response.success) {
-            showToast('Success', response.message, 'success');
-            
-            // Update transfer history
-            addToTransferHistory(filename, 'download', peerId, 'Unknown', 'completed');
+        const job = await waitForJob(response.job_id);
+        if (job.state === 'completed') {
+            showToast('Success', `Downloaded "${filename}"`, 'success');
+            addToTransferHistory(filename, 'download', peerId, formatFileSize(job.total || 0), 'completed');
             
             // Reload files page to show the new file
-            setTimeout(() => {
-                if (currentPage === 'files') {
-                    loadFilesPage();
-                }
-                updateStats();
-            }, 1000);
-        } else {
-            showToast('Error', response.message, 'error');
-            addToTransferHistory(filename, 'download', peerId, 'Unknown', 'failed');
+            if (currentPage === 'files') {
+                loadFilesPage();
+            }
+            updateStats();
+        } else if (job.state !== 'paused') {
+            showToast('Error', job.message || `Download ${job.state}`, 'error');
+            addToTransferHistory(filename, 'download', peerId, 'Unknown', job.state);
         }
     } catch (error) {
         showToast('Error', 'Failed to download from peer: ' + error.message, 'error');
@@ -353,6 +378,39 @@ async function downloadFromPeer(peerId, filename) {
     }
 }
 
+// Wait for a download job to complete, fail, be cancelled or paused; job events
+// settle it while the event stream is up, polling covers the time it is down
+function waitForJob(jobId, interval = 1000) {
+    const finished = job => ['completed', 'failed', 'cancelled', 'paused'].includes(job.state);
+    
+    return new Promise((resolve, reject) => {
+        let timer = null;
+        const check = job => {
+            if (job.job_id === jobId && finished(job)) {
+                jobWatchers.delete(check);
+                clearInterval(timer);
+                resolve(job);
+            }
+        };
+        const poll = async () => {
+            if (liveUpdates) return;
+            try {
+                const response = await api.getJob(jobId);
+                check(response.job);
+            } catch (error) {
+                jobWatchers.delete(check);
+                clearInterval(timer);
+                reject(error);
+            }
+        };
+        
+        jobWatchers.add(check);
+        if (appData.jobs[jobId]) check(appData.jobs[jobId]);
+        timer = setInterval(poll, interval);
+        poll();
+    });
+}
+
 // Add transfer to history function
 function addToTransferHistory(filename, direction, peer, size, status) {
     const history = JSON.parse(localStorage.getItem('transferHistory') || '[]');
@@ -372,6 +430,109 @@ function addToTransferHistory(filename, direction, peer, size, status) {
     localStorage.setItem('transferHistory', JSON.stringify(history));
 }
 
+// Live updates over Server-Sent Events
+function connectEvents() {
+    if (!window.EventSource) return;
+    
+    const source = api.subscribeEvents();
+    const on = (type, handler) => source.addEventListener(type, event => handler(JSON.parse(event.data)));
+    
+    source.onopen = () => {
+        liveUpdates = true;
+    };
+    source.onerror = () => {
+        // The browser reconnects by itself; until then load data as before
+        liveUpdates = false;
+        loaded.files = loaded.peers = false;
+    };
+    
+    on('file.added', upsertFile);
+    on('file.changed', upsertFile);
+    on('file.removed', data => {
+        appData.files = appData.files.filter(file => file.name !== data.name);
+        dataChanged(['dashboard', 'files']);
+    });
+    on('peer', data => {
+        if (data.peer) {
+            appData.peers[data.peer_id] = data.peer;
+        } else {
+            delete appData.peers[data.peer_id];
+        }
+        if (data.peer && data.peer.active) {
+            appData.activePeers[data.peer_id] = data.peer;
+        } else {
+            delete appData.activePeers[data.peer_id];
+        }
+        dataChanged(['dashboard', 'peers']);
+    });
+    on('job', job => {
+        appData.jobs[job.job_id] = job;
+        jobWatchers.forEach(check => check(job));
+        if (currentPage === 'transfers') {
+            renderJobs();
+        }
+    });
+    on('resync', () => {
+        // Events were missed; reload whatever the current page shows
+        loaded.files = loaded.peers = false;
+        dataChanged([currentPage]);
+    });
+}
+
+function upsertFile(file) {
+    const index = appData.files.findIndex(existing => existing.name === file.name);
+    if (index >= 0) {
+        appData.files[index] = file;
+    } else {
+        appData.files.push(file);
+    }
+    dataChanged(['dashboard', 'files']);
+}
+
+// Re-render the current page (at most every 250 ms) if it shows changed data
+function dataChanged(pages) {
+    renderStats();
+    if (!pages.includes(currentPage) || renderTimer) return;
+    
+    renderTimer = setTimeout(() => {
+        renderTimer = null;
+        rerenderPage();
+    }, 250);
+}
+
+function rerenderPage() {
+    // Keep a network search on the peers page across the re-render
+    const searchInput = document.getElementById('networkSearchInput');
+    const searchResults = document.getElementById('networkSearchResults');
+    const search = searchInput ? [searchInput.value, searchResults.innerHTML] : null;
+    
+    const loader = { dashboard: loadDashboard, files: loadFilesPage, peers: loadPeersPage }[currentPage];
+    if (!loader) return;
+    loader().then(() => {
+        if (search && document.getElementById('networkSearchInput')) {
+            document.getElementById('networkSearchInput').value = search[0];
+            document.getElementById('networkSearchResults').innerHTML = search[1];
+        }
+    });
+}
+
+// Sidebar stats from the data the event stream keeps current
+function renderStats() {
+    if (!loaded.files || !loaded.peers) return;
+    
+    const totalSize = appData.files.reduce((sum, file) => sum + (file.size || 0), 0);
+    Object.assign(appData.stats, {
+        total_files: appData.files.length,
+        total_file_size: totalSize,
+        total_file_size_human: formatFileSize(totalSize),
+        total_peers: Object.keys(appData.peers).length,
+        active_peers: Object.keys(appData.activePeers).length
+    });
+    document.getElementById('statsFiles').textContent = appData.stats.total_files;
+    document.getElementById('statsPeers').textContent = appData.stats.total_peers;
+    document.getElementById('statsActive').textContent = appData.stats.active_peers;
+}
+
 // Initialize tooltips
 document.addEventListener('DOMContentLoaded', function() {
     // Initialize Bootstrap tooltips
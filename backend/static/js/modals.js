@@ -143,7 +143,7 @@ function initializeDragAndDrop() {
         <div>
             <strong>Drop files here</strong> or click to browse
         </div>
-        <div class="text-muted">Maximum file size: 100MB</div>
+        <div class="text-muted">Files are streamed to disk; size is limited only by free space</div>
     `;
     
     // Insert drop zone after file input
@@ -293,7 +293,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 <div>
                     <strong>Drop files here</strong> or click to browse
                 </div>
-                <div class="text-muted">Maximum file size: 100MB</div>
+                <div class="text-muted">Files are streamed to disk; size is limited only by free space</div>
             `;
             dropZone.classList.remove('drag-over');
         }
@@ -255,6 +255,21 @@ async function loadPeersPage() {
                 </div>
             </div>
             
+            <!-- Network Search -->
+            <div class="row mb-4">
+                <div class="col-12">
+                    <div class="input-group">
+                        <input type="text" class="form-control" id="networkSearchInput"
+                               placeholder="Search files on all peers (e.g. report ext:pdf size>1mb)"
+                               onkeydown="if (event.key === 'Enter') searchNetwork()">
+                        <button class="btn btn-primary" onclick="searchNetwork()">
+                            <i class="bi bi-search"></i> Search
+                        </button>
+                    </div>
+                    <div id="networkSearchResults" class="mt-3"></div>
+                </div>
+            </div>
+            
             ${peersList.length > 0 ? `
                 <div class="row">
                     ${peersList.map(([peerId, peer]) => `
@@ -421,6 +436,104 @@ async function loadTransfersPage() {
     
     contentDiv.innerHTML = transfersHtml;
     contentDiv.classList.add('fade-in');
+    
+    // Job events keep the list current; poll only while the event stream is down
+    clearInterval(jobsRefreshTimer);
+    refreshJobs();
+    jobsRefreshTimer = setInterval(() => {
+        if (currentPage !== 'transfers') {
+            clearInterval(jobsRefreshTimer);
+        } else if (!liveUpdates) {
+            refreshJobs();
+        }
+    }, 2000);
+}
+
+let jobsRefreshTimer = null;
+
+// Load download jobs and render them
+async function refreshJobs() {
+    const container = document.getElementById('activeTransfers');
+    if (!container) return;
+    
+    try {
+        const response = await api.getJobs();
+        appData.jobs = {};
+        response.jobs.forEach(job => {
+            appData.jobs[job.job_id] = job;
+        });
+        renderJobs();
+    } catch (error) {
+        container.innerHTML = `<div class="text-danger">Failed to load transfers: ${error.message}</div>`;
+    }
+}
+
+// Render queued, running and paused download jobs
+function renderJobs() {
+    const container = document.getElementById('activeTransfers');
+    if (!container) return;
+    
+    const jobs = Object.values(appData.jobs)
+        .filter(job => ['running', 'queued', 'paused'].includes(job.state))
+        .sort((a, b) => b.created_at - a.created_at);
+    document.getElementById('activeTransferCount').textContent = jobs.length;
+    
+    if (jobs.length === 0) {
+        container.innerHTML = `
+            <div class="text-center text-muted py-3">
+                <i class="bi bi-check-circle" style="font-size: 2rem; opacity: 0.5;"></i>
+                <p class="mt-2">No active transfers</p>
+            </div>
+        `;
+        return;
+    }
+    
+    container.innerHTML = jobs.map(job => {
+        const percent = job.progress !== null ? Math.round(job.progress * 100) : 0;
+        const details = job.state === 'running'
+            ? `${formatFileSize(job.bytes_done)}${job.total !== null ? ' / ' + formatFileSize(job.total) : ''}` +
+              `${job.speed ? ' &middot; ' + formatFileSize(job.speed) + '/s' : ''}` +
+              `${job.eta !== null ? ' &middot; ' + Math.ceil(job.eta) + 's left' : ''}`
+            : job.state;
+        return `
+            <div class="mb-3">
+                <div class="d-flex justify-content-between align-items-center mb-1">
+                    <div>
+                        <i class="bi bi-download me-2"></i>
+                        <strong>${job.filename}</strong>
+                        <small class="text-muted ms-2">from ${job.peer_id}</small>
+                        <span class="badge ${job.priority === 'interactive' ? 'bg-info' : job.priority === 'bulk' ? 'bg-secondary' : 'bg-primary'} ms-2">${job.priority}</span>
+                    </div>
+                    <div class="btn-group btn-group-sm">
+                        ${job.state === 'paused'
+                            ? `<button class="btn btn-outline-success" onclick="controlJob('${job.job_id}', 'resume')" title="Resume"><i class="bi bi-play-fill"></i></button>`
+                            : `<button class="btn btn-outline-warning" onclick="controlJob('${job.job_id}', 'pause')" title="Pause"><i class="bi bi-pause-fill"></i></button>`}
+                        <button class="btn btn-outline-danger" onclick="controlJob('${job.job_id}', 'cancel')" title="Cancel"><i class="bi bi-x-lg"></i></button>
+                    </div>
+                </div>
+                <div class="progress" style="height: 6px;">
+                    <div class="progress-bar ${job.state === 'running' ? 'progress-bar-striped progress-bar-animated' : 'bg-secondary'}"
+                         style="width: ${percent}%"></div>
+                </div>
+                <small class="text-muted">${percent}% &middot; ${details}</small>
+            </div>
+        `;
+    }).join('');
+}
+
+// Pause, resume or cancel a download job
+async function controlJob(jobId, action) {
+    try {
+        const response = await api.controlJob(jobId, action);
+        if (!response.success) {
+            showToast('Error', response.message, 'error');
+        }
+        if (!liveUpdates) {
+            refreshJobs();
+        }
+    } catch (error) {
+        showToast('Error', `Failed to ${action} download: ` + error.message, 'error');
+    }
 }
 
 // Clear transfer history
@@ -517,3 +630,68 @@ async function viewPeerFiles(peerId) {
         showToast('Error', 'Failed to get peer files: ' + error.message, 'error');
     }
 }
+
+// Search local and cached peer catalogs
+async function searchNetwork() {
+    const query = document.getElementById('networkSearchInput').value.trim();
+    const resultsDiv = document.getElementById('networkSearchResults');
+    
+    if (!query) {
+        resultsDiv.innerHTML = '';
+        return;
+    }
+    
+    try {
+        const response = await api.search(query);
+        if (!response.success) {
+            showError(resultsDiv, response.message);
+            return;
+        }
+        
+        if (response.hits.length === 0) {
+            resultsDiv.innerHTML = `<div class="text-muted">No files match "${query}"</div>`;
+            return;
+        }
+        
+        resultsDiv.innerHTML = `
+            <div class="table-responsive">
+                <table class="table table-dark table-striped">
+                    <thead>
+                        <tr>
+                            <th>Name</th>
+                            <th>Size</th>
+                            <th>Available From</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+                        ${response.hits.map(hit => `
+                            <tr>
+                                <td>
+                                    <i class="bi ${getFileIcon(hit.extension)} me-2"></i>
+                                    ${hit.name}
+                                </td>
+                                <td>${formatFileSize(hit.size)}</td>
+                                <td>
+                                    ${hit.locations.map(location => location === 'local' ? `
+                                        <button class="btn btn-outline-primary btn-sm me-1 mb-1"
+                                                onclick="downloadFileLocal('${hit.name}')">
+                                            <i class="bi bi-hdd"></i> Local
+                                        </button>
+                                    ` : `
+                                        <button class="btn btn-primary btn-sm me-1 mb-1"
+                                                onclick="downloadFromPeer('${location}', '${hit.name}')">
+                                            <i class="bi bi-download"></i> ${location}
+                                        </button>
+                                    `).join('')}
+                                </td>
+                            </tr>
+                        `).join('')}
+                    </tbody>
+                </table>
+            </div>
+            <small class="text-muted">${response.count} results in ${response.took_ms} ms</small>
+        `;
+    } catch (error) {
+        showError(resultsDiv, 'Search failed: ' + error.message);
+    }
+}
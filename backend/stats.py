@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+from config import STATS_WINDOWS, STATS_METER_BATCH
+
+COUNTERS = ('bytes_in', 'bytes_out', 'files_added', 'files_changed', 'files_removed')
+
+
+def parse_windows(value):
+    """Window names from a comma-separated query value ('all' for every window); raises ValueError"""
+    if not value:
+        return []
+    if value == 'all':
+        return list(STATS_WINDOWS)
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in names if name not in STATS_WINDOWS]
+    if unknown:
+        raise ValueError(f"Unknown window {', '.join(unknown)} (expected {', '.join(STATS_WINDOWS)})")
+    return names
+
+
+class WindowedCounter:
+    """Running total plus sliding-window sums at one-second resolution.
+
+    Keeps one bucket per second for the longest window and a running sum
+    for each window; as time moves on, the bucket leaving a window is
+    subtracted from its sum. Adding and reading are O(1) apart from
+    catching up on the seconds elapsed since the last call.
+    """
+    __slots__ = ('total', 'spans', 'buckets', 'sums', 'second')
+
+    def __init__(self, spans):
+        self.total = 0
+        self.spans = spans
+        self.buckets = [0] * max(spans)
+        self.sums = [0] * len(spans)
+        self.second = int(time.monotonic())
+
+    def add(self, n, now):
+        self._advance(now)
+        self.buckets[now % len(self.buckets)] += n
+        for i in range(len(self.sums)):
+            self.sums[i] += n
+        self.total += n
+
+    def window(self, index, now):
+        self._advance(now)
+        return self.sums[index]
+
+    def _advance(self, now):
+        size = len(self.buckets)
+        if now - self.second >= size:
+            self.buckets = [0] * size
+            self.sums = [0] * len(self.spans)
+        else:
+            for second in range(self.second + 1, now + 1):
+                for i, span in enumerate(self.spans):
+                    self.sums[i] -= self.buckets[(second - span) % size]
+                self.buckets[second % size] = 0
+        self.second = max(self.second, now)
+
+
+class ByteMeter:
+    """Per-transfer byte count handed to a StatsCollector in batches.
+
+    Transfer loops call add() for every chunk; the collector's lock is
+    only taken once per `batch` bytes and on flush().
+    """
+    __slots__ = ('collector', 'counter', 'batch', 'pending')
+
+    def __init__(self, collector, counter, batch=STATS_METER_BATCH):
+        self.collector = collector
+        self.counter = counter
+        self.batch = batch
+        self.pending = 0
+
+    def add(self, n):
+        self.pending += n
+        if self.pending >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.collector.add(self.counter, self.pending)
+            self.pending = 0
+
+
+class StatsCollector:
+    """Server statistics kept as running counters, so reading them costs nothing.
+
+    File totals follow the FileWatcher (count, bytes and both by
+    extension); traffic and file churn are WindowedCounters fed by the
+    code that moves the bytes. Values owned by other components (peer
+    counts, transfers in flight, job states) are registered as gauges and
+    read on demand; each of them is O(1) as well.
+    """
+
+    def __init__(self, windows=STATS_WINDOWS):
+        self.windows = windows
+        self.spans = tuple(windows.values())
+        self.counters = {name: WindowedCounter(self.spans) for name in COUNTERS}
+        self.file_count = 0
+        self.file_bytes = 0
+        self.by_extension = {}  # {extension: [count, bytes]}
+        self.gauges = {}  # {name: callable}
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+
+    def add(self, counter, n=1):
+        if n:
+            with self.lock:
+                self.counters[counter].add(n, int(time.monotonic()))
+
+    def meter(self, counter):
+        """ByteMeter for one transfer; flush() it when the transfer ends"""
+        return ByteMeter(self, counter)
+
+    def total(self, counter):
+        return self.counters[counter].total
+
+    def register_gauge(self, name, read):
+        self.gauges[name] = read
+
+    def watch_files(self, file_watcher):
+        """Start from the watcher's current view of the shared directory and follow its changes"""
+        file_watcher.listeners.append(self.on_file_change)
+        files = file_watcher.snapshot()
+        with self.lock:
+            self.file_count = self.file_bytes = 0
+            self.by_extension = {}
+            for name, (size, _) in files.items():
+                self._count_file(name, size, 1)
+
+    def on_file_change(self, name, old, new):
+        """FileWatcher listener; old and new are (size, mtime_ns) or None"""
+        now = int(time.monotonic())
+        with self.lock:
+            if old:
+                self._count_file(name, old[0], -1)
+            if new:
+                self._count_file(name, new[0], 1)
+            counter = 'files_changed' if old and new else 'files_added' if new else 'files_removed'
+            self.counters[counter].add(1, now)
+
+    def snapshot(self, windows=()):
+        """Current values; `windows` names windows to report counter sums and rates for"""
+        now = int(time.monotonic())
+        with self.lock:
+            stats = {
+                'total_files': self.file_count,
+                'total_file_size': self.file_bytes,
+                'files_by_extension': {ext: {'files': count, 'bytes': size}
+                                       for ext, (count, size) in self.by_extension.items()},
+                'uptime': round(time.time() - self.started_at),
+            }
+            for name, counter in self.counters.items():
+                stats[name] = counter.total
+            if windows:
+                stats['windows'] = {}
+                for window in windows:
+                    index = list(self.windows).index(window)
+                    span = self.spans[index]
+                    values = {}
+                    for name, counter in self.counters.items():
+                        values[name] = counter.window(index, now)
+                    values['bytes_in_rate'] = round(values['bytes_in'] / span)
+                    values['bytes_out_rate'] = round(values['bytes_out'] / span)
+                    stats['windows'][window] = values
+        for name, read in list(self.gauges.items()):
+            stats[name] = read()
+        return stats
+
+    def _count_file(self, name, size, sign):
+        # Caller holds self.lock
+        self.file_count += sign
+        self.file_bytes += sign * size
+        extension = os.path.splitext(name)[1].lower()
+        entry = self.by_extension.setdefault(extension, [0, 0])
+        entry[0] += sign
+        entry[1] += sign * size
+        if not entry[0]:
+            del self.by_extension[extension]
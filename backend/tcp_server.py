@@ -3,17 +3,37 @@ import threading
 import os
 import json
 import logging
-from config import TCP_HOST, TCP_PORT, SHARED_FILES_DIR, CHUNK_SIZE
-from file_manager import FileManager
+import time
+import uuid
+from contextlib import nullcontext
+from config import (TCP_HOST, TCP_PORT, SHARED_FILES_DIR, INCOMING_DIR, CHUNK_SIZE, SUMMARY_REBUILD_INTERVAL,
+                    TCP_BANDWIDTH_LIMIT, TRANSFER_TIMEOUT, READ_BLOCK_SIZE)
+from bloom import ContentSummary
+from read_ahead import SequentialReader
+from file_manager import FileManager, catalog_version, columns_version
+from transfer_scheduler import TransferScheduler, normalize_priority
+from metrics import TCP_COMMAND_SECONDS, TCP_CONNECTIONS, TCP_CONNECTIONS_TOTAL, observe_transfer
+
+COMMANDS = ('list_files', 'download_file', 'upload_file', 'get_summary', 'ping')
 
 class TCPFileServer:
-    def __init__(self):
+    def __init__(self, peer_priority=None, server_stats=None, file_cache=None, file_manager=None):
+        """peer_priority(ip) returns the default transfer class for a client address, or None;
+        bytes sent and received are counted on server_stats (a StatsCollector) if given;
+        popular small files are sent from file_cache (a FileCache) if given; file_manager
+        shares its hash cache and store with the HTTP side"""
         self.host = TCP_HOST
         self.port = TCP_PORT
         self.socket = None
-        self.file_manager = FileManager()
+        self.file_manager = file_manager or FileManager()
         self.active_transfers = {}
         self.running = False
+        self.summary = ContentSummary()
+        self.summary_synced_at = 0
+        self.scheduler = TransferScheduler(bandwidth=TCP_BANDWIDTH_LIMIT)
+        self.peer_priority = peer_priority
+        self.server_stats = server_stats
+        self.file_cache = file_cache
         
     def start(self):
         """Start the TCP server"""
@@ -48,6 +68,8 @@ class TCPFileServer:
     
     def handle_client(self, client_socket, client_address):
         """Handle individual client connections"""
+        TCP_CONNECTIONS.inc()
+        TCP_CONNECTIONS_TOTAL.inc()
         try:
             while True:
                 # Receive command from client
@@ -57,11 +79,16 @@ class TCPFileServer:
                     
                 try:
                     command = json.loads(data)
+                    started = time.perf_counter()
                     response = self.process_command(command, client_socket)
                     
                     # Send response back to client
                     if response:
-                        client_socket.send(json.dumps(response).encode('utf-8'))
+                        client_socket.sendall(json.dumps(response).encode('utf-8'))
+                    
+                    cmd_type = command.get('type')
+                    TCP_COMMAND_SECONDS.labels(cmd_type if cmd_type in COMMANDS else 'unknown').observe(
+                        time.perf_counter() - started)
                         
                 except json.JSONDecodeError:
                     error_response = {"status": "error", "message": "Invalid JSON command"}
@@ -70,6 +97,7 @@ class TCPFileServer:
         except Exception as e:
             logging.error(f"Error handling client {client_address}: {e}")
         finally:
+            TCP_CONNECTIONS.dec()
             client_socket.close()
             logging.info(f"Connection closed for {client_address}")
     
@@ -78,47 +106,103 @@ class TCPFileServer:
         cmd_type = command.get('type')
         
         if cmd_type == 'list_files':
-            return self.handle_list_files()
+            return self.handle_list_files(command)
         elif cmd_type == 'download_file':
             return self.handle_download_file(command, client_socket)
         elif cmd_type == 'upload_file':
             return self.handle_upload_file(command, client_socket)
+        elif cmd_type == 'get_summary':
+            return self.handle_get_summary(command)
         elif cmd_type == 'ping':
             return {"status": "success", "message": "pong"}
         else:
             return {"status": "error", "message": "Unknown command"}
     
-    def handle_list_files(self):
-        """Return list of available files"""
+    def handle_list_files(self, command):
+        """Return list of available files, or not_modified if the caller's version is current.
+        
+        With "format": "columnar" the listing is sent as one list per field
+        (see FileManager.list_columns); older peers ignore the field and
+        get the full listing.
+        """
         try:
-            files = self.file_manager.list_files()
+            if command.get('format') == 'columnar':
+                columns = self.file_manager.list_columns()
+                version = columns_version(columns)
+                listing = {"format": "columnar", "columns": columns}
+            else:
+                files = self.file_manager.list_files()
+                version = catalog_version(files)
+                listing = {"files": files}
+            if command.get('if_none_match') == version:
+                return {"status": "not_modified", "catalog_version": version}
             return {
                 "status": "success",
-                "files": files
+                "catalog_version": version,
+                **listing
             }
         except Exception as e:
             logging.error(f"Error listing files: {e}")
             return {"status": "error", "message": str(e)}
     
+    def handle_get_summary(self, command):
+        """Return the Bloom filter summary of our files, as a delta when possible"""
+        try:
+            now = time.time()
+            if now - self.summary_synced_at >= SUMMARY_REBUILD_INTERVAL:
+                self.summary_synced_at = now
+                self.summary.sync(self.file_manager.list_files())
+            return self.summary.export(command.get('epoch'), command.get('since'))
+        except Exception as e:
+            logging.error(f"Error building content summary: {e}")
+            return {"status": "error", "message": str(e)}
+    
+    def acquire_slot(self, command, client_socket, size):
+        """Queue for a transfer slot in the command's priority class (or the client's default)"""
+        default = None
+        if self.peer_priority:
+            try:
+                default = self.peer_priority(client_socket.getpeername()[0])
+            except OSError:
+                pass
+        priority = normalize_priority(command.get('priority'), default)
+        return self.scheduler.acquire(priority, size, timeout=TRANSFER_TIMEOUT)
+    
     def handle_download_file(self, command, client_socket):
         """Handle file download requests"""
         filename = command.get('filename')
         if not filename:
             return {"status": "error", "message": "Filename required"}
         
+        ticket = None
+        started = time.monotonic()
+        first_byte_at = None
+        bytes_sent = 0
+        meter = self.server_stats.meter('bytes_out') if self.server_stats else None
         try:
             file_path = os.path.join(SHARED_FILES_DIR, filename)
             if not os.path.exists(file_path):
                 return {"status": "error", "message": "File not found"}
             
-            file_size = os.path.getsize(file_path)
+            stat = os.stat(file_path)
+            file_size = stat.st_size
+            offset = min(max(int(command.get('offset') or 0), 0), file_size)
+            
+            # Wait for a slot; smaller remaining transfers go first within a class
+            ticket = self.acquire_slot(command, client_socket, file_size - offset)
+            if ticket is None:
+                return {"status": "error", "message": "Server busy, try again later"}
             
             # Send file metadata first
             metadata = {
                 "status": "success",
                 "filename": filename,
-                "size": file_size
+                "size": file_size,
+                "offset": offset
             }
+            if offset:
+                # Lets the client check its partial file is of this version before appending
+                metadata["hash"] = self.file_manager.get_file_hash(file_path, stat)
             client_socket.send(json.dumps(metadata).encode('utf-8'))
             
             # Wait for client acknowledgment
@@ -126,22 +210,36 @@ class TCPFileServer:
             if ack != "ready":
                 return {"status": "error", "message": "Client not ready"}
             
-            # Send file data
-            with open(file_path, 'rb') as f:
-                bytes_sent = 0
-                while bytes_sent < file_size:
-                    chunk = f.read(CHUNK_SIZE)
-                    if not chunk:
-                        break
-                    client_socket.send(chunk)
-                    bytes_sent += len(chunk)
+            # Send file data, resuming from the requested offset
+            first_byte_at = time.monotonic()
+            content = self.file_cache.read(file_path, stat) if self.file_cache else None
+            if content is not None:
+                view = memoryview(content)
+                reader = nullcontext(view[start:start + READ_BLOCK_SIZE]
+                                     for start in range(offset, file_size, READ_BLOCK_SIZE))
+            else:
+                reader = SequentialReader(file_path, offset, file_size - offset)
+            with reader as blocks:
+                for block in blocks:
+                    client_socket.sendall(block)
+                    bytes_sent += len(block)
+                    ticket.throttle(len(block))
+                    if meter:
+                        meter.add(len(block))
             
-            logging.info(f"File {filename} sent successfully ({bytes_sent} bytes)")
+            logging.info(f"File {filename} sent successfully ({offset + bytes_sent} bytes)")
             return None  # Response already sent
             
         except Exception as e:
             logging.error(f"Error downloading file {filename}: {e}")
             return {"status": "error", "message": str(e)}
+        finally:
+            if ticket:
+                ticket.release()
+                observe_transfer('tcp_send', bytes_sent, started, first_byte_at, time.monotonic(),
+                                 offset + bytes_sent == file_size)
+            if meter:
+                meter.flush()
     
     def handle_upload_file(self, command, client_socket):
         """Handle file upload requests"""
@@ -151,32 +249,58 @@ class TCPFileServer:
         if not filename or not file_size:
             return {"status": "error", "message": "Filename and size required"}
         
+        ticket = None
+        started = time.monotonic()
+        first_byte_at = None
+        bytes_received = 0
+        temp_path = None
+        meter = self.server_stats.meter('bytes_in') if self.server_stats else None
         try:
             file_path = os.path.join(SHARED_FILES_DIR, filename)
             
+            ticket = self.acquire_slot(command, client_socket, file_size)
+            if ticket is None:
+                return {"status": "error", "message": "Server busy, try again later"}
+            
             # Send ready signal
             client_socket.send("ready".encode('utf-8'))
             
-            # Receive file data
-            with open(file_path, 'wb') as f:
-                bytes_received = 0
+            # Receive into a temp file and rename it into place once complete,
+            # so downloads of the previous version aren't cut short
+            os.makedirs(INCOMING_DIR, exist_ok=True)
+            temp_path = os.path.join(INCOMING_DIR, f"{uuid.uuid4().hex}.upload")
+            with open(temp_path, 'wb') as f:
                 while bytes_received < file_size:
                     chunk = client_socket.recv(min(CHUNK_SIZE, file_size - bytes_received))
                     if not chunk:
                         break
+                    if first_byte_at is None:
+                        first_byte_at = time.monotonic()
                     f.write(chunk)
                     bytes_received += len(chunk)
+                    ticket.throttle(len(chunk))
+                    if meter:
+                        meter.add(len(chunk))
             
             if bytes_received == file_size:
+                os.replace(temp_path, file_path)
                 logging.info(f"File {filename} received successfully ({bytes_received} bytes)")
                 return {"status": "success", "message": "File uploaded successfully"}
             else:
-                os.remove(file_path)  # Remove incomplete file
                 return {"status": "error", "message": "Incomplete file transfer"}
                 
         except Exception as e:
             logging.error(f"Error uploading file {filename}: {e}")
             return {"status": "error", "message": str(e)}
+        finally:
+            if ticket:
+                ticket.release()
+                observe_transfer('tcp_receive', bytes_received, started, first_byte_at, time.monotonic(),
+                                 bytes_received == file_size)
+            if temp_path and os.path.exists(temp_path):  # Incomplete or failed
+                os.remove(temp_path)
+            if meter:
+                meter.flush()
     
     def stop(self):
         """Stop the TCP server"""
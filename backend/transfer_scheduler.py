@@ -0,0 +1,177 @@
+import heapq
+import itertools
+import math
+import threading
+import time
+from config import TRANSFER_CLASS_WEIGHTS, TRANSFER_DEFAULT_PRIORITY, TRANSFER_SLOTS
+
+PRIORITY_CLASSES = ('interactive', 'normal', 'bulk')  # Highest first
+
+
+def normalize_priority(value, default=None):
+    """Validate a priority class name; empty values fall back to `default`"""
+    if value in (None, ''):
+        return default or TRANSFER_DEFAULT_PRIORITY
+    if value not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class: {value} (expected one of {', '.join(PRIORITY_CLASSES)})")
+    return value
+
+
+class ClassQueue:
+    """Waiting items grouped by priority class, shortest job first within a class.
+
+    pick_class() decides which class gets the next free slot: among classes
+    with waiters, the one holding the fewest slots relative to its weight,
+    so busy classes share slots in proportion to their weights. A class
+    may not take the last free slot while a higher class is idle (unless
+    nothing is running at all), which keeps one slot open for an
+    interactive request arriving behind a full pool of bulk transfers.
+    """
+
+    def __init__(self, weights=TRANSFER_CLASS_WEIGHTS):
+        self.weights = weights
+        self.heaps = {priority: [] for priority in PRIORITY_CLASSES}
+        self.counter = itertools.count()
+
+    def __len__(self):
+        return sum(len(heap) for heap in self.heaps.values())
+
+    def push(self, priority, size, item):
+        heapq.heappush(self.heaps[priority],
+                       (size if size is not None else math.inf, next(self.counter), item))
+
+    def pop(self, priority):
+        return heapq.heappop(self.heaps[priority])[2]
+
+    def pick_class(self, active, free):
+        """Class to serve next given {class: slots in use} and the number of free slots"""
+        best = None
+        best_share = None
+        higher_idle = False
+        busy = any(active.values())
+        for priority in PRIORITY_CLASSES:
+            reserve = 1 if higher_idle and busy else 0
+            if self.heaps[priority] and free > reserve:
+                share = (active[priority] + 1) / self.weights[priority]
+                if best is None or share < best_share:
+                    best, best_share = priority, share
+            if not active[priority] and not self.heaps[priority]:
+                higher_idle = True
+        return best
+
+
+class TransferTicket:
+    """A granted transfer slot; throttle() paces data to the class's bandwidth share"""
+    __slots__ = ('scheduler', 'priority', 'next_send')
+
+    def __init__(self, scheduler, priority):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.next_send = time.monotonic()
+
+    def throttle(self, nbytes):
+        """Account for nbytes sent or received, sleeping if ahead of our share"""
+        rate = self.scheduler.rate_for(self.priority)
+        if not rate:
+            return
+        now = time.monotonic()
+        self.next_send = max(self.next_send, now) + nbytes / rate
+        delay = self.next_send - now
+        if delay > 0.005:
+            time.sleep(delay)
+
+    def release(self):
+        if self.scheduler:
+            self.scheduler._release(self.priority)
+            self.scheduler = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class _Waiter:
+    __slots__ = ('granted', 'cancelled')
+
+    def __init__(self):
+        self.granted = False
+        self.cancelled = False
+
+
+class TransferScheduler:
+    """Admission and bandwidth control for transfers by priority class.
+
+    At most `slots` transfers run at once; waiting transfers are admitted
+    by ClassQueue (weighted fair share between classes, smallest first
+    within a class). With a `bandwidth` limit in bytes/second every busy
+    class gets a share proportional to its weight, split evenly between
+    its running transfers; 0 means unlimited.
+    """
+
+    def __init__(self, slots=TRANSFER_SLOTS, bandwidth=0, weights=TRANSFER_CLASS_WEIGHTS):
+        self.slots = slots
+        self.bandwidth = bandwidth
+        self.weights = weights
+        self.active = {priority: 0 for priority in PRIORITY_CLASSES}
+        self.waiting = ClassQueue(weights)
+        self.cond = threading.Condition()
+
+    def acquire(self, priority, size=None, timeout=None):
+        """Wait for a slot; returns a TransferTicket, or None on timeout"""
+        priority = normalize_priority(priority)
+        waiter = _Waiter()
+        with self.cond:
+            self.waiting.push(priority, size, waiter)
+            self._dispatch()
+            if not self.cond.wait_for(lambda: waiter.granted, timeout):
+                waiter.cancelled = True
+                return None
+        return TransferTicket(self, priority)
+
+    def rate_for(self, priority):
+        """Current bytes/second for one transfer of the given class, or None if unlimited"""
+        if not self.bandwidth:
+            return None
+        with self.cond:
+            total_weight = sum(self.weights[p] for p, count in self.active.items() if count)
+            count = self.active[priority]
+        if not count:
+            return self.bandwidth
+        return self.bandwidth * self.weights[priority] / total_weight / count
+
+    def in_flight(self):
+        with self.cond:
+            return sum(self.active.values())
+
+    def get_state(self):
+        with self.cond:
+            return {
+                'slots': self.slots,
+                'active': dict(self.active),
+                'waiting': {p: len(heap) for p, heap in self.waiting.heaps.items()},
+                'bandwidth': self.bandwidth or None
+            }
+
+    def _release(self, priority):
+        with self.cond:
+            self.active[priority] -= 1
+            self._dispatch()
+
+    def _dispatch(self):
+        # Caller holds self.cond
+        granted = False
+        while True:
+            free = self.slots - sum(self.active.values())
+            priority = self.waiting.pick_class(self.active, free)
+            if priority is None:
+                break
+            waiter = self.waiting.pop(priority)
+            if waiter.cancelled:
+                continue
+            waiter.granted = True
+            self.active[priority] += 1
+            granted = True
+        if granted:
+            self.cond.notify_all()
@@ -0,0 +1,152 @@
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from werkzeug.utils import secure_filename
+from config import SHARED_FILES_DIR, INCOMING_DIR
+from read_ahead import hash_file
+from metrics import observe_hash
+
+
+class _Flight:
+    """One in-flight transfer shared by every caller that asked for it"""
+    __slots__ = ('event', 'result', 'waiters', 'peer_id', 'filename', 'save_path')
+
+    def __init__(self, peer_id, filename, save_path):
+        self.event = threading.Event()
+        self.result = None
+        self.waiters = 0
+        self.peer_id = peer_id
+        self.filename = filename
+        self.save_path = save_path
+
+
+class TransferCoordinator:
+    """Deduplicates concurrent peer downloads (singleflight).
+
+    A request for the same destination file as a transfer in flight, with
+    the same expected content hash (or, without one, from the same peer and
+    filename), joins it and receives its result. A request for the same
+    content hash under another name waits for that transfer and then copies
+    its file, checking the hash again, rather than fetching the data twice.
+    Data is written to a temp file under INCOMING_DIR and
+    renamed into the shared directory atomically, so a partial download
+    is never visible under its final name.
+    """
+
+    def __init__(self, peer_discovery, shared_dir=SHARED_FILES_DIR, incoming_dir=INCOMING_DIR):
+        self.peer_discovery = peer_discovery
+        self.shared_dir = shared_dir
+        self.incoming_dir = incoming_dir
+        self.in_flight = {}  # {key: _Flight}
+        self.lock = threading.Lock()
+        os.makedirs(incoming_dir, exist_ok=True)
+
+    def download(self, peer_id, filename, content_hash=None, progress=None, temp_name=None,
+                 priority=None, size=None):
+        """Download filename from a peer into the shared directory.
+
+        Returns (success, message) like PeerDiscovery.download_file_from_peer.
+        With temp_name the partial file is kept after a failed or aborted
+        transfer and the next call with the same temp_name resumes it.
+        """
+        save_name = secure_filename(filename)
+        if not save_name:
+            return False, "Invalid filename"
+        save_path = os.path.join(self.shared_dir, save_name)
+
+        keys = [('dest', save_path, content_hash or (peer_id, filename))]
+        if content_hash:
+            keys.append(('hash', content_hash))
+
+        with self.lock:
+            flight = next((self.in_flight[k] for k in keys if k in self.in_flight), None)
+            leader = flight is None
+            if leader:
+                flight = _Flight(peer_id, filename, save_path)
+                for key in keys:
+                    self.in_flight[key] = flight
+            else:
+                flight.waiters += 1
+
+        if not leader:
+            logging.info(f"Joining in-flight download of {filename} from {peer_id}")
+            flight.event.wait()
+            if flight.save_path == save_path:
+                return flight.result
+            if not flight.result[0]:  # Another source failed; ours may still work
+                return self.download(peer_id, filename, content_hash, progress, temp_name, priority, size)
+            return self._copy(flight.save_path, save_path, content_hash)
+
+        try:
+            flight.result = self._transfer(peer_id, filename, save_path, content_hash,
+                                           progress, temp_name, priority, size)
+        except Exception as e:
+            logging.error(f"Error downloading {filename} from {peer_id}: {e}")
+            flight.result = (False, str(e))
+        finally:
+            with self.lock:
+                for key in keys:
+                    if self.in_flight.get(key) is flight:
+                        del self.in_flight[key]
+            flight.event.set()
+        return flight.result
+
+    def temp_path(self, temp_name):
+        return os.path.join(self.incoming_dir, f"{temp_name}.part")
+
+    def _transfer(self, peer_id, filename, save_path, content_hash, progress, temp_name,
+                  priority, size):
+        resume = temp_name is not None
+        temp_path = self.temp_path(temp_name or uuid.uuid4().hex)
+        verified = True
+        try:
+            success, message = self.peer_discovery.download_file_from_peer(
+                peer_id, filename, temp_path, progress=progress, resume=resume,
+                priority=priority, size=size, content_hash=content_hash)
+            if not success:
+                return success, message
+
+            if content_hash and self._md5(temp_path) != content_hash:
+                verified = False
+                return False, "Downloaded file does not match the expected hash"
+
+            os.replace(temp_path, save_path)
+            return True, message
+        finally:
+            if (not resume or not verified) and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _copy(self, source_path, save_path, content_hash):
+        """Copy a file another transfer just fetched to save_path, if it still has content_hash"""
+        temp_path = self.temp_path(uuid.uuid4().hex)
+        try:
+            shutil.copyfile(source_path, temp_path)
+            if self._md5(temp_path) != content_hash:
+                return False, "Downloaded file does not match the expected hash"
+            os.replace(temp_path, save_path)
+            return True, f"Copied from {os.path.basename(source_path)}"
+        except OSError as e:
+            return False, str(e)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _md5(self, path):
+        started = time.perf_counter()
+        digest = hashlib.md5()
+        size = hash_file(path, digest)
+        observe_hash(size, time.perf_counter() - started)
+        return digest.hexdigest()
+
+    def get_in_flight(self):
+        """Transfers currently running, with the number of callers waiting on each"""
+        with self.lock:
+            flights = {}
+            for key, flight in self.in_flight.items():
+                if key[0] == 'dest':
+                    flights[f"{flight.peer_id}/{flight.filename}"] = flight.waiters
+            return flights
@@ -0,0 +1,294 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from config import (INCOMING_DIR, UPLOAD_BLOCK_SIZE, UPLOAD_CHUNK_SIZE, UPLOAD_CHUNK_SIZE_MIN,
+                    UPLOAD_CHUNK_SIZE_MAX, UPLOAD_SESSION_TTL, MAX_STREAM_UPLOAD_SIZE)
+from read_ahead import hash_file
+
+UPLOAD_ID = re.compile(r'[0-9a-f]{32}')
+
+
+def checksum_of(digests):
+    """Session checksum: SHA-256 over the concatenated SHA-256 digests of every chunk"""
+    return hashlib.sha256(b''.join(bytes.fromhex(d) for d in digests)).hexdigest()
+
+
+class UploadSession:
+    """One resumable upload: a preallocated data file and per-chunk digests"""
+    __slots__ = ('upload_id', 'filename', 'size', 'chunk_size', 'chunk_count', 'digests',
+                 'created_at', 'updated_at', 'lock')
+
+    def __init__(self, upload_id, filename, size, chunk_size, digests=None, created_at=None,
+                 updated_at=None):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.size = size
+        self.chunk_size = chunk_size
+        self.chunk_count = max(1, -(-size // chunk_size))
+        self.digests = digests or [None] * self.chunk_count  # SHA-256 hex per received chunk
+        self.created_at = created_at or time.time()
+        self.updated_at = updated_at or self.created_at
+        self.lock = threading.Lock()
+
+    def chunk_range(self, index):
+        start = index * self.chunk_size
+        return start, min(self.size, start + self.chunk_size) - start
+
+    def received(self):
+        return [i for i, digest in enumerate(self.digests) if digest is not None]
+
+    def to_dict(self):
+        received = self.received()
+        return {
+            'upload_id': self.upload_id,
+            'filename': self.filename,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'chunk_count': self.chunk_count,
+            'received': received,
+            'bytes_received': sum(self.chunk_range(i)[1] for i in received),
+            'complete': len(received) == self.chunk_count,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+
+    def to_state(self):
+        return {
+            'filename': self.filename,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'digests': self.digests,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+
+
+class UploadSessions:
+    """Resumable chunked uploads.
+
+    A session preallocates its file under INCOMING_DIR; chunks arrive in
+    any order, possibly in parallel, and are written in place with pwrite
+    while their SHA-256 is computed. Session state (the digest of every
+    received chunk) sits next to the data file as JSON, so sessions
+    survive a restart and clients can ask which chunks are still missing.
+    Finalizing checks the client's checksum over the chunk digests and
+    renames the file into the shared directory.
+
+    Chunks of one session may be handled by different HTTP worker
+    processes, so each state change holds an flock on the data file and
+    starts from the state on disk.
+
+    Bad requests raise ValueError, unknown sessions raise LookupError.
+    """
+
+    def __init__(self, file_manager, incoming_dir=INCOMING_DIR, ttl=UPLOAD_SESSION_TTL):
+        self.file_manager = file_manager
+        self.incoming_dir = incoming_dir
+        self.ttl = ttl
+        self.sessions = {}  # {upload_id: UploadSession}, loaded from disk on demand
+        self.lock = threading.Lock()
+        os.makedirs(incoming_dir, exist_ok=True)
+
+    def create(self, filename, size, chunk_size=None):
+        """Start a session for `size` bytes and preallocate its file"""
+        if not self.file_manager.is_allowed_file(filename):
+            raise ValueError("File type not allowed")
+        size = int(size)
+        if size < 0:
+            raise ValueError("Invalid size")
+        if MAX_STREAM_UPLOAD_SIZE and size > MAX_STREAM_UPLOAD_SIZE:
+            raise ValueError(f"File too large. Maximum size is {MAX_STREAM_UPLOAD_SIZE // (1024*1024)}MB")
+        chunk_size = min(max(int(chunk_size or UPLOAD_CHUNK_SIZE), UPLOAD_CHUNK_SIZE_MIN), UPLOAD_CHUNK_SIZE_MAX)
+
+        self.expire()
+        if size > shutil.disk_usage(self.incoming_dir).free:
+            raise OSError("Not enough disk space for this file")
+
+        session = UploadSession(uuid.uuid4().hex, filename, size, chunk_size)
+        data_path = self._data_path(session.upload_id)
+        with open(data_path, 'wb') as f:
+            if size and hasattr(os, 'posix_fallocate'):
+                os.posix_fallocate(f.fileno(), 0, size)
+            else:
+                f.truncate(size)
+        self._save(session)
+        with self.lock:
+            self.sessions[session.upload_id] = session
+        return session.to_dict()
+
+    def status(self, upload_id):
+        session = self._get(upload_id)
+        with self._locked(session):
+            return session.to_dict()
+
+    def put_chunk(self, upload_id, index, stream, length=None, expected_digest=None):
+        """Write chunk `index` from a byte stream at its offset in the session file"""
+        session = self._get(upload_id)
+        if not 0 <= index < session.chunk_count:
+            raise ValueError(f"Chunk index out of range (0-{session.chunk_count - 1})")
+        offset, expected = session.chunk_range(index)
+        if length is not None and length != expected:
+            raise ValueError(f"Chunk {index} must be {expected} bytes, got {length}")
+
+        with self._locked(session):
+            if session.digests[index] is not None:
+                # Rewriting a received chunk: it is missing until the new data checks out
+                session.digests[index] = None
+                self._save(session)
+
+        digest = hashlib.sha256()
+        received = 0
+        try:
+            fd = os.open(self._data_path(upload_id), os.O_WRONLY)
+        except FileNotFoundError:
+            raise LookupError("Upload not found")
+        try:
+            while True:
+                block = stream.read(UPLOAD_BLOCK_SIZE)
+                if not block:
+                    break
+                if received + len(block) > expected:
+                    received += len(block)
+                    break
+                digest.update(block)
+                view = memoryview(block)
+                while view:
+                    written = os.pwrite(fd, view, offset + received)
+                    view = view[written:]
+                    received += written
+        finally:
+            os.close(fd)
+
+        chunk_digest = digest.hexdigest()
+        error = None
+        if received != expected:
+            error = f"Chunk {index} must be {expected} bytes, received {received}"
+        elif expected_digest and expected_digest.lower() != chunk_digest:
+            error = f"Checksum mismatch for chunk {index}"
+
+        with self._locked(session):
+            if self.sessions.get(upload_id) is not session:
+                raise LookupError("Upload was finalized or aborted")
+            session.digests[index] = None if error else chunk_digest
+            session.updated_at = time.time()
+            self._save(session)
+            if error:
+                raise ValueError(error)
+            return session.to_dict()
+
+    def finalize(self, upload_id, checksum):
+        """Verify a complete session against `checksum` and move it into the shared directory"""
+        session = self._get(upload_id)
+        with self._locked(session):
+            missing = session.chunk_count - len(session.received())
+            if missing:
+                raise ValueError(f"{missing} chunks still missing")
+            if not checksum or checksum.lower() != checksum_of(session.digests):
+                raise ValueError("Checksum mismatch")
+
+            # One sequential pass for the MD5 the file index uses
+            data_path = self._data_path(upload_id)
+            hash_md5 = hashlib.md5()
+            hash_file(data_path, hash_md5)
+
+            file_path = os.path.join(self.file_manager.shared_dir, session.filename)
+            os.replace(data_path, file_path)
+            self.file_manager.remember_hash(file_path, hash_md5.hexdigest())
+            self._discard(session)
+        logging.info(f"Upload {upload_id} finalized as {session.filename} ({session.size} bytes)")
+        return {'filename': session.filename, 'size': session.size, 'hash': hash_md5.hexdigest()}
+
+    def abort(self, upload_id):
+        session = self._get(upload_id)
+        with self._locked(session):
+            self._discard(session)
+
+    def expire(self):
+        """Discard sessions idle for longer than the TTL"""
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.incoming_dir):
+            upload_id, ext = os.path.splitext(name)
+            if ext != '.session':
+                continue
+            try:
+                if os.path.getmtime(os.path.join(self.incoming_dir, name)) < cutoff:
+                    self.abort(upload_id)
+            except (OSError, LookupError):
+                pass
+
+    # ------------------------------------------------------------------
+    # Internals
+    # ------------------------------------------------------------------
+
+    def _data_path(self, upload_id):
+        return os.path.join(self.incoming_dir, f"{upload_id}.chunks")
+
+    def _state_path(self, upload_id):
+        return os.path.join(self.incoming_dir, f"{upload_id}.session")
+
+    def _get(self, upload_id):
+        if not UPLOAD_ID.fullmatch(upload_id or ''):
+            raise LookupError("Upload not found")
+        with self.lock:
+            session = self.sessions.get(upload_id)
+            if session is not None:
+                return session
+            try:
+                with open(self._state_path(upload_id)) as f:
+                    state = json.load(f)
+            except (OSError, ValueError):
+                raise LookupError("Upload not found")
+            session = self.sessions[upload_id] = UploadSession(upload_id, **state)
+            return session
+
+    @contextmanager
+    def _locked(self, session):
+        """Hold the session against other threads and processes, with its state reloaded"""
+        with session.lock:
+            try:
+                fd = os.open(self._data_path(session.upload_id), os.O_RDONLY)
+            except FileNotFoundError:
+                self._forget(session)
+                raise LookupError("Upload was finalized or aborted")
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)  # Released when fd is closed
+                try:
+                    with open(self._state_path(session.upload_id)) as f:
+                        state = json.load(f)
+                except FileNotFoundError:
+                    self._forget(session)
+                    raise LookupError("Upload was finalized or aborted")
+                session.digests = state['digests']
+                session.updated_at = state['updated_at']
+                yield
+            finally:
+                os.close(fd)
+
+    def _save(self, session):
+        # Caller holds _locked(session) (or owns a new session)
+        state_path = self._state_path(session.upload_id)
+        temp_path = state_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(session.to_state(), f)
+        os.replace(temp_path, state_path)
+
+    def _forget(self, session):
+        with self.lock:
+            if self.sessions.get(session.upload_id) is session:
+                del self.sessions[session.upload_id]
+
+    def _discard(self, session):
+        self._forget(session)
+        for path in (self._data_path(session.upload_id), self._state_path(session.upload_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Precompress the web interface's static files for P2P File Sharing
+
+Writes a .gz (and, with the brotli package installed, a .br) copy next to
+every HTML, JS and CSS file of the frontend and of the backend's static
+directory, at maximum compression. The servers send a copy when the client
+accepts its encoding and it is at least as new as the file; files that
+haven't changed since the last build are skipped.
+"""
+import gzip
+import os
+import sys
+
+try:
+    import brotli
+except ImportError:  # Optional; gzip copies are always written
+    brotli = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_DIRS = (os.path.join(ROOT, 'frontend'), os.path.join(ROOT, 'backend', 'static'))
+EXTENSIONS = ('.html', '.js', '.css', '.svg', '.json')
+MIN_SIZE = 256  # Smaller files are served as they are
+
+COMPRESSORS = {'.gz': lambda data: gzip.compress(data, 9, mtime=0)}
+if brotli:
+    COMPRESSORS['.br'] = lambda data: brotli.compress(data, quality=11)
+
+
+def precompress(directory, clean=False):
+    """Write compressed copies of changed files under `directory`; returns the number written"""
+    written = 0
+    for dirpath, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if filename.endswith(('.gz', '.br')):
+                if clean:
+                    os.remove(path)
+                continue
+            if clean or not filename.endswith(EXTENSIONS):
+                continue
+            stat = os.stat(path)
+            if stat.st_size < MIN_SIZE:
+                continue
+            data = None
+            for suffix, compress in COMPRESSORS.items():
+                target = path + suffix
+                if os.path.exists(target) and os.stat(target).st_mtime_ns == stat.st_mtime_ns:
+                    continue
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                with open(target, 'wb') as f:
+                    f.write(compress(data))
+                # Same mtime as the source: servers treat an older copy as stale
+                os.utime(target, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+                written += 1
+    return written
+
+
+if __name__ == '__main__':
+    clean = '--clean' in sys.argv[1:]
+    for directory in STATIC_DIRS:
+        count = precompress(directory, clean)
+        if not clean:
+            print(f"📦 {os.path.relpath(directory, ROOT)}: {count} files compressed")
+    if not brotli and not clean:
+        print("💡 Install brotli to also write .br copies")
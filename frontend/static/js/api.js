@@ -2,6 +2,46 @@
  * API Client for P2P File Sharing Backend
  */
 
+// Files at least this large are sent as resumable chunked uploads
+const RESUMABLE_UPLOAD_THRESHOLD = 16 * 1024 * 1024;
+const UPLOAD_PARALLEL_CHUNKS = 4;
+const UPLOAD_CHUNK_RETRIES = 8;
+
+// Chunk digests need WebCrypto, which browsers only offer in secure contexts (https or localhost);
+// on plain http large files are streamed in one request instead
+const RESUMABLE_UPLOADS_SUPPORTED = typeof crypto !== 'undefined' && !!crypto.subtle;
+
+// Hashes blobs in a Web Worker so large uploads don't block the page
+class ChunkHasher {
+    constructor() {
+        this.worker = new Worker('static/js/upload-worker.js');
+        this.pending = new Map();
+        this.nextId = 0;
+        this.worker.onmessage = (event) => {
+            const { id, digest, error } = event.data;
+            const { resolve, reject } = this.pending.get(id);
+            this.pending.delete(id);
+            error ? reject(new Error(error)) : resolve(digest);
+        };
+    }
+
+    digest(blob) {
+        const id = this.nextId++;
+        return new Promise((resolve, reject) => {
+            this.pending.set(id, { resolve, reject });
+            this.worker.postMessage({ id, blob });
+        });
+    }
+
+    terminate() {
+        this.worker.terminate();
+    }
+}
+
+function hexToBytes(hex) {
+    return new Uint8Array(hex.match(/../g).map(byte => parseInt(byte, 16)));
+}
+
 class APIClient {
     constructor(baseUrl = 'http://localhost:5000') {
         this.baseUrl = baseUrl;
@@ -53,8 +93,9 @@ class APIClient {
     }
 
     async uploadFile(file, onProgress = null) {
-        const formData = new FormData();
-        formData.append('file', file);
+        if (file.size >= RESUMABLE_UPLOAD_THRESHOLD && RESUMABLE_UPLOADS_SUPPORTED) {
+            return this.uploadResumable(file, onProgress);
+        }
 
         try {
             const xhr = new XMLHttpRequest();
@@ -71,7 +112,13 @@ class APIClient {
                     if (xhr.status >= 200 && xhr.status < 300) {
                         resolve(JSON.parse(xhr.responseText));
                     } else {
-                        reject(new Error(`Upload failed: ${xhr.status}`));
+                        let message = `Upload failed: ${xhr.status}`;
+                        try {
+                            message = JSON.parse(xhr.responseText).message || message;
+                        } catch (e) {
+                            // Not a JSON error body
+                        }
+                        reject(new Error(message));
                     }
                 });
 
@@ -79,8 +126,10 @@ class APIClient {
                     reject(new Error('Upload failed'));
                 });
 
-                xhr.open('POST', `${this.baseUrl}/api/files/upload`);
-                xhr.send(formData);
+                // Send the raw file as the body; the server streams it to disk
+                xhr.open('PUT', `${this.baseUrl}/api/files/upload/${encodeURIComponent(file.name)}`);
+                xhr.setRequestHeader('Content-Type', 'application/octet-stream');
+                xhr.send(file);
             });
         } catch (error) {
             console.error('File upload failed:', error);
@@ -88,6 +137,114 @@ class APIClient {
         }
     }
 
+    // Resumable upload: parallel chunks, retried on failure, resumed after a reload
+    async uploadResumable(file, onProgress = null) {
+        const key = `upload:${file.name}:${file.size}:${file.lastModified}`;
+        let upload = null;
+
+        // Continue an unfinished session for the same file if the server still has it
+        const savedId = localStorage.getItem(key);
+        if (savedId) {
+            try {
+                upload = (await this.request(`/api/uploads/${savedId}`)).upload;
+            } catch (error) {
+                localStorage.removeItem(key);
+            }
+        }
+        if (!upload) {
+            upload = (await this.request('/api/uploads', {
+                method: 'POST',
+                body: JSON.stringify({ filename: file.name, size: file.size })
+            })).upload;
+            localStorage.setItem(key, upload.upload_id);
+        }
+
+        const chunkBlob = (index) => file.slice(index * upload.chunk_size, (index + 1) * upload.chunk_size);
+        const received = new Set(upload.received);
+        const sent = new Array(upload.chunk_count).fill(0);
+        const digests = new Array(upload.chunk_count);
+        received.forEach(index => { sent[index] = chunkBlob(index).size; });
+
+        const report = () => {
+            if (onProgress) {
+                const total = sent.reduce((sum, n) => sum + n, 0);
+                onProgress(file.size ? (total / file.size) * 100 : 100);
+            }
+        };
+        report();
+
+        const hasher = new ChunkHasher();
+        const queue = [...Array(upload.chunk_count).keys()];
+        const runner = async () => {
+            while (queue.length) {
+                const index = queue.shift();
+                const blob = chunkBlob(index);
+                digests[index] = await hasher.digest(blob);
+                if (received.has(index)) continue;
+
+                for (let attempt = 0; ; attempt++) {
+                    try {
+                        await this.putChunk(upload.upload_id, index, blob, digests[index], (loaded) => {
+                            sent[index] = loaded;
+                            report();
+                        });
+                        sent[index] = blob.size;
+                        report();
+                        break;
+                    } catch (error) {
+                        sent[index] = 0;
+                        if (error.status === 404 || attempt >= UPLOAD_CHUNK_RETRIES) {
+                            throw error;
+                        }
+                        await new Promise(resolve => setTimeout(resolve, Math.min(1000 * 2 ** attempt, 30000)));
+                    }
+                }
+            }
+        };
+
+        try {
+            await Promise.all(Array.from({ length: UPLOAD_PARALLEL_CHUNKS }, runner));
+
+            const joined = new Uint8Array(digests.length * 32);
+            digests.forEach((digest, index) => joined.set(hexToBytes(digest), index * 32));
+            const checksum = await hasher.digest(new Blob([joined]));
+
+            const result = await this.request(`/api/uploads/${upload.upload_id}/complete`, {
+                method: 'POST',
+                body: JSON.stringify({ checksum })
+            });
+            localStorage.removeItem(key);
+            return result;
+        } finally {
+            hasher.terminate();
+        }
+    }
+
+    putChunk(uploadId, index, blob, digest, onProgress) {
+        return new Promise((resolve, reject) => {
+            const xhr = new XMLHttpRequest();
+            xhr.upload.addEventListener('progress', (e) => onProgress(e.loaded));
+            xhr.addEventListener('load', () => {
+                if (xhr.status >= 200 && xhr.status < 300) {
+                    resolve(JSON.parse(xhr.responseText));
+                } else {
+                    let message = `Chunk ${index} failed: ${xhr.status}`;
+                    try {
+                        message = JSON.parse(xhr.responseText).message || message;
+                    } catch (e) {
+                        // Not a JSON error body
+                    }
+                    reject(Object.assign(new Error(message), { status: xhr.status }));
+                }
+            });
+            xhr.addEventListener('error', () => reject(new Error(`Chunk ${index} failed: network error`)));
+            xhr.open('PUT', `${this.baseUrl}/api/uploads/${uploadId}/chunks/${index}`);
+            xhr.setRequestHeader('Content-Type', 'application/octet-stream');
+            xhr.setRequestHeader('X-Chunk-SHA256', digest);
+            xhr.send(blob);
+        });
+    }
+
     async downloadFile(filename) {
         const url = `${this.baseUrl}/api/files/download/${encodeURIComponent(filename)}`;
         window.open(url, '_blank');
@@ -127,26 +284,60 @@ class APIClient {
         return this.request(`/api/peers/${encodeURIComponent(peerId)}/files`);
     }
 
-    async downloadFromPeer(peerId, filename) {
+    async downloadFromPeer(peerId, filename, priority = null) {
         return this.request('/api/peers/download', {
             method: 'POST',
             body: JSON.stringify({
                 peer_id: peerId,
-                filename: filename
+                filename: filename,
+                priority: priority
             })
         });
     }
 
+    async setPeerPriority(peerId, priority) {
+        return this.request(`/api/peers/${encodeURIComponent(peerId)}/priority`, {
+            method: 'POST',
+            body: JSON.stringify({ priority: priority })
+        });
+    }
+
+    // Download job endpoints
+    async getJobs(state = null) {
+        return this.request(state ? `/api/jobs?state=${encodeURIComponent(state)}` : '/api/jobs');
+    }
+
+    async getJob(jobId) {
+        return this.request(`/api/jobs/${encodeURIComponent(jobId)}`);
+    }
+
+    async controlJob(jobId, action, body = {}) {
+        return this.request(`/api/jobs/${encodeURIComponent(jobId)}/${action}`, {
+            method: 'POST',
+            body: JSON.stringify(body)
+        });
+    }
+
     async refreshPeers() {
         return this.request('/api/peers/refresh', {
             method: 'POST'
         });
     }
 
+    // Search endpoint
+    async search(query, limit = 50) {
+        return this.request(`/api/search?q=${encodeURIComponent(query)}&limit=${limit}`);
+    }
+
     // Stats endpoint
     async getStats() {
         return this.request('/api/stats');
     }
+
+    // Server-Sent Events stream of file, peer and job changes
+    subscribeEvents() {
+        return new EventSource(`${this.baseUrl}/api/events`);
+    }
 }
 
 // Create global API client instance
@@ -255,6 +255,21 @@ async function loadPeersPage() {
                 </div>
             </div>
             
+            <!-- Network Search -->
+            <div class="row mb-4">
+                <div class="col-12">
+                    <div class="input-group">
+                        <input type="text" class="form-control" id="networkSearchInput"
+                               placeholder="Search files on all peers (e.g. report ext:pdf size>1mb)"
+                               onkeydown="if (event.key === 'Enter') searchNetwork()">
+                        <button class="btn btn-primary" onclick="searchNetwork()">
+                            <i class="bi bi-search"></i> Search
+                        </button>
+                    </div>
+                    <div id="networkSearchResults" class="mt-3"></div>
+                </div>
+            </div>
+            
             ${peersList.length > 0 ? `
                 <div class="row">
                     ${peersList.map(([peerId, peer]) => `
@@ -429,3 +444,68 @@ async function viewPeerFiles(peerId) {
         showToast('Error', 'Failed to get peer files: ' + error.message, 'error');
     }
 }
+
+// Search local and cached peer catalogs
+async function searchNetwork() {
+    const query = document.getElementById('networkSearchInput').value.trim();
+    const resultsDiv = document.getElementById('networkSearchResults');
+    
+    if (!query) {
+        resultsDiv.innerHTML = '';
+        return;
+    }
+    
+    try {
+        const response = await api.search(query);
+        if (!response.success) {
+            showError(resultsDiv, response.message);
+            return;
+        }
+        
+        if (response.hits.length === 0) {
+            resultsDiv.innerHTML = `<div class="text-muted">No files match "${query}"</div>`;
+            return;
+        }
+        
+        resultsDiv.innerHTML = `
+            <div class="table-responsive">
+                <table class="table table-dark table-striped">
+                    <thead>
+                        <tr>
+                            <th>Name</th>
+                            <th>Size</th>
+                            <th>Available From</th>
+                        </tr>
+                    </thead>
+                    <tbody>
+                        ${response.hits.map(hit => `
+                            <tr>
+                                <td>
+                                    <i class="bi ${getFileIcon(hit.extension)} me-2"></i>
+                                    ${hit.name}
+                                </td>
+                                <td>${formatFileSize(hit.size)}</td>
+                                <td>
+                                    ${hit.locations.map(location => location === 'local' ? `
+                                        <button class="btn btn-outline-primary btn-sm me-1 mb-1"
+                                                onclick="downloadFileLocal('${hit.name}')">
+                                            <i class="bi bi-hdd"></i> Local
+                                        </button>
+                                    ` : `
+                                        <button class="btn btn-primary btn-sm me-1 mb-1"
+                                                onclick="downloadFromPeer('${location}', '${hit.name}')">
+                                            <i class="bi bi-download"></i> ${location}
+                                        </button>
+                                    `).join('')}
+                                </td>
+                            </tr>
+                        `).join('')}
+                    </tbody>
+                </table>
+            </div>
+            <small class="text-muted">${response.count} results in ${response.took_ms} ms</small>
+        `;
+    } catch (error) {
+        showError(resultsDiv, 'Search failed: ' + error.message);
+    }
+}
@@ -0,0 +1,18 @@
+/**
+ * Web Worker that hashes upload chunks off the main thread.
+ * Receives {id, blob} and replies {id, digest} with the chunk's SHA-256 in hex.
+ */
+
+self.onmessage = async (event) => {
+    const { id, blob } = event.data;
+    try {
+        if (!self.crypto || !self.crypto.subtle) {
+            throw new Error('Chunk hashing needs a secure context (https or localhost)');
+        }
+        const hash = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+        const digest = Array.from(new Uint8Array(hash), b => b.toString(16).padStart(2, '0')).join('');
+        self.postMessage({ id, digest });
+    } catch (error) {
+        self.postMessage({ id, error: error.message });
+    }
+};
@@ -1,30 +1,101 @@
 #!/usr/bin/env python3
 """
 Start script for the P2P File Sharing Frontend
-Simple HTTP server to serve static files
+Simple HTTP server to serve static files, precompressed where possible
 """
 import os
+import email.utils
 import http.server
-import socketserver
+import mimetypes
 import webbrowser
 import threading
 import time
+from build_static import precompress
+
+CACHE_CONTROL = 'no-cache'  # Browsers keep the files but revalidate them; unchanged files get 304
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}  # Preferred first
+
+
+def accepted_encodings(header):
+    """Content codings an Accept-Encoding header allows (q > 0)"""
+    accepted = set()
+    for item in (header or '').split(','):
+        coding, _, params = item.partition(';')
+        params = params.strip()
+        quality = params[2:] if params.startswith('q=') else '1'
+        try:
+            if float(quality) > 0:
+                accepted.add(coding.strip().lower())
+        except ValueError:
+            pass
+    return accepted
+
+
+class FrontendHandler(http.server.SimpleHTTPRequestHandler):
+    """Serves each file with an ETag and Cache-Control, and the client's best precompressed copy.
+
+    The ETag is derived from the file's mtime and size plus the encoding
+    sent, so a matching If-None-Match gets 304 without reading the file.
+    """
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and self.path.split('?')[0].endswith('/'):
+            path = os.path.join(path, 'index.html')
+        if not os.path.isfile(path):
+            return super().send_head()
+
+        stat = os.stat(path)
+        served, encoding = path, None
+        accepted = accepted_encodings(self.headers.get('Accept-Encoding'))
+        variants = [(coding, path + suffix) for coding, suffix in ENCODINGS.items()
+                    if os.path.exists(path + suffix)]
+        for coding, candidate in variants:
+            if (coding in accepted or '*' in accepted) and os.stat(candidate).st_mtime_ns >= stat.st_mtime_ns:
+                served, encoding = candidate, coding
+                break
+
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}{"-" + encoding if encoding else ""}"'
+        headers = {
+            'ETag': etag,
+            'Last-Modified': email.utils.formatdate(stat.st_mtime, usegmt=True),
+            'Cache-Control': CACHE_CONTROL
+        }
+        if variants:
+            headers['Vary'] = 'Accept-Encoding'
+
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match and (if_none_match.strip() == '*' or
+                              etag in [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]):
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return None
+
+        f = open(served, 'rb')
+        self.send_response(200)
+        self.send_header('Content-Type', mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        self.send_header('Content-Length', str(os.fstat(f.fileno()).st_size))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        return f
+
 
 def start_server():
     # Change to frontend directory
     frontend_dir = os.path.join(os.path.dirname(__file__), 'frontend')
+    
+    # Precompress anything changed since the last build
+    precompress(frontend_dir)
     os.chdir(frontend_dir)
     
     PORT = 3000
     
-    class MyHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
-        def end_headers(self):
-            self.send_header('Cache-Control', 'no-store, no-cache, must-revalidate')
-            super().end_headers()
-    
-    Handler = MyHTTPRequestHandler
-    
-    with socketserver.TCPServer(("", PORT), Handler) as httpd:
+    with http.server.ThreadingHTTPServer(("", PORT), FrontendHandler) as httpd:
         print("🌐 Starting P2P File Sharing Frontend...")
         print(f"📱 Frontend Server: http://localhost:{PORT}")
         print("🔗 Make sure Backend API is running on http://localhost:5000")
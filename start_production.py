@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Start the P2P File Sharing Backend for production: one supervisor process
+and a pool of gunicorn HTTP workers.
+
+The supervisor (this process) runs the TCP file server, DHT, health checks,
+download jobs, file watcher and statistics, and serves them to the workers
+over a Unix socket. The workers are stateless: they read files, hashes and
+jobs from the shared directory and databases and ask the supervisor for the
+rest, so any number of them can serve the API side by side.
+"""
+import os
+import signal
+import subprocess
+import sys
+
+# Add backend directory to Python path
+backend_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+sys.path.insert(0, backend_dir)
+
+# Change working directory to backend
+os.chdir(backend_dir)
+
+# Importing the app in the supervisor role starts the services and control socket
+os.environ['P2P_ROLE'] = 'supervisor'
+from app import app
+from config import FLASK_HOST, FLASK_PORT, HTTP_WORKERS, HTTP_WORKER_THREADS, CONTROL_SOCKET
+
+
+def main():
+    print("🚀 Starting P2P File Sharing Backend (production)...")
+    print(f"📡 API Server: http://localhost:{FLASK_PORT} ({HTTP_WORKERS} workers)")
+    print("🔌 TCP Server: localhost:8000")
+    print()
+
+    # gthread workers, so open /api/events streams don't each hold a process
+    workers = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn',
+        '--workers', str(HTTP_WORKERS),
+        '--worker-class', 'gthread',
+        '--threads', str(HTTP_WORKER_THREADS),
+        '--bind', f'{FLASK_HOST}:{FLASK_PORT}',
+        'app:app'
+    ], env={**os.environ, 'P2P_ROLE': 'worker', 'P2P_CONTROL_SOCKET': CONTROL_SOCKET})
+
+    def stop(sig, frame):
+        # gunicorn stops its workers gracefully; the wait below then returns
+        print("\n🛑 Shutting down...")
+        workers.terminate()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # The workers can't serve without the supervisor, nor the other way round
+    sys.exit(workers.wait())
+
+
+if __name__ == '__main__':
+    main()